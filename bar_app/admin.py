@@ -1,10 +1,45 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Q
+from django.utils import timezone
 from .models import (
     User, Student, Teacher, Staff,
     Category, Product, Order, OrderItem,
-    Transaction, StockMovement
+    Transaction, StockMovement, Job, RestockAlert, ApiToken, SpendingCounter,
+    PaymentReference
 )
+from . import alerts
+from .paginators import EstimatedCountPaginator
+
+
+class LargeTableAdminMixin:
+    """
+    Changelists de tabelas grandes: contagem estimada, sem contagem total
+    e pesquisa exata (sensível a maiúsculas) que usa os índices da base de dados.
+    Os campos em `search_fields` com prefixo '=' são procurados com igualdade simples.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        exact_fields = [field[1:] for field in self.search_fields if field.startswith('=')]
+        search_term = search_term.strip()
+        if not search_term or len(exact_fields) != len(self.search_fields):
+            return super().get_search_results(request, queryset, search_term)
+
+        condition = Q()
+        for field in exact_fields:
+            condition |= Q(**{field: search_term})
+        return queryset.filter(condition), False
+
+
+class SpendingCounterInline(admin.StackedInline):
+    """Limite diário editável; os gastos são mantidos por bar_app.spending"""
+    model = SpendingCounter
+    can_delete = False
+    fields = ['daily_limit', 'day', 'daily_spent', 'month', 'monthly_spent', 'lifetime_spent', 'order_count']
+    readonly_fields = ['day', 'daily_spent', 'month', 'monthly_spent', 'lifetime_spent', 'order_count']
 
 
 @admin.register(User)
@@ -18,6 +53,7 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('user_type', 'phone', 'photo', 'balance')
         }),
     )
+    inlines = [SpendingCounterInline]
 
 
 @admin.register(Student)
@@ -55,34 +91,111 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     list_editable = ['price', 'is_available']
 
+    def save_model(self, request, obj, form, change):
+        """Alterações de stock feitas no admin ficam registadas como movimento de ajuste"""
+        previous_stock = Product.objects.filter(pk=obj.pk).values_list('stock', flat=True).first() if change else 0
+        super().save_model(request, obj, form, change)
+
+        alerts.track_change(obj, previous_stock or 0, 'admin')
+
+        delta = obj.stock - (previous_stock or 0)
+        if delta:
+            StockMovement.objects.create(
+                product=obj,
+                movement_type='adjustment',
+                quantity=delta,
+                reason='Ajuste manual no admin' if change else 'Stock inicial',
+                created_by=request.user,
+            )
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['subtotal']
+    autocomplete_fields = ['product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['order_number', 'user', 'status', 'payment_method', 'total_amount', 'scheduled_date', 'scheduled_time', 'is_priority']
     list_filter = ['status', 'payment_method', 'is_priority', 'scheduled_date']
-    search_fields = ['order_number', 'user__username', 'user__first_name', 'user__last_name']
-    readonly_fields = ['order_number', 'total_amount', 'is_priority']
+    list_select_related = ['user']
+    search_fields = ['=order_number', '=user__username']
+    # O estado muda só pela gestão de pedidos (máquina de estados com verificação de versão)
+    readonly_fields = ['order_number', 'status', 'version', 'total_amount', 'is_priority']
+    autocomplete_fields = ['user']
     inlines = [OrderItemInline]
-    date_hierarchy = 'scheduled_date'
+    ordering = ['-created_at']
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'transaction_type', 'amount', 'description', 'created_at']
     list_filter = ['transaction_type', 'created_at']
-    search_fields = ['user__username', 'description']
-    date_hierarchy = 'created_at'
+    list_select_related = ['user']
+    search_fields = ['=user__username', '=order__order_number']
+    autocomplete_fields = ['user', 'order']
 
 
 @admin.register(StockMovement)
-class StockMovementAdmin(admin.ModelAdmin):
+class StockMovementAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['product', 'movement_type', 'quantity', 'reason', 'created_by', 'created_at']
     list_filter = ['movement_type', 'created_at']
-    search_fields = ['product__name', 'reason']
-    date_hierarchy = 'created_at'
\ No newline at end of file
+    list_select_related = ['product', 'created_by']
+    search_fields = ['=product__name', '=order__order_number']
+    autocomplete_fields = ['product', 'order', 'created_by']
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['id', 'task', 'queue', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'queue', 'task']
+    search_fields = ['=idempotency_key']
+    readonly_fields = ['locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at']
+    ordering = ['-id']
+    actions = ['retry_jobs']
+    
+    @admin.action(description='Repetir tarefas selecionadas')
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='pending', attempts=0, run_at=timezone.now(), locked_by='', locked_at=None,
+        )
+        self.message_user(request, f'{updated} tarefas voltaram à fila.')
+
+
+@admin.register(RestockAlert)
+class RestockAlertAdmin(admin.ModelAdmin):
+    list_display = ['product', 'stock', 'min_stock', 'source', 'created_at', 'resolved_at', 'notified_at']
+    list_filter = ['source', 'created_at']
+    list_select_related = ['product']
+    autocomplete_fields = ['product']
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    """Os tokens são criados com o comando create_api_token (o token em claro não é guardado)"""
+    list_display = ['name', 'user', 'is_active', 'created_at']
+    list_filter = ['is_active']
+    list_select_related = ['user']
+    search_fields = ['name', 'user__username']
+    readonly_fields = ['user', 'cart', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PaymentReference)
+class PaymentReferenceAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Geradas no checkout/carregamento e liquidadas pelo comando import_multibanco"""
+    list_display = ['entity', 'reference', 'amount', 'purpose', 'user', 'order', 'status', 'expires_at', 'paid_at']
+    list_filter = ['status', 'purpose']
+    list_select_related = ['user', 'order']
+    search_fields = ['=reference', '=user__username', '=order__order_number']
+    readonly_fields = ['entity', 'reference', 'sequence', 'user', 'order', 'purpose', 'amount', 'status', 'expires_at', 'paid_at', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,98 @@
+"""
+Alertas de stock baixo por cruzamento do limite mínimo
+Um alerta é criado quando o stock desce de acima para igual ou abaixo de min_stock
+(não a cada venda) e resolvido quando volta a subir acima do mínimo.
+Os alertas por notificar são enviados ao staff num resumo periódico (comando restock_digest).
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Product, RestockAlert, User
+
+
+def crossed_below(old_stock, new_stock, min_stock):
+    return old_stock > min_stock >= new_stock
+
+
+def crossed_above(old_stock, new_stock, min_stock):
+    return old_stock <= min_stock < new_stock
+
+
+def record_crossings(product_ids, source):
+    """
+    Cria os alertas dos produtos que cruzaram o limite (se ainda estiverem em baixo).
+    Um produto que já tenha um alerta aberto é ignorado pela restrição única.
+    """
+    products = Product.objects.filter(pk__in=product_ids, stock__lte=F('min_stock')).values_list('pk', 'stock', 'min_stock')
+    RestockAlert.objects.bulk_create(
+        [
+            RestockAlert(product_id=pk, stock=stock, min_stock=min_stock, source=source)
+            for pk, stock, min_stock in products
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def resolve(product_ids):
+    """Fecha os alertas abertos dos produtos que já voltaram a ter stock acima do mínimo"""
+    return RestockAlert.objects.filter(
+        product_id__in=product_ids,
+        resolved_at__isnull=True,
+        product__stock__gt=F('product__min_stock'),
+    ).update(resolved_at=timezone.now())
+
+
+def track_change(product, old_stock, source):
+    """Regista um alerta ou resolve-o conforme a alteração de stock de `product` (só consulta a BD se cruzar o limite)"""
+    if crossed_below(old_stock, product.stock, product.min_stock):
+        record_crossings([product.pk], source)
+    elif crossed_above(old_stock, product.stock, product.min_stock):
+        resolve([product.pk])
+
+
+def feed(limit=10):
+    """Alertas mais recentes para o dashboard (os abertos primeiro)"""
+    return (
+        RestockAlert.objects.select_related('product')
+        .order_by(F('resolved_at').desc(nulls_first=True), '-created_at')[:limit]
+    )
+
+
+def digest_recipients():
+    staff_emails = (
+        User.objects.filter(Q(is_staff=True) | Q(user_type__in=['staff', 'admin']), is_active=True)
+        .exclude(email='')
+        .values_list('email', flat=True)
+    )
+    return sorted(set(staff_emails) | set(settings.RESTOCK_ALERT_RECIPIENTS))
+
+
+def send_digest():
+    """
+    Envia um único email com todos os alertas ainda não notificados e marca-os como notificados.
+    Devolve o nº de alertas incluídos (0 se não havia nada a enviar).
+    """
+    with transaction.atomic():
+        alerts = list(
+            RestockAlert.objects.select_for_update()
+            .filter(notified_at__isnull=True)
+            .select_related('product')
+            .order_by('product__name')
+        )
+        recipients = digest_recipients()
+        if not alerts or not recipients:
+            return 0
+
+        context = {'alerts': alerts, 'open_alerts': [alert for alert in alerts if alert.resolved_at is None]}
+        send_mail(
+            subject=f'[Bar Escolar] {len(context["open_alerts"])} produtos com stock baixo' if context['open_alerts'] else '[Bar Escolar] Stock reabastecido',
+            message=render_to_string('bar_app/emails/restock_digest.txt', context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=recipients,
+        )
+        RestockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+    return len(alerts)
@@ -0,0 +1,369 @@
+"""
+API JSON (v1) para quiosques e aplicações móveis
+
+Autenticação por token (cabeçalho "Authorization: Bearer <token>", ver ApiToken e o comando
+create_api_token) ou pela sessão do site; com a sessão, os pedidos que alteram dados têm de
+trazer o token CSRF (cabeçalho X-CSRFToken), tal como os formulários.
+
+Respostas compactas (JSON sem espaços); `?fields=a,b` limita os campos devolvidos e as
+colunas lidas da base de dados. Erros: {"error": mensagem, "reason": motivo}.
+Usa a mesma camada de serviços (bar_app.services) que as views HTML.
+"""
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+
+from . import identity, metrics, services
+from .conditional import conditional_page, catalog_state
+from .forms import OrderForm
+from .models import ApiToken, Order, OrderItem, PaymentReference, Product
+from .views import is_staff_user
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Estado HTTP por motivo de ServiceError (os restantes são 400)
+REASON_STATUS = {
+    'product': 404,
+    'stock': 409,
+    'balance': 409,
+    'limit': 409,
+    'error': 503,
+}
+
+# Campo da API -> caminho no ORM (o que `?fields=` aceita)
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price': 'price',
+    'stock': 'stock',
+    'category_id': 'category_id',
+    'category': 'category__name',
+    'image': 'image',
+}
+PRODUCT_DEFAULT_FIELDS = ('id', 'name', 'price', 'stock', 'category_id')
+
+ORDER_FIELDS = {
+    'id': 'id',
+    'number': 'order_number',
+    'status': 'status',
+    'payment_method': 'payment_method',
+    'total': 'total_amount',
+    'scheduled_date': 'scheduled_date',
+    'scheduled_time': 'scheduled_time',
+    'notes': 'notes',
+    'created_at': 'created_at',
+    'multibanco_entity': 'payment_reference__entity',
+    'multibanco_reference': 'payment_reference__reference',
+    'multibanco_status': 'payment_reference__status',
+}
+ORDER_DEFAULT_FIELDS = ('id', 'number', 'status', 'total', 'scheduled_date', 'scheduled_time')
+
+MAX_ORDERS = 100
+# A chave de idempotência do cliente é guardada como "<prefixo>:<utilizador>:<chave>" (máx. 64 caracteres)
+MAX_IDEMPOTENCY_KEY = 40
+
+_csrf = CsrfViewMiddleware(lambda request: None)
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def _error(message, status=400, reason='invalid'):
+    return _json({'error': message, 'reason': reason}, status=status)
+
+
+def _authenticate(request):
+    """Autentica o pedido; devolve uma resposta de erro ou None"""
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        token = (
+            ApiToken.objects.select_related('user')
+            .filter(key_hash=ApiToken.hash_key(authorization[7:].strip()), is_active=True, user__is_active=True)
+            .first()
+        )
+        if token is None:
+            return _error('Token inválido.', 401, 'auth')
+        request.user = token.user
+        request.api_token = token
+        return None
+
+    if not request.user.is_authenticated:
+        return _error('Autenticação necessária.', 401, 'auth')
+    request.api_token = None
+    # A view é csrf_exempt por causa dos clientes com token; com sessão a verificação é feita aqui
+    if request.method not in SAFE_METHODS and _csrf.process_view(request, None, (), {}) is not None:
+        return _error('Verificação CSRF falhou.', 403, 'csrf')
+    return None
+
+
+def api_view(*methods):
+    """Decorator das views da API: métodos aceites, autenticação e erros em JSON"""
+    def decorator(view_func):
+        @csrf_exempt
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if request.method not in methods:
+                response = _error('Método não permitido.', 405, 'method')
+                response['Allow'] = ', '.join(methods)
+                return response
+            error = _authenticate(request)
+            if error is not None:
+                return error
+            try:
+                return view_func(request, *args, **kwargs)
+            except services.ServiceError as e:
+                return _error(e.message, REASON_STATUS.get(e.reason, 400), e.reason)
+        return _wrapped
+    return decorator
+
+
+def _fields(request, allowed, default):
+    """Campos pedidos em `?fields=`, validados contra `allowed`"""
+    raw = request.GET.get('fields')
+    if not raw:
+        return default
+    fields = tuple(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise services.ServiceError(f'Campos desconhecidos: {", ".join(unknown)}.', 'fields')
+    return fields
+
+
+def _project(queryset, mapping, fields):
+    """Lê só as colunas dos campos pedidos e devolve dicionários com os nomes da API"""
+    return [
+        {field: row[mapping[field]] for field in fields}
+        for row in queryset.values(*(mapping[field] for field in fields))
+    ]
+
+
+def _body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise services.ServiceError('JSON inválido.')
+    if not isinstance(data, dict):
+        raise services.ServiceError('JSON inválido.')
+    return data
+
+
+# ----------------------------------------------------------------------
+# Catálogo
+# ----------------------------------------------------------------------
+
+@api_view('GET')
+@conditional_page(catalog_state)
+def products(request):
+    """Produtos disponíveis; ?category=<id> filtra por categoria"""
+    fields = _fields(request, PRODUCT_FIELDS, PRODUCT_DEFAULT_FIELDS)
+    queryset = Product.objects.filter(is_available=True).order_by('category', 'name')
+    if request.GET.get('category', '').isdigit():
+        queryset = queryset.filter(category_id=request.GET['category'])
+
+    rows = _project(queryset, PRODUCT_FIELDS, fields)
+    if 'image' in fields:
+        for row in rows:
+            row['image'] = Product.image.field.storage.url(row['image']) if row['image'] else None
+    return _json({'products': rows})
+
+
+# ----------------------------------------------------------------------
+# Carrinho
+# ----------------------------------------------------------------------
+
+def _get_cart(request):
+    if request.api_token is not None:
+        return request.api_token.cart
+    return request.session.get('cart', {})
+
+
+def _save_cart(request, cart):
+    if request.api_token is not None:
+        ApiToken.objects.filter(pk=request.api_token.pk).update(cart=cart)
+        request.api_token.cart = cart
+    else:
+        request.session['cart'] = cart
+
+
+def _cart_payload(cart):
+    items, total = services.cart_lines(cart)
+    return {
+        'items': [
+            {
+                'product_id': item['product'].pk,
+                'name': item['product'].name,
+                'quantity': item['quantity'],
+                'unit_price': item['unit_price'],
+                'subtotal': item['subtotal'],
+            }
+            for item in items
+        ],
+        'total': total,
+    }
+
+
+@api_view('GET', 'POST', 'DELETE')
+def cart(request):
+    """
+    GET: conteúdo do carrinho. DELETE: esvazia-o.
+    POST {"items": {"<id>": quantidade, ...}, "replace": false}: várias alterações num só pedido
+    (quantidade 0 remove); responde com o carrinho atualizado.
+    """
+    cart = _get_cart(request)
+    if request.method == 'POST':
+        data = _body(request)
+        changes = data.get('items')
+        if not isinstance(changes, dict):
+            raise services.ServiceError('Indique "items" como {id do produto: quantidade}.')
+        cart = services.update_cart(cart, changes, replace=bool(data.get('replace')))
+        _save_cart(request, cart)
+    elif request.method == 'DELETE':
+        cart = {}
+        _save_cart(request, cart)
+    return _json(_cart_payload(cart))
+
+
+# ----------------------------------------------------------------------
+# Checkout e pedidos
+# ----------------------------------------------------------------------
+
+def _order_summary(order):
+    data = {
+        'id': order.pk,
+        'number': order.order_number,
+        'status': order.status,
+        'total': order.total_amount,
+    }
+    if order.payment_method == 'atm':
+        reference = PaymentReference.objects.filter(order=order).first()
+        if reference is not None:
+            data['multibanco'] = {
+                'entity': reference.entity,
+                'reference': reference.reference,
+                'amount': reference.amount,
+                'expires_at': reference.expires_at,
+            }
+    return data
+
+
+def _idempotency_key(request, prefix):
+    """Chave do cabeçalho Idempotency-Key, com prefixo e o utilizador autenticado (ou None)"""
+    key = request.headers.get('Idempotency-Key', '').strip()
+    if len(key) > MAX_IDEMPOTENCY_KEY:
+        raise services.ServiceError(f'Idempotency-Key com mais de {MAX_IDEMPOTENCY_KEY} caracteres.')
+    return f'{prefix}:{request.user.pk}:{key}' if key else None
+
+
+@api_view('POST')
+def checkout(request):
+    """
+    Cria um pedido com o carrinho: {"scheduled_date", "scheduled_time", "payment_method", "notes"}.
+    Com o cabeçalho Idempotency-Key, repetir o pedido devolve o pedido já criado (200) em vez de outro (201).
+    """
+    idempotency_key = _idempotency_key(request, 'api')
+
+    # Repetição: responder antes de verificar o carrinho, que o primeiro pedido já esvaziou
+    existing = services.replayed_order(request.user.pk, idempotency_key)
+    if existing is not None:
+        return _json(_order_summary(existing))
+
+    form = OrderForm(_body(request))
+    if not form.is_valid():
+        metrics.inc('bar_checkout_failures_total', reason='invalid_form')
+        return _json({'error': 'Dados inválidos.', 'reason': 'invalid', 'fields': form.errors}, status=400)
+
+    order, created = services.place_order(request.user, _get_cart(request), form.save(commit=False), idempotency_key)
+    if created:
+        _save_cart(request, {})
+    return _json(_order_summary(order), status=201 if created else 200)
+
+
+@api_view('GET')
+def orders(request):
+    """Pedidos do utilizador, mais recentes primeiro; ?status= filtra, ?limit= (máx. 100)"""
+    fields = _fields(request, ORDER_FIELDS, ORDER_DEFAULT_FIELDS)
+    try:
+        limit = min(int(request.GET.get('limit', 20)), MAX_ORDERS)
+    except ValueError:
+        raise services.ServiceError('limit inválido.')
+
+    queryset = Order.objects.filter(user=request.user).order_by('-created_at')
+    if request.GET.get('status'):
+        queryset = queryset.filter(status=request.GET['status'])
+    return _json({'orders': _project(queryset[:max(limit, 0)], ORDER_FIELDS, fields)})
+
+
+@api_view('GET')
+def order_detail(request, pk):
+    """Estado e itens de um pedido do utilizador (`items` pode ser pedido em ?fields=)"""
+    fields = _fields(request, {**ORDER_FIELDS, 'items': None}, ORDER_DEFAULT_FIELDS + ('items',))
+    order_fields = tuple(field for field in fields if field != 'items')
+
+    rows = _project(Order.objects.filter(pk=pk, user=request.user), ORDER_FIELDS, order_fields or ('id',))
+    if not rows:
+        return _error('Pedido não encontrado.', 404, 'not_found')
+    data = {field: rows[0][field] for field in order_fields}
+    if 'items' in fields:
+        data['items'] = list(
+            OrderItem.objects.filter(order_id=pk)
+            .order_by('product__name')
+            .values('product_id', 'product__name', 'quantity', 'unit_price', 'subtotal')
+        )
+        for item in data['items']:
+            item['name'] = item.pop('product__name')
+    return _json(data)
+
+
+@api_view('GET')
+def pos_customers(request):
+    """Pesquisa de clientes por prefixo do nº de aluno/funcionário ou username (só staff, sem queries)"""
+    if not is_staff_user(request.user):
+        return _error('Sem permissão.', 403, 'forbidden')
+    matches = identity.search(request.GET.get('q', ''))
+    return _json({'customers': [match._asdict() for match in matches]})
+
+
+@api_view('POST')
+def pos_sale(request):
+    """
+    Venda ao balcão (só staff): {"customer": nº de aluno/funcionário ou username, "products": [ids]}.
+    Um id repetido conta várias unidades. Com Idempotency-Key, repetir a venda devolve a já registada.
+    """
+    if not is_staff_user(request.user):
+        return _error('Sem permissão.', 403, 'forbidden')
+
+    data = _body(request)
+    products = data.get('products')
+    if not isinstance(products, list):
+        raise services.ServiceError('Indique "products" como lista de ids.')
+    customer = services.find_customer(str(data.get('customer', '')))
+    if customer is None:
+        return _error('Cliente não encontrado.', 404, 'customer')
+
+    idempotency_key = _idempotency_key(request, 'pos')
+    existing = services.replayed_order(customer.pk, idempotency_key)
+    if existing is not None:
+        order, created = existing, False
+    else:
+        order, created = services.pos_sale(customer, products, idempotency_key)
+
+    return _json({
+        **_order_summary(order),
+        'customer': {
+            'id': customer.pk,
+            'name': customer.get_full_name() or customer.username,
+            'balance': customer.balance,
+        },
+    }, status=201 if created else 200)
+
+
+@api_view('GET')
+def balance(request):
+    """Saldo do utilizador (já carregado com a autenticação: nenhuma query extra)"""
+    return _json({'balance': request.user.balance})
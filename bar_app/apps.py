@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class BarAppConfig(AppConfig):
+    name = 'bar_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,83 @@
+"""
+Camada de cache da aplicação sobre a cache do Django (backend escolhido em settings.CACHE_BACKEND)
+
+- Chaves com namespace e versão: key('reports', 'sales') -> 'reports:v1:sales'. A versão do
+  namespace (NAMESPACE_VERSIONS) sobe quando o formato dos valores muda, para não ler valores antigos.
+- Invalidação por geração: cada chave tem um contador na cache e o valor é guardado com essa
+  geração como versão. invalidate() incrementa o contador; um valor calculado antes da
+  invalidação e gravado depois fica na geração antiga e nunca chega a ser lido.
+- get_or_set(): cache-aside com lock anti-stampede. Numa falha só um pedido calcula o valor
+  (o que consegue criar o lock com cache.add); os outros esperam até LOCK_WAIT segundos pelo
+  resultado e, se não chegar, calculam-no eles próprios sem o gravar.
+"""
+import time
+
+from django.core.cache import cache
+
+from . import metrics
+
+
+NAMESPACE_VERSIONS = {
+    'user_summary': 2,
+}
+
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+def key(namespace, *parts):
+    """Chave com namespace e versão do formato: key('reports', 'sales') -> 'reports:v1:sales'"""
+    version = NAMESPACE_VERSIONS.get(namespace, 1)
+    return ':'.join([namespace, f'v{version}', *(str(part) for part in parts)])
+
+
+def generation(cache_key):
+    """Geração atual da chave (também serve de versão barata, p.ex. para ETags)"""
+    generation_key = f'{cache_key}:gen'
+    value = cache.get(generation_key)
+    if value is None:
+        # Começa num valor que depende do tempo: se o contador for despejado da cache,
+        # a nova geração não volta a apontar para valores antigos que ainda lá estejam
+        cache.add(generation_key, int(time.time() * 1000), None)
+        value = cache.get(generation_key)
+    return value
+
+
+def invalidate(cache_key):
+    """Descarta o valor guardado em `cache_key` (as leituras seguintes recalculam-no)"""
+    try:
+        cache.incr(f'{cache_key}:gen')
+    except ValueError:
+        # Sem contador: nenhum valor desta chave pode ser lido
+        pass
+
+
+def get_or_set(cache_key, compute, timeout):
+    """Valor em cache ou, numa falha, `compute()` (gravado durante `timeout` segundos)"""
+    namespace = cache_key.partition(':')[0]
+    version = generation(cache_key)
+    value = cache.get(cache_key, _MISSING, version=version)
+    metrics.cache_lookup(namespace, value is not _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{cache_key}:lock:{version}'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(cache_key, value, timeout, version=version)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # Outro pedido está a calcular o valor: esperar por ele
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(cache_key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+    return compute()
@@ -0,0 +1,112 @@
+"""
+Pedidos condicionais (ETag/Last-Modified) para as páginas do catálogo e dos pedidos
+Permite responder 304 Not Modified sem renderizar templates nem correr as queries principais
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max, Q
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import picklists, summaries
+from .models import Category, Order, Product
+
+
+def _has_pending_messages(request):
+    """Mensagens flash por mostrar obrigam a renderizar a página completa"""
+    return bool(request.COOKIES.get('messages')) or '_messages' in request.session
+
+
+def _viewer_key(request):
+    """Identifica a variante da página (a navbar muda com o utilizador, o resumo e o carrinho)"""
+    user = request.user
+    cart_size = len(request.session.get('cart', {}))
+    if not user.is_authenticated:
+        return f'anon:{cart_size}'
+    # Versão do resumo da navbar: uma leitura da cache, sem calcular o resumo
+    summary_version = summaries.version(user.pk)
+    return f'{user.pk}:{user.username}:{user.user_type}:{int(user.is_staff)}:{cart_size}:{summary_version}'
+
+
+def conditional_page(state_func):
+    """
+    Decorator que aplica ETag/Last-Modified a uma view.
+
+    `state_func(request, *args, **kwargs)` deve devolver uma tupla barata de obter
+    `(last_modified, *versão)` ou None quando a página tem de ser sempre renderizada.
+    O estado é calculado uma única vez por pedido e partilhado entre ETag e Last-Modified.
+    """
+    def _state(request, *args, **kwargs):
+        if not hasattr(request, '_conditional_state'):
+            if request.method not in ('GET', 'HEAD') or _has_pending_messages(request):
+                request._conditional_state = None
+            else:
+                request._conditional_state = state_func(request, *args, **kwargs)
+        return request._conditional_state
+
+    def etag_func(request, *args, **kwargs):
+        state = _state(request, *args, **kwargs)
+        if state is None:
+            return None
+        raw = '|'.join(str(part) for part in (_viewer_key(request), *state))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        state = _state(request, *args, **kwargs)
+        return state[0] if state else None
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Páginas com conteúdo por utilizador: só o browser guarda e revalida sempre
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return _wrapped
+    return decorator
+
+
+def catalog_state(request, *args, **kwargs):
+    """Versão do catálogo: MAX(updated_at) e contagens de produtos e categorias"""
+    products = Product.objects.aggregate(
+        last_modified=Max('updated_at'),
+        total=Count('id'),
+        available=Count('id', filter=Q(is_available=True)),
+    )
+    categories = Category.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+    )
+    return (
+        products['last_modified'], products['total'], products['available'],
+        categories['total'], categories['active'],
+    )
+
+
+def order_list_state(request, *args, **kwargs):
+    """Versão da lista de pedidos do utilizador"""
+    orders = Order.objects.filter(user=request.user).aggregate(
+        last_modified=Max('updated_at'),
+        total=Count('id'),
+    )
+    return (orders['last_modified'], orders['total'])
+
+
+def order_detail_state(request, pk, *args, **kwargs):
+    """Versão de um pedido; sem permissão ou inexistente deixa a view responder"""
+    row = Order.objects.filter(pk=pk).values_list('updated_at', 'user_id').first()
+    if row is None:
+        return None
+    updated_at, user_id = row
+    if user_id != request.user.pk and not request.user.is_staff:
+        return None
+    return (updated_at, pk)
+
+
+def pick_list_state(request, *args, **kwargs):
+    """Versão da lista de preparação pedida (pedidos do dia + parâmetros da janela)"""
+    return picklists.window_state(picklists.parse_window(request.GET))
@@ -0,0 +1,14 @@
+"""
+Processadores de contexto dos templates
+"""
+from django.utils.functional import SimpleLazyObject
+
+from . import summaries
+
+
+def user_summary(request):
+    """Resumo do utilizador (saldo, nº de pedidos, total gasto), só calculado se o template o usar"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'user_summary': None}
+    return {'user_summary': SimpleLazyObject(lambda: summaries.get(user.pk))}
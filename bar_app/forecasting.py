@@ -0,0 +1,114 @@
+"""
+Previsão de consumo e reabastecimento de produtos
+Calcula, num único passo em lote, o consumo por dia da semana a partir das saídas de stock
+"""
+import math
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedStockMovement, Product, RestockForecast, StockMovement
+
+
+# Semanas de histórico usadas na janela móvel de cada dia da semana
+HISTORY_WEEKS = 8
+# Dias entre encomendar e receber o produto
+LEAD_TIME_DAYS = 2
+# Dias de consumo que cada encomenda deve cobrir
+COVER_DAYS = 7
+# Rutura prevista dentro deste horizonte conta como "a repor"
+RESTOCK_HORIZON_DAYS = LEAD_TIME_DAYS + 1
+# Limite da projeção de rutura
+MAX_PROJECTION_DAYS = 90
+
+
+def daily_consumption(since):
+    """
+    Saídas de stock por produto e por dia desde `since`, uma query agrupada por tabela
+    (movimentos principais e arquivados: compact_stock arquiva parte da janela de histórico).
+    Devolve {product_id: {data: quantidade}}.
+    """
+    # Limite em datetime (meia-noite local) e não __date, para poder usar o índice de created_at
+    start = timezone.make_aware(datetime.combine(since, time.min))
+    consumption = {}
+    for model in (StockMovement, ArchivedStockMovement):
+        rows = (
+            model.objects
+            .filter(movement_type='out', created_at__gte=start)
+            .annotate(day=TruncDate('created_at'))
+            .values('product_id', 'day')
+            .annotate(quantity=Sum('quantity'))
+            .order_by()
+        )
+        for row in rows:
+            days = consumption.setdefault(row['product_id'], {})
+            days[row['day']] = days.get(row['day'], 0) + row['quantity']
+    return consumption
+
+
+def weekday_rates(days, start, weeks=HISTORY_WEEKS):
+    """
+    Média de consumo por dia da semana (0 = segunda) numa janela de `weeks` semanas.
+    Os dias sem saídas contam como zero.
+    """
+    totals = [0] * 7
+    for offset in range(weeks * 7):
+        day = start + timedelta(days=offset)
+        totals[day.weekday()] += days.get(day, 0)
+    return [total / weeks for total in totals]
+
+
+def project_stockout(stock, rates, today):
+    """Dias até o stock acabar, consumindo a taxa de cada dia da semana a partir de hoje"""
+    if not any(rates):
+        return None
+    remaining = stock
+    for offset in range(MAX_PROJECTION_DAYS):
+        remaining -= rates[(today + timedelta(days=offset)).weekday()]
+        if remaining < 0:
+            return offset
+    return None
+
+
+def suggest_reorder(product, rates, today):
+    """Quantidade a encomendar para cobrir o prazo de entrega e COVER_DAYS acima do stock mínimo"""
+    demand = sum(
+        rates[(today + timedelta(days=offset)).weekday()]
+        for offset in range(LEAD_TIME_DAYS + COVER_DAYS)
+    )
+    return max(0, math.ceil(demand + product.min_stock - product.stock))
+
+
+def compute_forecasts(weeks=HISTORY_WEEKS):
+    """
+    Recalcula a previsão de todo o catálogo e guarda-a em RestockForecast.
+    Uma query para o histórico, uma para os produtos e um único upsert em lote.
+    """
+    now = timezone.now()
+    today = timezone.localdate()
+    start = today - timedelta(days=weeks * 7)
+    consumption = daily_consumption(start)
+
+    forecasts = []
+    for product in Product.objects.only('id', 'stock', 'min_stock'):
+        rates = weekday_rates(consumption.get(product.pk, {}), start, weeks)
+        forecasts.append(RestockForecast(
+            product=product,
+            daily_rate=Decimal(sum(rates) / 7).quantize(Decimal('0.01')),
+            weekday_rates=[round(rate, 2) for rate in rates],
+            days_until_stockout=project_stockout(product.stock, rates, today),
+            suggested_reorder=suggest_reorder(product, rates, today),
+            computed_at=now,
+        ))
+
+    RestockForecast.objects.bulk_create(
+        forecasts,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['daily_rate', 'weekday_rates', 'days_until_stockout', 'suggested_reorder', 'computed_at'],
+    )
+    return len(forecasts)
@@ -17,6 +17,8 @@ class UserRegistrationForm(UserCreationForm):
 
 class OrderForm(forms.ModelForm):
     """Formulário de criação de pedido"""
+    # Token de idempotência emitido a cada renderização (ver bar_app/idempotency.py)
+    checkout_token = forms.CharField(widget=forms.HiddenInput, required=False, max_length=128)
     
     class Meta:
         model = Order
@@ -31,6 +33,11 @@ class OrderForm(forms.ModelForm):
 
 class TopUpForm(forms.ModelForm):
     """Formulário de carregamento de saldo"""
+    METHOD_CHOICES = (
+        ('instant', 'Carregamento imediato'),
+        ('atm', 'Referência Multibanco'),
+    )
+    method = forms.ChoiceField(choices=METHOD_CHOICES, initial='instant', required=False, widget=forms.RadioSelect)
     
     class Meta:
         model = Transaction
@@ -0,0 +1,148 @@
+"""
+Arquivo anual de pedidos e transações e acesso transparente ao histórico
+As tabelas principais guardam apenas o ano letivo corrente; os anos fechados vivem nas tabelas Archived*
+"""
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, ArchivedTransaction,
+    Order, OrderItem, Transaction
+)
+
+
+# O ano letivo começa a 1 de setembro
+SCHOOL_YEAR_START_MONTH = 9
+# Linhas arquivadas por transação
+ARCHIVE_BATCH_SIZE = 1000
+
+ORDER_FIELDS = [
+    'id', 'user_id', 'order_number', 'status', 'payment_method', 'total_amount',
+    'scheduled_date', 'scheduled_time', 'notes', 'is_priority', 'created_at', 'updated_at',
+]
+ORDER_ITEM_FIELDS = ['id', 'order_id', 'product_id', 'quantity', 'unit_price', 'subtotal']
+TRANSACTION_FIELDS = ['id', 'user_id', 'transaction_type', 'amount', 'description', 'created_at']
+
+
+def school_year_of(day):
+    """Ano letivo ('2024-2025') de uma data"""
+    first = day.year if day.month >= SCHOOL_YEAR_START_MONTH else day.year - 1
+    return f'{first}-{first + 1}'
+
+
+def current_school_year():
+    return school_year_of(timezone.localdate())
+
+
+def school_year_bounds(school_year):
+    """Instantes [início, fim[ de um ano letivo, no fuso horário atual"""
+    first = int(school_year.split('-')[0])
+    start = date(first, SCHOOL_YEAR_START_MONTH, 1)
+    end = date(first + 1, SCHOOL_YEAR_START_MONTH, 1)
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end, time.min), tz),
+    )
+
+
+def current_school_year_start():
+    """Data em que começa o ano letivo corrente (anterior a ela, os dados podem estar arquivados)"""
+    return school_year_bounds(current_school_year())[0].date()
+
+
+# ----------------------------------------------------------------------
+# Leitura do histórico
+# ----------------------------------------------------------------------
+
+def archived_years(user):
+    """Anos letivos com transações arquivadas do utilizador, do mais recente para o mais antigo"""
+    return list(
+        ArchivedTransaction.objects.filter(user=user)
+        .values_list('school_year', flat=True)
+        .distinct()
+        .order_by('-school_year')
+    )
+
+
+def user_transactions(user, school_year=None):
+    """
+    Transações de um utilizador: as atuais (sem ano) ou as de um ano letivo arquivado.
+    As transações arquivadas trazem `order_number` em vez da relação `order`.
+    """
+    if school_year is None or school_year == current_school_year():
+        return Transaction.objects.for_listing().filter(user=user).order_by('-created_at')
+    return ArchivedTransaction.objects.filter(user=user, school_year=school_year).order_by('-created_at')
+
+
+# ----------------------------------------------------------------------
+# Arquivo
+# ----------------------------------------------------------------------
+
+def _archive_transactions(school_year, start, end, batch_size):
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Transaction.objects
+                .filter(created_at__gte=start, created_at__lt=end)
+                .order_by('id')
+                .values(*TRANSACTION_FIELDS, 'order__order_number')[:batch_size]
+            )
+            if not rows:
+                return moved
+            archived = []
+            for row in rows:
+                order_number = row.pop('order__order_number') or ''
+                archived.append(ArchivedTransaction(school_year=school_year, order_number=order_number, **row))
+            ArchivedTransaction.objects.bulk_create(archived, ignore_conflicts=True)
+            Transaction.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+
+def _archive_orders(school_year, start, end, batch_size):
+    moved = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                Order.objects
+                .filter(created_at__gte=start, created_at__lt=end)
+                .order_by('id')
+                .values(*ORDER_FIELDS)[:batch_size]
+            )
+            if not orders:
+                return moved
+            order_ids = [row['id'] for row in orders]
+            items = list(OrderItem.objects.filter(order_id__in=order_ids).values(*ORDER_ITEM_FIELDS))
+
+            ArchivedOrder.objects.bulk_create(
+                [ArchivedOrder(school_year=school_year, **row) for row in orders],
+                ignore_conflicts=True,
+            )
+            ArchivedOrderItem.objects.bulk_create(
+                [ArchivedOrderItem(**row) for row in items],
+                ignore_conflicts=True,
+            )
+            OrderItem.objects.filter(order_id__in=order_ids).delete()
+            Order.objects.filter(id__in=order_ids).delete()
+        moved += len(orders)
+
+
+def archive_school_year(school_year, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move os pedidos e transações de um ano letivo fechado para as tabelas de arquivo.
+
+    Cada lote é copiado e apagado na mesma transação, por isso o processo pode ser
+    interrompido e retomado a qualquer momento. As transações são arquivadas antes
+    dos pedidos para ainda guardarem o número do pedido relacionado.
+    Devolve (nº de transações, nº de pedidos) arquivados.
+    """
+    if school_year >= current_school_year():
+        raise ValueError(f'O ano letivo {school_year} ainda não está fechado.')
+
+    start, end = school_year_bounds(school_year)
+    transactions = _archive_transactions(school_year, start, end, batch_size)
+    orders = _archive_orders(school_year, start, end, batch_size)
+    return transactions, orders
@@ -0,0 +1,60 @@
+"""
+Tokens de idempotência do checkout
+Cada renderização do formulário de checkout recebe um token assinado (utilizador + chave aleatória),
+válido durante TOKEN_TTL. O pedido criado com esse token guarda a chave em Order.idempotency_key;
+uma submissão repetida (duplo clique, reenvio do browser) encontra o pedido já criado em vez de criar outro.
+O token não é guardado no servidor: renderizar o checkout não escreve na sessão nem na base de dados.
+"""
+import secrets
+
+from django.core import signing
+from django.core.cache import cache
+
+from .models import Order
+
+
+SALT = 'bar_app.checkout'
+# Validade de um token (segundos): tempo máximo entre abrir o checkout e confirmar
+TOKEN_TTL = 15 * 60
+
+_signer = signing.TimestampSigner(salt=SALT)
+
+
+def _cache_key(user_id, key):
+    return f'checkout:token:{user_id}:{key}'
+
+
+def issue_token(user_id):
+    """Novo token para um formulário de checkout do utilizador"""
+    return _signer.sign(f'{user_id}:{secrets.token_urlsafe(16)}')
+
+
+def token_key(user_id, token, max_age=None):
+    """
+    Chave de idempotência contida em `token`, ou None se a assinatura for inválida,
+    o token for de outro utilizador ou (com `max_age`) tiver expirado.
+    """
+    try:
+        value = _signer.unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    owner, _, key = value.partition(':')
+    return key if owner == str(user_id) and key else None
+
+
+def remember_order(user_id, key, order_id):
+    """Guarda em cache o pedido criado com `key` (caminho rápido para repetições)"""
+    cache.set(_cache_key(user_id, key), order_id, TOKEN_TTL)
+
+
+def find_order(user_id, key):
+    """
+    Pedido já criado com `key`, ou None.
+    Consulta a cache primeiro e só depois a base de dados (leitura simples, sem locks).
+    """
+    order_id = cache.get(_cache_key(user_id, key))
+    if order_id is None:
+        order_id = Order.objects.filter(user_id=user_id, idempotency_key=key).values_list('pk', flat=True).first()
+        if order_id is not None:
+            remember_order(user_id, key, order_id)
+    return order_id
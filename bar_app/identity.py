@@ -0,0 +1,173 @@
+"""
+Identificação de clientes ao balcão: índice em memória de nº de aluno, nº de funcionário
+(professores e funcionários) e username -> utilizador
+
+O índice é construído de uma vez (uma query) no arranque do servidor (warm, chamado em
+bar_escola/wsgi.py) ou no primeiro uso, e mantido pelos sinais em bar_app.signals. Um dicionário responde a identificadores completos e uma lista ordenada
+de chaves (pesquisa binária com bisect) a prefixos escritos à mão, sem tocar na base de dados.
+
+Com vários processos, cada alteração incrementa uma versão partilhada na cache; os outros
+processos reconstroem o índice quando a veem mudar (verificada no máximo a cada CHECK_INTERVAL s).
+"""
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from .models import User
+
+
+Identity = namedtuple('Identity', ['user_id', 'name', 'user_type', 'photo_url', 'identifier', 'kind'])
+
+VERSION_KEY = 'identity:version'
+CHECK_INTERVAL = 5
+# Por prioridade: quando dois utilizadores partilham um identificador (p.ex. o username de
+# um é o nº de aluno de outro), fica o de maior prioridade, seja qual for a ordem das linhas
+KINDS = (
+    ('staff', 'staff__employee_number'),
+    ('teacher', 'teacher__employee_number'),
+    ('student', 'student__student_number'),
+    ('username', 'username'),
+)
+PRIORITY = {kind: rank for rank, (kind, _) in enumerate(KINDS)}
+
+_lock = threading.Lock()
+_index = {}
+_keys = []
+# Chaves partilhadas por vários utilizadores: a entrada que perdeu não fica no índice
+_contested = set()
+_built = False
+_version = None
+_last_check = 0.0
+
+
+def normalize(identifier):
+    return identifier.strip().casefold()
+
+
+def _identities(rows):
+    """Entradas do índice para linhas de User.values() (uma por identificador não vazio)"""
+    photo_storage = User.photo.field.storage
+    for row in rows:
+        name = f"{row['first_name']} {row['last_name']}".strip() or row['username']
+        photo_url = photo_storage.url(row['photo']) if row['photo'] else None
+        for kind, field in KINDS:
+            if row[field]:
+                yield Identity(row['id'], name, row['user_type'], photo_url, row[field], kind)
+
+
+def _add(index, contested, identity):
+    """Junta `identity` ao índice, respeitando a prioridade em caso de colisão"""
+    key = normalize(identity.identifier)
+    current = index.get(key)
+    if current is None:
+        index[key] = identity
+        return
+    if current.user_id != identity.user_id:
+        contested.add(key)
+    if PRIORITY[identity.kind] < PRIORITY[current.kind]:
+        index[key] = identity
+
+
+def _rows(**filters):
+    fields = ['id', 'username', 'first_name', 'last_name', 'user_type', 'photo'] + [field for _, field in KINDS[:-1]]
+    return User.objects.filter(is_active=True, **filters).values(*fields)
+
+
+def _shared_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def rebuild():
+    """Reconstrói o índice completo (uma query com os números de aluno e de funcionário)"""
+    global _index, _keys, _contested, _built, _version, _last_check
+    version = _shared_version()
+    index, contested = {}, set()
+    for identity in _identities(_rows()):
+        _add(index, contested, identity)
+    with _lock:
+        _index, _keys, _contested = index, sorted(index), contested
+        _built, _version, _last_check = True, version, time.monotonic()
+
+
+def warm():
+    """Constrói o índice no arranque do processo (sem base de dados migrada, fica para o primeiro uso)"""
+    try:
+        rebuild()
+    except DatabaseError:
+        pass
+
+
+def _ensure_fresh():
+    global _last_check
+    if not _built:
+        rebuild()
+        return
+    now = time.monotonic()
+    if now - _last_check < CHECK_INTERVAL:
+        return
+    _last_check = now
+    if _shared_version() != _version:
+        rebuild()
+
+
+def resolve(identifier):
+    """Identidade com este identificador exato (sem distinguir maiúsculas), ou None"""
+    _ensure_fresh()
+    return _index.get(normalize(identifier))
+
+
+def search(prefix, limit=10):
+    """Identidades cujo identificador começa por `prefix` (um resultado por utilizador)"""
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    _ensure_fresh()
+    index, keys = _index, _keys
+    results, seen = [], set()
+    for key in keys[bisect.bisect_left(keys, prefix):]:
+        if not key.startswith(prefix) or len(results) >= limit:
+            break
+        identity = index[key]
+        if identity.user_id not in seen:
+            seen.add(identity.user_id)
+            results.append(identity)
+    return results
+
+
+def _bump_version():
+    """Avisa os outros processos de que o índice mudou"""
+    global _version
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        return
+    if _version is not None and version == _version + 1:
+        _version = version
+
+
+def refresh_user(user_id):
+    """Atualiza as entradas de um utilizador (criado, alterado, desativado ou com números novos)"""
+    global _index, _keys
+    if not _built:
+        _bump_version()
+        return
+    identities = list(_identities(_rows(pk=user_id)))
+    with _lock:
+        old_keys = {key for key, identity in _index.items() if identity.user_id == user_id}
+        new_keys = {normalize(identity.identifier) for identity in identities}
+        # Uma chave disputada pode ter escondido a entrada de outro utilizador, que só uma
+        # reconstrução recupera (raro)
+        contested = bool((old_keys | new_keys) & _contested)
+        if not contested:
+            index = {key: identity for key, identity in _index.items() if identity.user_id != user_id}
+            for identity in identities:
+                _add(index, _contested, identity)
+            _index, _keys = index, sorted(index)
+    if contested:
+        rebuild()
+    _bump_version()
@@ -0,0 +1,133 @@
+"""
+Fila de tarefas em segundo plano guardada na base de dados (sem broker externo)
+
+As tarefas são funções registadas com @task e executadas pelo comando run_worker.
+Uma tarefa pode correr mais de uma vez (retries, worker interrompido), por isso
+tem de ser idempotente.
+"""
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+# Nome -> (função, nº máximo de tentativas)
+TASKS = {}
+
+# Atraso do primeiro retry (segundos); duplica a cada tentativa, até BACKOFF_MAX
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+# Tarefas 'running' há mais do que isto são consideradas abandonadas (worker morreu)
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def task(name, max_attempts=5):
+    """Regista uma função como tarefa: @task('nome')"""
+    def register(func):
+        TASKS[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def load_tasks():
+    """Importa os módulos que registam tarefas"""
+    from . import tasks  # noqa: F401
+
+
+def enqueue(task_name, payload=None, idempotency_key=None, queue='default', delay=None):
+    """
+    Cria uma tarefa pendente. Com `idempotency_key`, uma segunda tarefa com a mesma
+    chave é ignorada (um único INSERT, sem leitura prévia).
+
+    Dentro de transaction.atomic a tarefa só fica visível ao worker depois do commit
+    e desaparece se a transação for revertida.
+    """
+    load_tasks()
+    max_attempts = TASKS[task_name][1] if task_name in TASKS else 5
+    job = Job(
+        queue=queue,
+        task=task_name,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+    Job.objects.bulk_create([job], ignore_conflicts=idempotency_key is not None)
+    return job
+
+
+def backoff(attempts):
+    """Segundos até ao próximo retry: exponencial com jitter"""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+# ----------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------
+
+def claim(worker_id, queues=('default',), limit=1):
+    """
+    Reserva até `limit` tarefas prontas para `worker_id`.
+
+    Em PostgreSQL usa SELECT ... FOR UPDATE SKIP LOCKED: workers concorrentes nunca
+    esperam uns pelos outros. Em SQLite (sem SKIP LOCKED) usa um UPDATE condicional
+    (status='pending') com uma marca única por reserva; como as escritas em SQLite são
+    serializadas, cada tarefa fica reservada por um único worker.
+    """
+    now = timezone.now()
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    ready = Job.objects.filter(queue__in=queues, status='pending', run_at__lte=now).order_by('run_at', 'id')
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(ready.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        else:
+            ids = list(ready.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids, status='pending').update(
+            status='running', locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status='running'))
+
+
+def run(job):
+    """Executa uma tarefa reservada e regista o resultado (concluída, retry ou falhada)"""
+    try:
+        func, _ = TASKS[job.task]
+        with transaction.atomic():
+            func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status='failed', last_error=error, finished_at=now)
+            return 'failed'
+        Job.objects.filter(pk=job.pk).update(
+            status='pending', last_error=error, locked_by='', locked_at=None,
+            run_at=now + timedelta(seconds=backoff(job.attempts)),
+        )
+        return 'retry'
+
+    Job.objects.filter(pk=job.pk).update(status='done', finished_at=timezone.now())
+    return 'done'
+
+
+def requeue_stale():
+    """Devolve à fila as tarefas reservadas por workers que terminaram a meio"""
+    return Job.objects.filter(status='running', locked_at__lt=timezone.now() - LOCK_TIMEOUT).update(
+        status='pending', locked_by='', locked_at=None,
+    )
+
+
+def purge_finished(days=7):
+    """Apaga as tarefas concluídas há mais de `days` dias (as falhadas ficam para análise)"""
+    deleted, _ = Job.objects.filter(status='done', finished_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
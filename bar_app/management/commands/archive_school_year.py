@@ -0,0 +1,32 @@
+"""
+Arquiva os pedidos e transações de um ano letivo fechado (correr no fim de cada ano letivo)
+"""
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bar_app.history import ARCHIVE_BATCH_SIZE, archive_school_year
+
+
+class Command(BaseCommand):
+    help = 'Move os pedidos e transações de um ano letivo fechado (p.ex. 2024-2025) para as tabelas de arquivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('school_year', help='Ano letivo no formato AAAA-AAAA')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help='Linhas arquivadas por transação')
+
+    def handle(self, *args, **options):
+        school_year = options['school_year']
+        match = re.fullmatch(r'(\d{4})-(\d{4})', school_year)
+        if not match or int(match.group(2)) != int(match.group(1)) + 1:
+            raise CommandError(f'Ano letivo inválido: {school_year} (use p.ex. 2024-2025)')
+
+        try:
+            transactions, orders = archive_school_year(school_year, batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{school_year}: {transactions} transações e {orders} pedidos arquivados.'
+        ))
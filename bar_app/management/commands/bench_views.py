@@ -0,0 +1,252 @@
+"""
+Micro-benchmark das views principais contra a base de dados atual
+
+Mede tempo (mediana de várias repetições), nº de queries e pico de memória de cada
+view e de Transaction.save, e compara com uma baseline guardada por escala de dados.
+Gerar as escalas com seed_bar (p.ex. --orders 1000, 100000, 1000000).
+
+Tudo o que o benchmark escreve (utilizador staff, pedidos, transações) é revertido no fim.
+"""
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from datetime import date, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from bar_app import idempotency
+from bar_app.models import Order, Product, Transaction, User
+
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'views.json'
+# Regressão: tempo ou memória acima de (1 + threshold) x baseline, ou mais queries
+DEFAULT_THRESHOLD = 0.20
+CART_SIZE = 5
+
+
+class _Rollback(Exception):
+    """Usada para reverter tudo o que o benchmark escreveu"""
+
+
+def scale_label(orders):
+    """Escala da base de dados arredondada à potência de 10 mais próxima ('1k', '100k', '1M')"""
+    if orders <= 0:
+        return '0'
+    scale = 10 ** round(math.log10(orders))
+    for suffix, size in (('M', 10 ** 6), ('k', 10 ** 3)):
+        if scale >= size:
+            return f'{scale // size}{suffix}'
+    return str(scale)
+
+
+class Command(BaseCommand):
+    help = 'Mede tempo, queries e memória de cada view e compara com a baseline da escala atual'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Repetições medidas por view (reporta a mediana)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help='Ficheiro JSON com as baselines por escala')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Guarda os resultados como nova baseline desta escala')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Aumento relativo a partir do qual um resultado é regressão (0.2 = 20%%)')
+        parser.add_argument('--label',
+                            help='Escala dos dados (por omissão calculada a partir do nº de pedidos)')
+        parser.add_argument('--only', nargs='+',
+                            help='Mede apenas estas views')
+
+    def handle(self, *args, **options):
+        label = options['label'] or scale_label(Order.objects.count())
+
+        setup_test_environment()
+        try:
+            # As repetições excederiam as taxas de THROTTLE_RATES (os clientes são criados depois disto)
+            with override_settings(THROTTLE_ENABLED=False), transaction.atomic():
+                results = self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            teardown_test_environment()
+
+        baselines = self._load(options['baseline'])
+        regressions = self._report(results, baselines.get(label, {}), label, options['threshold'])
+
+        if options['save_baseline']:
+            baselines[label] = results
+            self._save(options['baseline'], baselines)
+            self.stdout.write(self.style.SUCCESS(f'Baseline "{label}" guardada em {options["baseline"]}.'))
+        elif regressions:
+            raise CommandError('Regressões de desempenho:\n' + '\n'.join(regressions))
+
+    # ------------------------------------------------------------------
+    # Preparação
+    # ------------------------------------------------------------------
+
+    def _clients(self):
+        """Cliente de um aluno com histórico (o do pedido mais recente) e de um staff"""
+        student_id = (
+            Order.objects.filter(user__user_type='aluno')
+            .order_by('-pk').values_list('user_id', flat=True).first()
+        )
+        if student_id is None:
+            student = User.objects.create_user(username='bench-aluno', password='x', user_type='aluno')
+        else:
+            student = User.objects.get(pk=student_id)
+        staff = User.objects.create_superuser(username='bench-staff', password='x', user_type='staff')
+
+        # Saldo e stock suficientes para todas as repetições do checkout
+        User.objects.filter(pk=student.pk).update(balance=Decimal('1000000'))
+        products = list(Product.objects.filter(is_available=True).order_by('pk').values_list('pk', flat=True)[:CART_SIZE])
+        if not products:
+            raise CommandError('Não há produtos; gere dados primeiro com seed_bar.')
+        Product.objects.filter(pk__in=products).update(stock=1000000)
+
+        student_client = Client()
+        student_client.force_login(student)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        return student, student_client, staff_client, products
+
+    def _cases(self):
+        """{nome: (função medida, preparação antes de cada repetição ou None, estados esperados)}"""
+        student, student_client, staff_client, products = self._clients()
+
+        def fill_cart():
+            session = student_client.session
+            session['cart'] = {str(pk): 1 for pk in products}
+            session.save()
+            checkout_data['checkout_token'] = idempotency.issue_token(student.pk)
+
+        tomorrow = date.today() + timedelta(days=1)
+        checkout_data = {
+            'scheduled_date': tomorrow.isoformat(),
+            'scheduled_time': dt_time(12, 30).strftime('%H:%M'),
+            'payment_method': 'card',
+            'notes': '',
+        }
+        fill_cart()
+
+        # Venda ao balcão ao mesmo aluno, identificado pelo username
+        pos_data = json.dumps({'customer': student.username, 'products': products})
+
+        def get(client, name):
+            url = reverse(f'bar_app:{name}')
+            return lambda: client.get(url)
+
+        def transaction_save():
+            Transaction.objects.create(user=student, transaction_type='topup', amount=Decimal('5.00'),
+                                       description='Carregamento de saldo')
+
+        return {
+            'menu': (get(student_client, 'menu'), None, {200}),
+            'cart': (get(student_client, 'cart'), None, {200}),
+            'checkout': (get(student_client, 'checkout'), None, {200}),
+            'checkout_post': (lambda: student_client.post(reverse('bar_app:checkout'), checkout_data), fill_cart, {302}),
+            'order_list': (get(student_client, 'order_list'), None, {200}),
+            'transaction_list': (get(student_client, 'transaction_list'), None, {200}),
+            'dashboard': (get(staff_client, 'dashboard'), None, {200}),
+            'manage_orders': (get(staff_client, 'manage_orders'), None, {200}),
+            'manage_stock': (get(staff_client, 'manage_stock'), None, {200}),
+            'pos_sale': (lambda: staff_client.post(reverse('bar_app:api_pos_sale'), pos_data,
+                                                   content_type='application/json'), None, {201}),
+            'transaction_save': (transaction_save, None, None),
+        }
+
+    # ------------------------------------------------------------------
+    # Medição
+    # ------------------------------------------------------------------
+
+    def _run(self, options):
+        results = {}
+        for name, (func, setup, statuses) in self._cases().items():
+            if options['only'] and name not in options['only']:
+                continue
+            results[name] = self._measure(name, func, setup, statuses, options['repeat'])
+        return results
+
+    def _call(self, name, func, setup, statuses):
+        if setup is not None:
+            setup()
+        ContentType.objects.clear_cache()
+        response = func()
+        if statuses is not None and response.status_code not in statuses:
+            raise CommandError(f'{name}: resposta {response.status_code}')
+
+    def _measure(self, name, func, setup, statuses, repeat):
+        # Aquecimento (templates, caches de URL) e contagem de queries
+        with CaptureQueriesContext(connection) as ctx:
+            self._call(name, func, setup, statuses)
+        queries = len(ctx.captured_queries)
+
+        timings = []
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            ContentType.objects.clear_cache()
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+
+        # A memória é medida à parte: o tracemalloc atrasa a execução
+        tracemalloc.start()
+        try:
+            self._call(name, func, setup, statuses)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'time_ms': round(statistics.median(timings) * 1000, 2),
+            'queries': queries,
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    # ------------------------------------------------------------------
+    # Baseline e relatório
+    # ------------------------------------------------------------------
+
+    def _load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self, path, baselines):
+        settings.BASE_DIR.joinpath(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def _report(self, results, baseline, label, threshold):
+        self.stdout.write(f'Escala: {label} ({"com" if baseline else "sem"} baseline)')
+        self.stdout.write(f"{'view':<20}{'tempo (ms)':>12}{'base':>10}{'queries':>9}{'base':>6}{'pico (KiB)':>12}{'base':>10}")
+
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name, {})
+            self.stdout.write(
+                f'{name:<20}{result["time_ms"]:>12.2f}{base.get("time_ms", "-"):>10}'
+                f'{result["queries"]:>9}{base.get("queries", "-"):>6}'
+                f'{result["peak_kib"]:>12.1f}{base.get("peak_kib", "-"):>10}'
+            )
+            if not base:
+                continue
+            if result['time_ms'] > base['time_ms'] * (1 + threshold):
+                regressions.append(f'{name}: tempo {base["time_ms"]} -> {result["time_ms"]} ms')
+            if result['queries'] > base['queries']:
+                regressions.append(f'{name}: queries {base["queries"]} -> {result["queries"]}')
+            if result['peak_kib'] > base['peak_kib'] * (1 + threshold):
+                regressions.append(f'{name}: memória {base["peak_kib"]} -> {result["peak_kib"]} KiB')
+        return regressions
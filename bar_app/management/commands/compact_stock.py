@@ -0,0 +1,28 @@
+"""
+Regista um snapshot do stock e compacta os movimentos antigos (agendar semanalmente)
+"""
+from django.core.management.base import BaseCommand
+
+from bar_app.stock import COMPACT_BATCH_SIZE, KEEP_DAYS, compact_movements, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Regista um snapshot do stock de todos os produtos e arquiva os movimentos de stock antigos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=KEEP_DAYS,
+                            help='Dias de movimentos a manter na tabela principal')
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE,
+                            help='Movimentos arquivados por transação')
+        parser.add_argument('--snapshot-only', action='store_true',
+                            help='Apenas regista o snapshot, sem arquivar movimentos')
+
+    def handle(self, *args, **options):
+        taken_at, total = take_snapshots()
+        self.stdout.write(f'Snapshot de {total} produtos registado em {taken_at:%d/%m/%Y %H:%M}.')
+
+        if options['snapshot_only']:
+            return
+
+        moved = compact_movements(keep_days=options['keep_days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{moved} movimentos arquivados.'))
@@ -0,0 +1,18 @@
+"""
+Recalcula a previsão de reabastecimento de todo o catálogo (agendar diariamente, p.ex. via cron)
+"""
+from django.core.management.base import BaseCommand
+
+from bar_app.forecasting import HISTORY_WEEKS, compute_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o consumo previsto, os dias até rutura e as quantidades a encomendar de todos os produtos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=HISTORY_WEEKS,
+                            help='Semanas de histórico de saídas a considerar')
+
+    def handle(self, *args, **options):
+        total = compute_forecasts(weeks=options['weeks'])
+        self.stdout.write(self.style.SUCCESS(f'Previsão atualizada para {total} produtos.'))
@@ -0,0 +1,23 @@
+"""
+Cria um token de acesso à API JSON para um utilizador (o token só é mostrado agora)
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from bar_app.models import ApiToken, User
+
+
+class Command(BaseCommand):
+    help = 'Cria um token da API JSON para um utilizador e mostra-o uma única vez'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Utilizador dono do token')
+        parser.add_argument('--name', default='API', help='Nome do token (p.ex. o quiosque onde é usado)')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f'Utilizador "{options["username"]}" não existe.')
+
+        token, key = ApiToken.create_token(user, options['name'])
+        self.stdout.write(self.style.SUCCESS(f'Token "{token.name}" criado para {user.username}:'))
+        self.stdout.write(key)
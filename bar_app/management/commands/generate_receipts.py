@@ -0,0 +1,61 @@
+"""
+Gera em lote os recibos em falta dos pedidos de um dia (para a secretaria)
+"""
+from multiprocessing import Pool, cpu_count
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bar_app.models import Order
+from bar_app.receipts import FINAL_STATUSES, generate_receipts
+
+
+# Pedidos por tarefa de cada processo
+CHUNK_SIZE = 200
+
+
+def _init_worker():
+    # Com 'spawn' (Windows/macOS) o processo filho tem de configurar o Django
+    django.setup()
+
+
+def _generate_chunk(order_ids):
+    try:
+        return generate_receipts(order_ids)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Gera os recibos em falta dos pedidos finalizados de um dia, em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Dia (AAAA-MM-DD) da data de levantamento; por omissão hoje')
+        parser.add_argument('--workers', type=int, default=cpu_count(),
+                            help='Processos a usar (1 = sem processos extra)')
+
+    def handle(self, *args, **options):
+        day = parse_date(options['date']) if options['date'] else timezone.localdate()
+        if day is None:
+            raise CommandError(f'Data inválida: {options["date"]}')
+
+        order_ids = list(
+            Order.objects.filter(scheduled_date=day, status__in=FINAL_STATUSES, receipt='')
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        chunks = [order_ids[i:i + CHUNK_SIZE] for i in range(0, len(order_ids), CHUNK_SIZE)]
+
+        if options['workers'] > 1 and len(chunks) > 1:
+            # As ligações não podem ser partilhadas com os processos filhos
+            connections.close_all()
+            with Pool(options['workers'], initializer=_init_worker) as pool:
+                generated = sum(pool.imap_unordered(_generate_chunk, chunks))
+        else:
+            generated = sum(generate_receipts(chunk) for chunk in chunks)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{generated} recibos gerados para {day:%d/%m/%Y} ({len(order_ids)} pedidos sem recibo).'
+        ))
@@ -0,0 +1,43 @@
+"""
+Importa um extrato de pagamentos Multibanco e liquida as referências pagas
+(pedidos e carregamentos de saldo); ver bar_app/multibanco.py
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bar_app import multibanco
+
+
+class Command(BaseCommand):
+    help = 'Liquida as referências Multibanco pagas a partir de um extrato CSV (data;entidade;referência;montante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Ficheiro do extrato')
+        parser.add_argument('--encoding', default='utf-8', help='Codificação do ficheiro')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Só associa os pagamentos e reporta, sem liquidar')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Número máximo de problemas a listar')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['statement'], encoding=options['encoding']) as statement:
+                result = multibanco.settle(statement, dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(f'Não foi possível ler o extrato: {e}')
+        except multibanco.SettlementConflict:
+            raise CommandError('Outra importação liquidou algumas destas referências entretanto; nada foi aplicado. Volte a correr o comando.')
+        elapsed = time.monotonic() - started
+
+        total = sum(row.amount for row, _ in result.settled)
+        verb = 'a liquidar' if options['dry_run'] else 'liquidados'
+        self.stdout.write(f'{len(result.settled)} pagamentos {verb} (€{total}) em {elapsed:.1f}s, {len(result.problems)} problemas.')
+        for problem in result.problems[:options['show']]:
+            self.stdout.write(f'  linha {problem.line_number}: {multibanco.PROBLEM_LABELS[problem.reason]} ({problem.detail})')
+        if len(result.problems) > options['show']:
+            self.stdout.write(f'  ... e mais {len(result.problems) - options["show"]}')
+
+        if result.settled and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Extrato importado.'))
@@ -0,0 +1,23 @@
+"""
+Gera referências Multibanco para os pedidos por Multibanco que ainda não têm nenhuma
+(p.ex. pedidos anteriores à integração); os pedidos novos recebem-na no checkout
+"""
+from django.core.management.base import BaseCommand
+
+from bar_app import multibanco
+from bar_app.models import Order, PaymentReference
+
+
+class Command(BaseCommand):
+    help = 'Gera, em bulk, referências Multibanco para pedidos Multibanco em aberto sem referência'
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(
+            payment_method='atm', payment_reference__isnull=True, total_amount__gt=0,
+        ).exclude(status__in=['delivered', 'cancelled']).values_list('pk', 'user_id', 'total_amount')
+
+        references = multibanco.issue([
+            PaymentReference(order_id=pk, user_id=user_id, purpose='order', amount=total_amount)
+            for pk, user_id, total_amount in orders
+        ])
+        self.stdout.write(self.style.SUCCESS(f'{len(references)} referências geradas.'))
@@ -0,0 +1,52 @@
+"""
+Reconciliação noturna de saldos e stock (agendar diariamente, p.ex. via cron)
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bar_app.reconciliation import CHUNK_SIZE, MissingBaseline, reconcile_balances, reconcile_stock
+
+
+class Command(BaseCommand):
+    help = 'Recalcula saldos a partir das transações e stock a partir dos movimentos e reporta divergências'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Corrige os valores divergentes (por omissão apenas reporta)')
+        parser.add_argument('--only', choices=['balances', 'stock'],
+                            help='Reconcilia apenas saldos ou apenas stock')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Linhas processadas por bloco')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Número máximo de divergências a listar')
+
+    def handle(self, *args, **options):
+        checks = [
+            ('balances', 'Saldos', reconcile_balances),
+            ('stock', 'Stock', reconcile_stock),
+        ]
+        for key, title, reconcile in checks:
+            if options['only'] and options['only'] != key:
+                continue
+
+            started = time.monotonic()
+            try:
+                checked, discrepancies = reconcile(repair=options['repair'], chunk_size=options['chunk_size'])
+            except MissingBaseline:
+                raise CommandError(
+                    'Ainda não há nenhum snapshot de stock: registe um com "compact_stock --snapshot-only" '
+                    'antes de usar --repair no stock.'
+                )
+            elapsed = time.monotonic() - started
+
+            self.stdout.write(f'{title}: {checked} verificados em {elapsed:.1f}s, {len(discrepancies)} divergências.')
+            for d in discrepancies[:options['show']]:
+                self.stdout.write(f'  #{d.pk} {d.label}: atual {d.actual}, esperado {d.expected}')
+            if len(discrepancies) > options['show']:
+                self.stdout.write(f'  ... e mais {len(discrepancies) - options["show"]}')
+
+            if discrepancies and options['repair']:
+                self.stdout.write(self.style.SUCCESS(f'  {len(discrepancies)} corrigidos.'))
+            elif discrepancies:
+                self.stdout.write(self.style.WARNING('  Use --repair para corrigir.'))
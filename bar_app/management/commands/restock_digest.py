@@ -0,0 +1,17 @@
+"""
+Envia ao staff o resumo dos alertas de stock baixo (agendar, p.ex., de hora a hora via cron)
+"""
+from django.core.management.base import BaseCommand
+
+from bar_app.alerts import send_digest
+
+
+class Command(BaseCommand):
+    help = 'Envia por email o resumo dos alertas de stock baixo ainda não notificados'
+
+    def handle(self, *args, **options):
+        sent = send_digest()
+        if sent:
+            self.stdout.write(self.style.SUCCESS(f'Resumo enviado com {sent} alertas.'))
+        else:
+            self.stdout.write('Nada a enviar.')
@@ -0,0 +1,80 @@
+"""
+Worker da fila de tarefas (ver bar_app/jobs.py); podem correr vários em paralelo
+"""
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from bar_app import jobs
+
+
+class Command(BaseCommand):
+    help = 'Processa as tarefas em segundo plano guardadas na base de dados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Tarefas executadas em simultâneo')
+        parser.add_argument('--queues', nargs='+', default=['default'],
+                            help='Filas a processar')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Segundos de espera quando a fila está vazia')
+        parser.add_argument('--once', action='store_true',
+                            help='Processa as tarefas prontas e termina')
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='Apaga no arranque as tarefas concluídas há mais destes dias')
+
+    def handle(self, *args, **options):
+        jobs.load_tasks()
+        self.stopping = False
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        threads = options['threads']
+        self.stdout.write(f'Worker {worker_id}: {threads} threads, filas {", ".join(options["queues"])}.')
+        self.stdout.write(f'{jobs.purge_finished(options["purge_days"])} tarefas antigas apagadas.')
+
+        totals = {'done': 0, 'retry': 0, 'failed': 0}
+        last_requeue = 0
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') as pool:
+            while not self.stopping:
+                if time.monotonic() - last_requeue > 60:
+                    requeued = jobs.requeue_stale()
+                    if requeued:
+                        self.stdout.write(self.style.WARNING(f'{requeued} tarefas abandonadas voltaram à fila.'))
+                    last_requeue = time.monotonic()
+
+                claimed = jobs.claim(worker_id, options['queues'], limit=threads)
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                for job, result in zip(claimed, pool.map(self._run, claimed)):
+                    totals[result] += 1
+                    if result != 'done':
+                        self.stdout.write(self.style.WARNING(f'{job.task} #{job.pk}: {result} (tentativa {job.attempts}/{job.max_attempts})'))
+
+        connections.close_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'{totals["done"]} concluídas, {totals["retry"]} para repetir, {totals["failed"]} falhadas.'
+        ))
+
+    @staticmethod
+    def _run(job):
+        # Cada thread tem a sua ligação à base de dados
+        close_old_connections()
+        try:
+            return jobs.run(job)
+        finally:
+            close_old_connections()
+
+    def _stop(self, signum, frame):
+        # Termina depois das tarefas em curso
+        self.stopping = True
@@ -0,0 +1,267 @@
+"""
+Gera dados sintéticos com volumes de produção (apenas para desenvolvimento e testes de carga)
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from multiprocessing import Pool, cpu_count
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from bar_app import seeding
+from bar_app.models import (
+    Category, Order, OrderItem, Product, Staff, StockMovement, Student,
+    Teacher, Transaction, User
+)
+
+
+# Pedidos gerados por cada tarefa dos processos trabalhadores
+CHUNK_SIZE = 5000
+# Todos os utilizadores gerados têm esta password
+SEED_PASSWORD = 'seed1234'
+
+
+def _cents(value):
+    return Decimal(value).scaleb(-2)
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """Desativa auto_now/auto_now_add para o bulk_create guardar as datas geradas"""
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Gera utilizadores, produtos, pedidos, transações e movimentos de stock sintéticos (determinístico por seed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Semente: a mesma semente gera sempre os mesmos dados')
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--products', type=int, default=300)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=180,
+                            help='Dias de histórico (terminando ontem)')
+        parser.add_argument('--workers', type=int, default=cpu_count(),
+                            help='Processos que geram os pedidos (1 = sem processos extra)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Linhas por insert do bulk_create')
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        if User.objects.filter(username__startswith=f'seed{seed}-').exists():
+            raise CommandError(f'Já existem dados gerados com a semente {seed}; use outra --seed.')
+
+        self.batch_size = options['batch_size']
+        self.tz = timezone.get_current_timezone()
+        self.counts = {}
+        started = time.monotonic()
+
+        with keep_timestamps(User, Product, Order, Transaction, StockMovement):
+            users = self.create_users(seed, options['users'])
+            products = self.create_products(seed, options['products'])
+            spent, sold = self.create_orders(seed, users, products, options)
+            self.create_opening_balances(seed, users, products, spent, sold, options['days'])
+
+        # Os ids foram atribuídos explicitamente: acertar as sequências (PostgreSQL)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Product, Order, OrderItem, Transaction, StockMovement]):
+                cursor.execute(sql)
+
+        elapsed = time.monotonic() - started
+        for label, count in self.counts.items():
+            self.stdout.write(f'{label:<22}{count:>10}')
+        total = sum(self.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} linhas em {elapsed:.1f}s ({total / elapsed:.0f} linhas/s).'
+        ))
+
+    def timed_insert(self, label, model, objs):
+        """bulk_create em lotes, com linhas/segundo por tabela"""
+        started = time.monotonic()
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.counts[label] = self.counts.get(label, 0) + len(objs)
+        return time.monotonic() - started
+
+    def aware(self, value):
+        return timezone.make_aware(value, self.tz)
+
+    def create_users(self, seed, count):
+        """Cria os utilizadores e perfis; devolve [(id, is_priority)] para os pedidos"""
+        password = make_password(SEED_PASSWORD)
+        first_id = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        joined = timezone.now() - timedelta(days=365)
+
+        users, students, teachers, staff = [], [], [], []
+        for index, username, first_name, last_name, user_type, number, extra1, extra2 in seeding.generate_users(seed, 0, count):
+            user_id = first_id + index
+            users.append(User(
+                id=user_id, username=username, first_name=first_name, last_name=last_name,
+                email=f'{username}@escola.pt', password=password, user_type=user_type,
+                created_at=joined, updated_at=joined,
+            ))
+            if user_type == 'aluno':
+                students.append(Student(user_id=user_id, student_number=number, grade=extra1, class_name=extra2))
+            elif user_type == 'professor':
+                teachers.append(Teacher(user_id=user_id, employee_number=number, department=extra1))
+            else:
+                staff.append(Staff(user_id=user_id, employee_number=number, position=extra1))
+
+        with transaction.atomic():
+            elapsed = self.timed_insert('Utilizadores', User, users)
+            elapsed += self.timed_insert('Alunos', Student, students)
+            elapsed += self.timed_insert('Professores', Teacher, teachers)
+            elapsed += self.timed_insert('Funcionários', Staff, staff)
+        self.stdout.write(f'Utilizadores: {count} em {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s)')
+
+        return [(user.id, user.user_type == 'professor') for user in users]
+
+    def create_products(self, seed, count):
+        """Cria categorias e produtos; devolve [(id, preço em cêntimos)]"""
+        categories = {}
+        for name in seeding.CATEGORIES:
+            categories[name], _ = Category.objects.get_or_create(name=name)
+
+        first_id = (Product.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        created = timezone.now() - timedelta(days=365)
+        products = [
+            Product(
+                id=first_id + i, name=name, category=categories[category], price=_cents(price),
+                min_stock=min_stock, stock=0, created_at=created, updated_at=created,
+            )
+            for i, (name, category, price, min_stock) in enumerate(seeding.generate_products(seed, count))
+        ]
+        with transaction.atomic():
+            self.timed_insert('Produtos', Product, products)
+        return [(product.id, int(product.price * 100)) for product in products]
+
+    def create_orders(self, seed, users, products, options):
+        """
+        Gera os pedidos em blocos (em paralelo) e insere-os pela ordem dos blocos.
+        Devolve o total gasto por utilizador e as unidades vendidas por produto.
+        """
+        total = options['orders']
+        first_day = timezone.localdate() - timedelta(days=options['days'])
+        context = {
+            'seed': seed,
+            'first_order_id': (Order.objects.aggregate(last=Max('id'))['last'] or 0) + 1,
+            'total': total,
+            'chunk_size': CHUNK_SIZE,
+            'first_day': first_day,
+            'days': options['days'],
+            'users': users,
+            'products': products,
+        }
+        chunks = range((total + CHUNK_SIZE - 1) // CHUNK_SIZE)
+
+        spent, sold = {}, {}
+        insert_time = 0
+        started = time.monotonic()
+        if options['workers'] > 1:
+            with Pool(options['workers'], initializer=seeding.init_worker, initargs=(context,)) as pool:
+                for rows in pool.imap(seeding.generate_orders, chunks):
+                    insert_time += self.insert_order_chunk(rows, spent, sold)
+        else:
+            for index in chunks:
+                insert_time += self.insert_order_chunk(seeding.generate_orders(index, context), spent, sold)
+
+        elapsed = time.monotonic() - started
+        rows = sum(self.counts.get(label, 0) for label in ('Pedidos', 'Itens', 'Transações', 'Movimentos de stock'))
+        self.stdout.write(
+            f'Pedidos: {rows} linhas em {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f}/s, '
+            f'{insert_time:.1f}s em inserts)'
+        )
+        return spent, sold
+
+    def insert_order_chunk(self, rows, spent, sold):
+        orders, items, transactions, movements = rows
+
+        order_objs = [
+            Order(
+                id=order_id, order_number=number, user_id=user_id, status=status,
+                payment_method=payment_method, total_amount=_cents(total),
+                scheduled_date=scheduled.date(), scheduled_time=scheduled.time(),
+                is_priority=is_priority, created_at=self.aware(created_at), updated_at=self.aware(scheduled),
+            )
+            for order_id, number, user_id, status, payment_method, total, scheduled, is_priority, created_at in orders
+        ]
+        item_objs = [
+            OrderItem(order_id=order_id, product_id=product_id, quantity=quantity,
+                      unit_price=_cents(price), subtotal=_cents(subtotal))
+            for order_id, product_id, quantity, price, subtotal in items
+        ]
+        transaction_objs = []
+        for user_id, transaction_type, amount, description, order_id, created_at in transactions:
+            spent[user_id] = spent.get(user_id, 0) + (amount if transaction_type == 'payment' else -amount)
+            transaction_objs.append(Transaction(
+                user_id=user_id, transaction_type=transaction_type, amount=_cents(amount),
+                description=description, order_id=order_id, created_at=self.aware(created_at),
+            ))
+        movement_objs = []
+        for product_id, movement_type, quantity, reason, order_id, user_id, created_at in movements:
+            sold[product_id] = sold.get(product_id, 0) + (quantity if movement_type == 'out' else -quantity)
+            movement_objs.append(StockMovement(
+                product_id=product_id, movement_type=movement_type, quantity=quantity, reason=reason,
+                order_id=order_id, created_by_id=user_id, created_at=self.aware(created_at),
+            ))
+
+        with transaction.atomic():
+            elapsed = self.timed_insert('Pedidos', Order, order_objs)
+            elapsed += self.timed_insert('Itens', OrderItem, item_objs)
+            elapsed += self.timed_insert('Transações', Transaction, transaction_objs)
+            elapsed += self.timed_insert('Movimentos de stock', StockMovement, movement_objs)
+        return elapsed
+
+    def create_opening_balances(self, seed, users, products, spent, sold, days):
+        """
+        Carregamentos e entradas de stock iniciais, anteriores a todos os pedidos, para que
+        o saldo e o stock finais batam certo com o razão (ver o comando reconcile)
+        """
+        rng = seeding.chunk_random(seed, 'opening', 0)
+        opened = self.aware(datetime.combine(timezone.localdate() - timedelta(days=days + 1), datetime.min.time()))
+
+        balances, topups = [], []
+        for user_id, _ in users:
+            final = rng.randint(0, 4000) // 50 * 50
+            amount = spent.get(user_id, 0) + final
+            balances.append(User(id=user_id, balance=_cents(final)))
+            if amount:
+                topups.append(Transaction(
+                    user_id=user_id, transaction_type='topup', amount=_cents(amount),
+                    description='Carregamento de saldo', created_at=opened,
+                ))
+
+        stocks, entries = [], []
+        for product_id, _ in products:
+            final = rng.randint(0, 150)
+            quantity = sold.get(product_id, 0) + final
+            stocks.append(Product(id=product_id, stock=final))
+            if quantity:
+                entries.append(StockMovement(
+                    product_id=product_id, movement_type='in', quantity=quantity,
+                    reason='Stock inicial', created_at=opened,
+                ))
+
+        with transaction.atomic():
+            self.timed_insert('Transações', Transaction, topups)
+            self.timed_insert('Movimentos de stock', StockMovement, entries)
+            User.objects.bulk_update(balances, ['balance'], batch_size=self.batch_size)
+            Product.objects.bulk_update(stocks, ['stock'], batch_size=self.batch_size)
@@ -0,0 +1,61 @@
+"""
+QuerySets com formas de consulta nomeadas
+Cada forma carrega de uma vez as relações que os templates percorrem (evita N+1)
+"""
+from django.db import models
+
+
+class ProductQuerySet(models.QuerySet):
+    """Consultas de produtos"""
+
+    def for_listing(self):
+        """Listagens que mostram a categoria do produto"""
+        return self.select_related('category')
+
+    def needing_restock(self, horizon_days=None):
+        """
+        Produtos a repor: stock mínimo atingido ou rutura prevista pela última
+        previsão de consumo dentro de `horizon_days` (por omissão RESTOCK_HORIZON_DAYS)
+        """
+        from .forecasting import RESTOCK_HORIZON_DAYS
+        if horizon_days is None:
+            horizon_days = RESTOCK_HORIZON_DAYS
+        return self.select_related('forecast').filter(
+            models.Q(stock__lte=models.F('min_stock'))
+            | models.Q(forecast__days_until_stockout__lte=horizon_days)
+        )
+
+
+class OrderQuerySet(models.QuerySet):
+    """Consultas de pedidos"""
+
+    def for_listing(self):
+        """Listagens que mostram o cliente do pedido"""
+        return self.select_related('user')
+
+    def with_items(self):
+        """Inclui os itens do pedido e respetivos produtos (2 queries no total)"""
+        from .models import OrderItem
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+
+    def for_detail(self):
+        """Detalhe de um pedido: cliente, itens e produtos"""
+        return self.for_listing().with_items()
+
+
+class TransactionQuerySet(models.QuerySet):
+    """Consultas de transações"""
+
+    def for_listing(self):
+        """Listagens que mostram o pedido relacionado"""
+        return self.select_related('order')
+
+
+class StockMovementQuerySet(models.QuerySet):
+    """Consultas de movimentos de stock"""
+
+    def for_listing(self):
+        """Listagens que mostram o produto e quem registou o movimento"""
+        return self.select_related('product', 'created_by')
@@ -0,0 +1,241 @@
+"""
+Métricas no formato de exposição de texto do Prometheus
+Cada thread incrementa o seu próprio dicionário (sem locks); a leitura soma-os todos.
+Com METRICS_DIR definido, cada processo (p.ex. workers do gunicorn) grava periodicamente
+os seus totais num ficheiro e o /metrics soma os ficheiros de todos os processos ainda vivos
+(os ficheiros de processos que já terminaram são apagados; os seus contadores recomeçam,
+como num reinício).
+Nada aqui acede à base de dados.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+# Nome -> (tipo, descrição)
+METRICS = {
+    'bar_http_request_duration_seconds': ('histogram', 'Duração dos pedidos HTTP por URL'),
+    'bar_orders_created_total': ('counter', 'Pedidos criados por estado e método de pagamento'),
+    'bar_orders_cancelled_total': ('counter', 'Pedidos cancelados por estado anterior e método de pagamento'),
+    'bar_topups_total': ('counter', 'Carregamentos de saldo'),
+    'bar_topup_amount_euros_total': ('counter', 'Valor carregado em euros'),
+    'bar_checkout_failures_total': ('counter', 'Falhas no checkout por motivo'),
+    'bar_db_lock_errors_total': ('counter', 'Queries falhadas por base de dados bloqueada'),
+    'bar_db_lock_wait_seconds': ('histogram', 'Tempo das queries SELECT ... FOR UPDATE'),
+    'bar_throttled_total': ('counter', 'Pedidos recusados pela limitação por view e tipo (rate/concurrency)'),
+    'bar_cache_requests_total': ('counter', 'Leituras de cache por cache e resultado (hit/miss)'),
+    'bar_cache_hit_ratio': ('gauge', 'Fração de leituras de cache com sucesso'),
+    'bar_multibanco_references_total': ('counter', 'Referências Multibanco emitidas'),
+    'bar_multibanco_settlements_total': ('counter', 'Pagamentos Multibanco liquidados por finalidade (order/topup)'),
+    'bar_order_status_conflicts_total': ('counter', 'Mudanças de estado de pedidos recusadas por alteração concorrente'),
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_local = threading.local()
+_shards = []
+# Identifica o ficheiro deste processo (o pid sozinho pode ser reutilizado)
+_process_id = f'{os.getpid()}-{time.time_ns()}'
+_last_flush = 0.0
+
+
+def _shard():
+    try:
+        return _local.values
+    except AttributeError:
+        _local.values = values = {}
+        # list.append é atómico; só este thread escreve no seu dicionário
+        _shards.append(values)
+        return values
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, value=1, **labels):
+    """Incrementa um contador (`value` int ou float: os totais são gravados em JSON)"""
+    values = _shard()
+    key = _key(name, labels)
+    values[key] = values.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Regista uma observação (em segundos) num histograma com os buckets LATENCY_BUCKETS"""
+    values = _shard()
+    le = next((str(bucket) for bucket in LATENCY_BUCKETS if value <= bucket), '+Inf')
+    for key, amount in (
+        (_key(f'{name}_bucket', {**labels, 'le': le}), 1),
+        (_key(f'{name}_sum', labels), value),
+        (_key(f'{name}_count', labels), 1),
+    ):
+        values[key] = values.get(key, 0) + amount
+
+
+def cache_lookup(cache_name, hit):
+    inc('bar_cache_requests_total', cache=cache_name, result='hit' if hit else 'miss')
+
+
+def snapshot():
+    """Totais deste processo"""
+    totals = {}
+    for shard in list(_shards):
+        # dict.copy é uma operação atómica; evita erros se o thread dono inserir uma chave
+        for key, value in shard.copy().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+# ----------------------------------------------------------------------
+# Agregação entre processos
+# ----------------------------------------------------------------------
+
+def _metrics_dir():
+    return Path(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+
+def flush():
+    """Grava os totais deste processo em METRICS_DIR (escrita atómica)"""
+    global _last_flush
+    directory = _metrics_dir()
+    if directory is None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = [[name, list(labels), value] for (name, labels), value in snapshot().items()]
+    tmp = directory / f'.{_process_id}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(rows, f)
+    os.replace(tmp, directory / f'{_process_id}.json')
+    _last_flush = time.monotonic()
+
+
+def maybe_flush():
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+atexit.register(flush)
+
+
+def _is_alive(process_id):
+    """O processo que gravou o ficheiro `process_id` ('<pid>-<arranque>') ainda existe nesta máquina?"""
+    try:
+        os.kill(int(process_id.split('-')[0]), 0)
+    except ProcessLookupError:
+        return False
+    except (ValueError, OSError):
+        # PermissionError: existe, mas é de outro utilizador
+        return True
+    return True
+
+
+def collect():
+    """Totais de todos os processos: ficheiros dos outros + valores em memória deste"""
+    totals = snapshot()
+    directory = _metrics_dir()
+    if directory is None or not directory.exists():
+        return totals
+    for path in directory.glob('*.json'):
+        if path.stem == _process_id:
+            continue
+        if not _is_alive(path.stem):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in rows:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+# ----------------------------------------------------------------------
+# Exposição
+# ----------------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _base_name(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def _cumulative_buckets(totals):
+    """Os buckets são guardados individualmente; o formato exige contagens cumulativas"""
+    series = {}
+    for (name, labels), value in totals.items():
+        if name.endswith('_bucket'):
+            le = dict(labels)['le']
+            rest = tuple(pair for pair in labels if pair[0] != 'le')
+            series.setdefault((name, rest), {})[le] = value
+
+    result = {}
+    for (name, rest), counts in series.items():
+        running = 0
+        for bucket in [str(b) for b in LATENCY_BUCKETS] + ['+Inf']:
+            running += counts.get(bucket, 0)
+            result[(name, rest + (('le', bucket),))] = running
+    return result
+
+
+def _hit_ratios(totals):
+    lookups = {}
+    for (name, labels), value in totals.items():
+        if name == 'bar_cache_requests_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    return {
+        ('bar_cache_hit_ratio', (('cache', cache),)): round(hits / total, 4)
+        for cache, (hits, total) in lookups.items() if total
+    }
+
+
+_BUCKET_ORDER = {bucket: i for i, bucket in enumerate([str(b) for b in LATENCY_BUCKETS] + ['+Inf'])}
+
+
+def _sort_key(row):
+    name, labels, _ = row
+    le = dict(labels).get('le')
+    return name, tuple(pair for pair in labels if pair[0] != 'le'), _BUCKET_ORDER.get(le, 0)
+
+
+def render():
+    """Texto no formato de exposição do Prometheus (version=0.0.4)"""
+    totals = collect()
+    totals = {
+        **{key: value for key, value in totals.items() if not key[0].endswith('_bucket')},
+        **_cumulative_buckets(totals),
+        **_hit_ratios(totals),
+    }
+
+    by_metric = {}
+    for (name, labels), value in totals.items():
+        by_metric.setdefault(_base_name(name), []).append((name, labels, value))
+
+    lines = []
+    for metric in sorted(by_metric):
+        kind, description = METRICS.get(metric, ('untyped', ''))
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, labels, value in sorted(by_metric[metric], key=_sort_key):
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -1,10 +1,20 @@
 """
-Middleware customizado para prevenir conflitos de sessão
+Middleware customizado para prevenir conflitos de sessão, profiling, métricas e limitação de pedidos
 """
-from django.shortcuts import redirect
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, connection
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
 from django.contrib import messages
 from django.urls import reverse
 
+from . import metrics, profiling, throttling
+
 
 class AdminAccessMiddleware:
     """
@@ -27,3 +37,134 @@ class AdminAccessMiddleware:
         
         response = self.get_response(request)
         return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiling por amostragem (ver bar_app.profiling).
+    Perfila uma fração PROFILING_SAMPLE_RATE dos pedidos e, para staff, qualquer pedido
+    com o parâmetro ?profile=1 ou o cabeçalho X-Profile: 1.
+    Desligado (PROFILING_ENABLED=False) o middleware nem é carregado.
+    """
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+
+    def _wants_profile(self, request):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        # Só consulta o utilizador (e a sessão) se o pedido trouxer a flag
+        if request.GET.get('profile') == '1' or request.headers.get('X-Profile') == '1':
+            return request.user.is_staff
+        return False
+
+    def __call__(self, request):
+        if not self._wants_profile(request):
+            return self.get_response(request)
+
+        sampler = profiling.StackSampler(self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - started
+
+        samples = sum(sampler.stacks.values())
+        name = profiling.save_profile(profiling.profile_meta(request, response, duration, samples), sampler.stacks)
+        response['X-Profile-Id'] = name
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Regista a duração de cada pedido por URL e o tempo das queries com lock
+    (ver bar_app.metrics). Deve ser o primeiro middleware para medir o pedido inteiro.
+    """
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with connection.execute_wrapper(self._observe_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe(
+            'bar_http_request_duration_seconds', duration,
+            url_name=match.view_name if match else 'sem-rota', method=request.method,
+        )
+        metrics.maybe_flush()
+        return response
+
+    @staticmethod
+    def _observe_query(execute, sql, params, many, context):
+        locking = 'FOR UPDATE' in sql
+        started = time.perf_counter() if locking else None
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as exc:
+            if 'locked' in str(exc) or 'lock timeout' in str(exc) or 'deadlock' in str(exc):
+                metrics.inc('bar_db_lock_errors_total')
+            raise
+        finally:
+            if locking:
+                metrics.observe('bar_db_lock_wait_seconds', time.perf_counter() - started)
+
+
+class ThrottleMiddleware:
+    """
+    Limita os pedidos de cada cliente às views de THROTTLE_RATES e o nº de checkouts
+    em simultâneo (ver bar_app.throttling). Desligado (THROTTLE_ENABLED=False) o middleware nem é carregado.
+    """
+    def __init__(self, get_response):
+        if not settings.THROTTLE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rates = settings.THROTTLE_RATES
+        self.checkout_views = set(settings.CHECKOUT_CONCURRENCY_VIEWS)
+        self.max_concurrent = settings.CHECKOUT_MAX_CONCURRENT
+        self.queue_timeout = settings.CHECKOUT_QUEUE_TIMEOUT
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            slot = getattr(request, '_throttle_slot', None)
+            if slot is not None:
+                throttling.release_slot(slot)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = request.resolver_match.view_name
+
+        rate = self.rates.get(name)
+        if rate:
+            allowed, wait = throttling.allow(name, throttling.client_key(request), rate)
+            if not allowed:
+                metrics.inc('bar_throttled_total', view=name, kind='rate')
+                return self._reject(request, 'Demasiados pedidos seguidos. Aguarde uns segundos e tente novamente.', wait)
+
+        if request.method == 'POST' and name in self.checkout_views and self.max_concurrent:
+            slot = throttling.acquire_slot('checkout', self.max_concurrent, self.queue_timeout)
+            if slot is None:
+                metrics.inc('bar_throttled_total', view=name, kind='concurrency')
+                return self._reject(request, 'O bar está com muitos pedidos neste momento. Tente novamente dentro de instantes.', 1)
+            request._throttle_slot = slot
+        return None
+
+    @staticmethod
+    def _reject(request, message, wait):
+        # Página própria (e não um redirect): um ciclo de reloads não pode virar um ciclo de redirects
+        if (request.resolver_match.url_name or '').startswith('api_'):
+            response = JsonResponse({'error': message, 'reason': 'throttled'}, status=429)
+        else:
+            response = render(request, 'bar_app/throttled.html', {'message': message}, status=429)
+        response['Retry-After'] = str(max(1, math.ceil(wait)))
+        return response
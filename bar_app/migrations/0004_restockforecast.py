@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0003_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestockForecast',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast', serialize=False, to='bar_app.product', verbose_name='Produto')),
+                ('daily_rate', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Consumo Médio Diário')),
+                ('weekday_rates', models.JSONField(default=list, verbose_name='Consumo por Dia da Semana')),
+                ('days_until_stockout', models.IntegerField(blank=True, null=True, verbose_name='Dias até Rutura')),
+                ('suggested_reorder', models.IntegerField(default=0, verbose_name='Quantidade Sugerida')),
+                ('computed_at', models.DateTimeField(verbose_name='Calculado em')),
+            ],
+            options={
+                'verbose_name': 'Previsão de Reabastecimento',
+                'verbose_name_plural': 'Previsões de Reabastecimento',
+                'ordering': ['days_until_stockout'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0004_restockforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedStockMovement',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('movement_type', models.CharField(choices=[('in', 'Entrada'), ('out', 'Saída'), ('adjustment', 'Ajuste')], max_length=15, verbose_name='Tipo de Movimento')),
+                ('quantity', models.IntegerField(verbose_name='Quantidade')),
+                ('reason', models.CharField(max_length=200, verbose_name='Razão')),
+                ('created_at', models.DateTimeField(verbose_name='Criado em')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bar_app.order', verbose_name='Pedido Relacionado')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_movements', to='bar_app.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Movimento de Stock Arquivado',
+                'verbose_name_plural': 'Movimentos de Stock Arquivados',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', '-created_at'], name='archmov_product_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Stock')),
+                ('taken_at', models.DateTimeField(verbose_name='Registado em')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='bar_app.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Stock',
+                'verbose_name_plural': 'Snapshots de Stock',
+                'ordering': ['-taken_at'],
+                'indexes': [models.Index(fields=['product', '-taken_at'], name='stocksnap_product_taken_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0005_stock_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('school_year', models.CharField(db_index=True, max_length=9, verbose_name='Ano Letivo')),
+                ('order_number', models.CharField(db_index=True, max_length=20, verbose_name='Nº Pedido')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('confirmed', 'Confirmado'), ('preparing', 'Em Preparação'), ('ready', 'Pronto'), ('delivered', 'Entregue'), ('cancelled', 'Cancelado')], max_length=20, verbose_name='Estado')),
+                ('payment_method', models.CharField(choices=[('card', 'Cartão Pré-carregado'), ('atm', 'Multibanco')], max_length=10, verbose_name='Método de Pagamento')),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor Total')),
+                ('scheduled_date', models.DateField(verbose_name='Data Agendada')),
+                ('scheduled_time', models.TimeField(verbose_name='Hora Agendada')),
+                ('notes', models.TextField(blank=True, verbose_name='Notas')),
+                ('is_priority', models.BooleanField(default=False, verbose_name='Prioridade')),
+                ('created_at', models.DateTimeField(verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(verbose_name='Atualizado em')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Pedido Arquivado',
+                'verbose_name_plural': 'Pedidos Arquivados',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField(verbose_name='Quantidade')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Preço Unitário')),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Subtotal')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='bar_app.archivedorder', verbose_name='Pedido')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='bar_app.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Item de Pedido Arquivado',
+                'verbose_name_plural': 'Itens de Pedidos Arquivados',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('school_year', models.CharField(db_index=True, max_length=9, verbose_name='Ano Letivo')),
+                ('transaction_type', models.CharField(choices=[('topup', 'Carregamento'), ('payment', 'Pagamento'), ('refund', 'Reembolso')], max_length=10, verbose_name='Tipo de Transação')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor')),
+                ('order_number', models.CharField(blank=True, max_length=20, verbose_name='Nº Pedido')),
+                ('description', models.CharField(max_length=200, verbose_name='Descrição')),
+                ('created_at', models.DateTimeField(verbose_name='Criado em')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Transação Arquivada',
+                'verbose_name_plural': 'Transações Arquivadas',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-created_at'], name='archorder_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['user', 'school_year', '-created_at'], name='archtx_user_year_created_idx'),
+        ),
+    ]
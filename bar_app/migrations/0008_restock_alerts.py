@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0007_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Stock')),
+                ('min_stock', models.IntegerField(verbose_name='Stock Mínimo')),
+                ('source', models.CharField(choices=[('checkout', 'Venda'), ('cancel', 'Cancelamento'), ('admin', 'Admin')], max_length=10, verbose_name='Origem')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Criado em')),
+                ('resolved_at', models.DateTimeField(blank=True, null=True, verbose_name='Resolvido em')),
+                ('notified_at', models.DateTimeField(blank=True, null=True, verbose_name='Notificado em')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restock_alerts', to='bar_app.product', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Alerta de Stock',
+                'verbose_name_plural': 'Alertas de Stock',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['notified_at'], name='restockalert_notified_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('product',), name='restockalert_one_open_per_product')],
+            },
+        ),
+    ]
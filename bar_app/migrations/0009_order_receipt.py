@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0008_restock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='receipt',
+            field=models.FileField(blank=True, editable=False, upload_to='receipts/%Y/%m/', verbose_name='Recibo'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0010_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nome')),
+                ('key_hash', models.CharField(editable=False, max_length=64, unique=True, verbose_name='Hash do Token')),
+                ('cart', models.JSONField(blank=True, default=dict, verbose_name='Carrinho')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Ativo')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Token da API',
+                'verbose_name_plural': 'Tokens da API',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:47
+
+import django.core.validators
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+
+
+def backfill_counters(apps, schema_editor):
+    """Contadores iniciais a partir dos pedidos e transações (ativos e arquivados), por utilizador"""
+    SpendingCounter = apps.get_model('bar_app', 'SpendingCounter')
+    today = timezone.localdate()
+    month = today.replace(day=1)
+    day_start = timezone.make_aware(datetime.combine(today, time.min))
+    month_start = timezone.make_aware(datetime.combine(month, time.min))
+
+    counters = defaultdict(lambda: {'order_count': 0, 'lifetime': Decimal('0'), 'month': Decimal('0'), 'day': Decimal('0')})
+    for model_name in ('Order', 'ArchivedOrder'):
+        rows = apps.get_model('bar_app', model_name).objects.values('user').annotate(total=Count('id')).order_by()
+        for row in rows:
+            counters[row['user']]['order_count'] += row['total']
+
+    # Pagamentos menos reembolsos; os reembolsos antigos foram gravados como carregamentos com pedido
+    for model_name, refund_as_topup in (
+        ('Transaction', Q(transaction_type='topup', order__isnull=False)),
+        ('ArchivedTransaction', Q(transaction_type='topup') & ~Q(order_number='')),
+    ):
+        signed = Case(
+            When(transaction_type='payment', then=F('amount')),
+            When(Q(transaction_type='refund') | refund_as_topup, then=-F('amount')),
+            default=Value(0),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+        rows = apps.get_model('bar_app', model_name).objects.values('user').annotate(
+            lifetime=Sum(signed),
+            month=Sum(signed, filter=Q(created_at__gte=month_start)),
+            day=Sum(signed, filter=Q(created_at__gte=day_start)),
+        ).order_by()
+        for row in rows:
+            for field in ('lifetime', 'month', 'day'):
+                # Em SQLite as somas de decimais chegam como float
+                counters[row['user']][field] += Decimal(str(row[field] or 0))
+
+    cent = Decimal('0.01')
+    SpendingCounter.objects.bulk_create([
+        SpendingCounter(
+            user_id=user_id,
+            day=today,
+            daily_spent=max(values['day'], 0).quantize(cent),
+            month=month,
+            monthly_spent=max(values['month'], 0).quantize(cent),
+            lifetime_spent=values['lifetime'].quantize(cent),
+            order_count=values['order_count'],
+        )
+        for user_id, values in counters.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0011_api_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='spending', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+                ('daily_limit', models.DecimalField(blank=True, decimal_places=2, help_text='Máximo a gastar do saldo por dia (vazio = sem limite)', max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))], verbose_name='Limite Diário')),
+                ('day', models.DateField(blank=True, editable=False, null=True, verbose_name='Dia')),
+                ('daily_spent', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Gasto no Dia')),
+                ('month', models.DateField(blank=True, editable=False, null=True, verbose_name='Mês')),
+                ('monthly_spent', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Gasto no Mês')),
+                ('lifetime_spent', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Gasto')),
+                ('order_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Nº de Pedidos')),
+            ],
+            options={
+                'verbose_name': 'Contador de Gastos',
+                'verbose_name_plural': 'Contadores de Gastos',
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
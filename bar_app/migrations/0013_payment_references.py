@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0012_spending_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=5, verbose_name='Entidade')),
+                ('reference', models.CharField(max_length=9, verbose_name='Referência')),
+                ('sequence', models.PositiveBigIntegerField(editable=False, unique=True, verbose_name='Sequência')),
+                ('purpose', models.CharField(choices=[('order', 'Pedido'), ('topup', 'Carregamento')], max_length=10, verbose_name='Finalidade')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor')),
+                ('status', models.CharField(choices=[('pending', 'Por Pagar'), ('paid', 'Paga')], default='pending', max_length=10, verbose_name='Estado')),
+                ('expires_at', models.DateTimeField(verbose_name='Válida até')),
+                ('paid_at', models.DateTimeField(blank=True, null=True, verbose_name='Paga em')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_reference', to='bar_app.order', verbose_name='Pedido')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_references', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Referência Multibanco',
+                'verbose_name_plural': 'Referências Multibanco',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'entity'], name='payment_reference_status_idx'), models.Index(fields=['user', 'status'], name='payment_reference_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('entity', 'reference'), name='payment_reference_unique')],
+            },
+        ),
+    ]
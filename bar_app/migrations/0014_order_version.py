@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bar_app', '0013_payment_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Versão'),
+        ),
+    ]
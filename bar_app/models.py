@@ -2,11 +2,16 @@
 Modelos do sistema de gestão do bar escolar
 Implementa herança de utilizadores e gestão de pedidos
 """
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from decimal import Decimal
 from datetime import datetime
+import hashlib
+import secrets
+
+from .managers import ProductQuerySet, OrderQuerySet, TransactionQuerySet, StockMovementQuerySet
 
 
 class User(AbstractUser):
@@ -126,6 +131,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
     
+    objects = ProductQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Produto" 
         verbose_name_plural = "Produtos" 
@@ -161,6 +168,19 @@ class Order(models.Model):
         ('atm', 'Multibanco'),
     )
     
+    # Máquina de estados: transições permitidas a partir de cada estado ('delivered' e 'cancelled' são finais).
+    # As mudanças de estado passam por services.transition_order (UPDATE condicional com `version`).
+    TRANSITIONS = {
+        'pending': ('confirmed', 'cancelled'),
+        'confirmed': ('preparing', 'cancelled'),
+        'preparing': ('ready', 'cancelled'),
+        'ready': ('delivered', 'cancelled'),
+        'delivered': (),
+        'cancelled': (),
+    }
+    # Estados em que o próprio cliente ainda pode cancelar (antes de a preparação começar)
+    CUSTOMER_CANCELLABLE = ('pending', 'confirmed')
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', verbose_name='Utilizador')
     order_number = models.CharField(max_length=20, unique=True, editable=False, verbose_name='Nº Pedido')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Estado')
@@ -170,18 +190,48 @@ class Order(models.Model):
     scheduled_time = models.TimeField(verbose_name='Hora Agendada')
     notes = models.TextField(blank=True, verbose_name='Notas')
     is_priority = models.BooleanField(default=False, verbose_name='Prioridade')
+    receipt = models.FileField(upload_to='receipts/%Y/%m/', blank=True, editable=False, verbose_name='Recibo')
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False, verbose_name='Chave de Idempotência')
+    # Incrementada a cada mudança de estado (concorrência otimista)
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name='Versão')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
     
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Pedido" 
         verbose_name_plural = "Pedidos" 
         ordering = ['-is_priority', 'scheduled_date', 'scheduled_time', 'created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['scheduled_date', 'scheduled_time'], name='order_scheduled_idx'),
+            models.Index(fields=['status'], name='order_status_idx'),
+        ]
     
     def __str__(self):
         return f"Pedido {self.order_number} - {self.user.username}"
     
-    # ... (métodos save, calculate_total, can_be_cancelled)
+    @staticmethod
+    def generate_order_number():
+        """Número aleatório por dia (AAAAMMDD-NNNNNN); colisões são tratadas pelo retry do checkout"""
+        return f"{timezone.localdate():%Y%m%d}-{secrets.randbelow(10 ** 6):06d}"
+    
+    def save(self, *args, **kwargs):
+        if not self.order_number:
+            self.order_number = self.generate_order_number()
+        super().save(*args, **kwargs)
+    
+    def allowed_transitions(self):
+        return self.TRANSITIONS.get(self.status, ())
+    
+    def can_transition_to(self, status):
+        return status in self.allowed_transitions()
+    
+    def can_be_cancelled(self):
+        """O cliente pode cancelar o pedido?"""
+        return self.status in self.CUSTOMER_CANCELLABLE
 
 
 class OrderItem(models.Model):
@@ -222,32 +272,52 @@ class Transaction(models.Model):
     description = models.CharField(max_length=200, verbose_name='Descrição')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     
+    objects = TransactionQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Transação" 
         verbose_name_plural = "Transações" 
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='transaction_user_created_idx'),
+            models.Index(fields=['-created_at'], name='transaction_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_transaction_type_display()} - €{self.amount} - {self.user.username}"
     
+    def balance_delta(self):
+        """Efeito da transação no saldo: carregamentos/reembolsos somam, pagamentos subtraem"""
+        if self.transaction_type in ('topup', 'refund'):
+            return self.amount
+        if self.transaction_type == 'payment':
+            return -self.amount
+        return Decimal('0')
+    
     # 🛑 CORREÇÃO CRUCIAL: Atualizar o saldo do utilizador ao guardar a transação 🛑
     def save(self, *args, **kwargs):
         # Verifica se o objeto está a ser criado (e não atualizado)
         if self.pk is None:
             # Obtém o utilizador para atualização
             user_to_update = self.user
+            delta = self.balance_delta()
             
-            # Ajusta o saldo do utilizador: aumenta em carregamento/reembolso, diminui em pagamento
-            if self.transaction_type == 'topup' or self.transaction_type == 'refund':
-                user_to_update.balance += self.amount
-            elif self.transaction_type == 'payment':
-                user_to_update.balance -= self.amount
+            # Transação e saldo no mesmo commit (o resumo em cache é invalidado depois dele);
+            # dentro de uma transação já aberta não cria savepoint
+            with transaction.atomic(savepoint=False):
+                # 1. Guarda a Transação na DB
+                super().save(*args, **kwargs)
+                
+                # 2. Atualiza o saldo na DB de forma atómica (UPDATE ... SET balance = balance + delta),
+                #    sem reescrever o resto da linha nem perder atualizações concorrentes.
+                #    Esta é a ÚNICA forma de alterar o saldo: as views não mexem em user.balance.
+                User.objects.filter(pk=user_to_update.pk).update(
+                    balance=models.F('balance') + delta,
+                    updated_at=timezone.now(),
+                )
             
-            # 1. Guarda a Transação na DB
-            super().save(*args, **kwargs)
-            
-            # 2. Guarda o Utilizador com o saldo atualizado
-            user_to_update.save()
+            # 3. Mantém o objeto em memória coerente com a DB
+            user_to_update.balance += delta
             return
             
         # Se for uma atualização de uma transação existente, apenas guarda a transação.
@@ -272,10 +342,341 @@ class StockMovement(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name='Criado por')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
     
+    objects = StockMovementQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Movimento de Stock" 
         verbose_name_plural = "Movimentos de Stock" 
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='stockmov_product_created_idx'),
+            models.Index(fields=['-created_at'], name='stockmov_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.get_movement_type_display()} - {self.quantity}"
+
+class ArchivedOrder(models.Model):
+    """
+    Pedido de um ano letivo fechado, retirado da tabela principal pelo arquivo anual.
+    Mantém o id original para que o arquivo possa ser repetido sem duplicados.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    school_year = models.CharField(max_length=9, db_index=True, verbose_name='Ano Letivo')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders', verbose_name='Utilizador')
+    order_number = models.CharField(max_length=20, db_index=True, verbose_name='Nº Pedido')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Estado')
+    payment_method = models.CharField(max_length=10, choices=Order.PAYMENT_METHOD_CHOICES, verbose_name='Método de Pagamento')
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Valor Total')
+    scheduled_date = models.DateField(verbose_name='Data Agendada')
+    scheduled_time = models.TimeField(verbose_name='Hora Agendada')
+    notes = models.TextField(blank=True, verbose_name='Notas')
+    is_priority = models.BooleanField(default=False, verbose_name='Prioridade')
+    created_at = models.DateTimeField(verbose_name='Criado em')
+    updated_at = models.DateTimeField(verbose_name='Atualizado em')
+    
+    class Meta:
+        verbose_name = "Pedido Arquivado" 
+        verbose_name_plural = "Pedidos Arquivados" 
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archorder_user_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Pedido {self.order_number} ({self.school_year})"
+
+
+class ArchivedOrderItem(models.Model):
+    """
+    Item de um pedido arquivado
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items', verbose_name='Pedido')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='Produto')
+    quantity = models.IntegerField(verbose_name='Quantidade')
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Preço Unitário')
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Subtotal')
+    
+    class Meta:
+        verbose_name = "Item de Pedido Arquivado" 
+        verbose_name_plural = "Itens de Pedidos Arquivados" 
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.product.name}"
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Transação de um ano letivo fechado. O pedido relacionado fica apenas pelo número.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    school_year = models.CharField(max_length=9, db_index=True, verbose_name='Ano Letivo')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_transactions', verbose_name='Utilizador')
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPE_CHOICES, verbose_name='Tipo de Transação')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Valor')
+    order_number = models.CharField(max_length=20, blank=True, verbose_name='Nº Pedido')
+    description = models.CharField(max_length=200, verbose_name='Descrição')
+    created_at = models.DateTimeField(verbose_name='Criado em')
+    
+    class Meta:
+        verbose_name = "Transação Arquivada" 
+        verbose_name_plural = "Transações Arquivadas" 
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'school_year', '-created_at'], name='archtx_user_year_created_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.product.name} - {self.get_movement_type_display()} - {self.quantity}"
\ No newline at end of file
+        return f"{self.get_transaction_type_display()} - €{self.amount} ({self.school_year})"
+
+class StockSnapshot(models.Model):
+    """
+    Ponto de controlo do stock de um produto num dado momento
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots', verbose_name='Produto')
+    stock = models.IntegerField(verbose_name='Stock')
+    taken_at = models.DateTimeField(verbose_name='Registado em')
+    
+    class Meta:
+        verbose_name = "Snapshot de Stock" 
+        verbose_name_plural = "Snapshots de Stock" 
+        ordering = ['-taken_at']
+        indexes = [
+            models.Index(fields=['product', '-taken_at'], name='stocksnap_product_taken_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.stock} ({self.taken_at:%d/%m/%Y %H:%M})"
+
+
+class ArchivedStockMovement(models.Model):
+    """
+    Movimento de stock antigo, retirado da tabela principal pela compactação.
+    Mantém o id original para que a compactação possa ser repetida sem duplicados.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_movements', verbose_name='Produto')
+    movement_type = models.CharField(max_length=15, choices=StockMovement.MOVEMENT_TYPE_CHOICES, verbose_name='Tipo de Movimento')
+    quantity = models.IntegerField(verbose_name='Quantidade')
+    reason = models.CharField(max_length=200, verbose_name='Razão')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Pedido Relacionado')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name='Criado por')
+    created_at = models.DateTimeField(verbose_name='Criado em')
+    
+    class Meta:
+        verbose_name = "Movimento de Stock Arquivado" 
+        verbose_name_plural = "Movimentos de Stock Arquivados" 
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='archmov_product_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.get_movement_type_display()} - {self.quantity}"
+
+class RestockForecast(models.Model):
+    """
+    Previsão de consumo de um produto (recalculada em lote pelo comando compute_forecasts)
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='forecast', verbose_name='Produto')
+    daily_rate = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Consumo Médio Diário')
+    weekday_rates = models.JSONField(default=list, verbose_name='Consumo por Dia da Semana')
+    days_until_stockout = models.IntegerField(null=True, blank=True, verbose_name='Dias até Rutura')
+    suggested_reorder = models.IntegerField(default=0, verbose_name='Quantidade Sugerida')
+    computed_at = models.DateTimeField(verbose_name='Calculado em')
+    
+    class Meta:
+        verbose_name = "Previsão de Reabastecimento" 
+        verbose_name_plural = "Previsões de Reabastecimento" 
+        ordering = ['days_until_stockout']
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.daily_rate}/dia"
+
+
+class Job(models.Model):
+    """
+    Tarefa em segundo plano (fila guardada na base de dados, processada pelo comando run_worker)
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pendente'),
+        ('running', 'Em Execução'),
+        ('done', 'Concluída'),
+        ('failed', 'Falhada'),
+    )
+    
+    queue = models.CharField(max_length=50, default='default', verbose_name='Fila')
+    task = models.CharField(max_length=100, verbose_name='Tarefa')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Argumentos')
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True, verbose_name='Chave de Idempotência')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Estado')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Tentativas')
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name='Máximo de Tentativas')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Executar a partir de')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Reservada por')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Reservada em')
+    last_error = models.TextField(blank=True, verbose_name='Último Erro')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criada em')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Terminada em')
+    
+    class Meta:
+        verbose_name = "Tarefa" 
+        verbose_name_plural = "Tarefas" 
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['queue', 'status', 'run_at'], name='job_queue_status_run_idx'),
+            models.Index(fields=['locked_by'], name='job_locked_by_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+
+class RestockAlert(models.Model):
+    """
+    Produto que desceu ao stock mínimo (um alerta por cruzamento do limite).
+    Fica aberto até o stock voltar a subir acima do mínimo; entra no próximo resumo enviado ao staff.
+    """
+    SOURCE_CHOICES = (
+        ('checkout', 'Venda'),
+        ('cancel', 'Cancelamento'),
+        ('admin', 'Admin'),
+    )
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='restock_alerts', verbose_name='Produto')
+    stock = models.IntegerField(verbose_name='Stock')
+    min_stock = models.IntegerField(verbose_name='Stock Mínimo')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, verbose_name='Origem')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Criado em')
+    resolved_at = models.DateTimeField(null=True, blank=True, verbose_name='Resolvido em')
+    notified_at = models.DateTimeField(null=True, blank=True, verbose_name='Notificado em')
+    
+    class Meta:
+        verbose_name = "Alerta de Stock" 
+        verbose_name_plural = "Alertas de Stock" 
+        ordering = ['-created_at']
+        constraints = [
+            # No máximo um alerta aberto por produto
+            models.UniqueConstraint(fields=['product'], condition=models.Q(resolved_at__isnull=True), name='restockalert_one_open_per_product'),
+        ]
+        indexes = [
+            models.Index(fields=['notified_at'], name='restockalert_notified_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.stock}/{self.min_stock}"
+
+
+class ApiToken(models.Model):
+    """
+    Token de acesso à API JSON (quiosques, aplicações móveis).
+    Só o hash SHA-256 é guardado; o token em claro é mostrado uma única vez ao ser criado.
+    Clientes com token não têm sessão, por isso o carrinho fica no próprio token.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens', verbose_name='Utilizador')
+    name = models.CharField(max_length=100, verbose_name='Nome')
+    key_hash = models.CharField(max_length=64, unique=True, editable=False, verbose_name='Hash do Token')
+    cart = models.JSONField(default=dict, blank=True, verbose_name='Carrinho')
+    is_active = models.BooleanField(default=True, verbose_name='Ativo')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    
+    class Meta:
+        verbose_name = "Token da API" 
+        verbose_name_plural = "Tokens da API" 
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.name} - {self.user.username}"
+    
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    @classmethod
+    def create_token(cls, user, name):
+        """Cria um token e devolve (token, chave em claro)"""
+        key = secrets.token_urlsafe(32)
+        return cls.objects.create(user=user, name=name, key_hash=cls.hash_key(key)), key
+
+
+class SpendingCounter(models.Model):
+    """
+    Gastos de um utilizador mantidos incrementalmente (sem SUM sobre as transações no checkout).
+    Atualizado por bar_app.spending com um UPDATE condicional no mesmo commit do pagamento.
+    A mudança de dia e de mês é feita por esse UPDATE: gastos de um dia/mês anterior contam como 0.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='spending', verbose_name='Utilizador')
+    daily_limit = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        validators=[MinValueValidator(Decimal('0.00'))],
+        verbose_name='Limite Diário', help_text='Máximo a gastar do saldo por dia (vazio = sem limite)'
+    )
+    day = models.DateField(null=True, blank=True, editable=False, verbose_name='Dia')
+    daily_spent = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False, verbose_name='Gasto no Dia')
+    month = models.DateField(null=True, blank=True, editable=False, verbose_name='Mês')
+    monthly_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name='Gasto no Mês')
+    lifetime_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name='Total Gasto')
+    order_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Nº de Pedidos')
+    
+    class Meta:
+        verbose_name = "Contador de Gastos" 
+        verbose_name_plural = "Contadores de Gastos" 
+    
+    def __str__(self):
+        return f"Gastos - {self.user.username}"
+    
+    def spent_on(self, day):
+        return self.daily_spent if self.day == day else Decimal('0.00')
+    
+    def spent_in_month(self, day):
+        return self.monthly_spent if self.month == day.replace(day=1) else Decimal('0.00')
+
+
+class PaymentReference(models.Model):
+    """
+    Referência Multibanco (entidade + referência de 9 dígitos) de um pedido pago por
+    Multibanco ou de um carregamento de saldo. Gerada por bar_app.multibanco e liquidada
+    pelo comando import_multibanco a partir do extrato do banco.
+    """
+    PURPOSE_CHOICES = (
+        ('order', 'Pedido'),
+        ('topup', 'Carregamento'),
+    )
+    
+    STATUS_CHOICES = (
+        ('pending', 'Por Pagar'),
+        ('paid', 'Paga'),
+    )
+    
+    entity = models.CharField(max_length=5, verbose_name='Entidade')
+    reference = models.CharField(max_length=9, verbose_name='Referência')
+    sequence = models.PositiveBigIntegerField(unique=True, editable=False, verbose_name='Sequência')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_references', verbose_name='Utilizador')
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_reference', verbose_name='Pedido')
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES, verbose_name='Finalidade')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Valor')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Estado')
+    expires_at = models.DateTimeField(verbose_name='Válida até')
+    paid_at = models.DateTimeField(null=True, blank=True, verbose_name='Paga em')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criada em')
+    
+    class Meta:
+        verbose_name = "Referência Multibanco" 
+        verbose_name_plural = "Referências Multibanco" 
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['entity', 'reference'], name='payment_reference_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'entity'], name='payment_reference_status_idx'),
+            models.Index(fields=['user', 'status'], name='payment_reference_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.entity} {self.formatted_reference} - €{self.amount}"
+    
+    @property
+    def formatted_reference(self):
+        """Referência como aparece no multibanco: 123 456 789"""
+        return f"{self.reference[:3]} {self.reference[3:6]} {self.reference[6:]}"
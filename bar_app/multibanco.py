@@ -0,0 +1,282 @@
+"""
+Referências Multibanco: geração em bulk e liquidação a partir do extrato do banco
+
+Referência = 7 dígitos de uma sequência + 2 dígitos de controlo, calculados como nos
+processadores de pagamentos (ISO 7064 MOD 97-10 sobre entidade, sequência e montante em
+cêntimos): uma referência só é válida para o seu montante e erros de digitação são detetados.
+
+A liquidação lê o extrato inteiro, carrega as referências por pagar num dicionário
+{(entidade, referência): linha} (uma query) e resolve cada pagamento com uma consulta ao
+dicionário. Tudo é aplicado numa transação com operações em bulk por blocos de CHUNK_SIZE:
+estado das referências, transações e saldos. Como nada disto passa por Transaction.save nem
+dispara sinais, os resumos em cache dos utilizadores são invalidados explicitamente.
+
+Os pagamentos de pedidos ficam no razão como um carregamento seguido do pagamento do pedido
+(o saldo não muda); os contadores de gastos (bar_app.spending) só contam gastos do saldo.
+"""
+import csv
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Max, Value, When
+from django.utils import timezone
+
+from . import metrics, summaries
+from .models import Order, PaymentReference, Transaction, User
+
+
+MAX_RETRIES = 3
+CHUNK_SIZE = 500
+SEQUENCE_DIGITS = 7
+
+DATE_FORMATS = (
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%d-%m-%Y',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+)
+
+StatementLine = namedtuple('StatementLine', ['line_number', 'paid_at', 'entity', 'reference', 'amount'])
+Problem = namedtuple('Problem', ['line_number', 'reason', 'detail'])
+ImportResult = namedtuple('ImportResult', ['settled', 'problems'])
+
+PROBLEM_LABELS = {
+    'invalid': 'linha inválida',
+    'check_digits': 'dígitos de controlo errados',
+    'unknown': 'referência desconhecida ou já paga',
+    'amount': 'montante diferente do da referência',
+    'duplicate': 'pagamento repetido no extrato',
+    'expired': 'referência expirada antes do pagamento',
+}
+
+
+class SettlementConflict(Exception):
+    """Outra importação liquidou algumas das referências entretanto (nada foi aplicado)"""
+
+
+# ----------------------------------------------------------------------
+# Referências
+# ----------------------------------------------------------------------
+
+def check_digits(entity, sequence, amount):
+    cents = int((Decimal(amount) * 100).to_integral_value())
+    number = int(f'{entity}{sequence % 10 ** SEQUENCE_DIGITS:0{SEQUENCE_DIGITS}d}{cents:08d}')
+    return 98 - (number * 100) % 97
+
+
+def make_reference(entity, sequence, amount):
+    """Referência de 9 dígitos para a sequência e o montante"""
+    return f'{sequence % 10 ** SEQUENCE_DIGITS:0{SEQUENCE_DIGITS}d}{check_digits(entity, sequence, amount):02d}'
+
+
+def is_valid(entity, reference, amount):
+    """Os dígitos de controlo de `reference` batem certo com a entidade e o montante?"""
+    if len(reference) != SEQUENCE_DIGITS + 2 or not reference.isdigit():
+        return False
+    return make_reference(entity, int(reference[:SEQUENCE_DIGITS]), amount) == reference
+
+
+def issue(references, now=None):
+    """
+    Atribui entidade, referência e validade a várias PaymentReference ainda não gravadas
+    (utilizador, finalidade, montante e pedido já definidos) e grava-as com um bulk_create.
+    As sequências são reservadas a partir da maior existente; se outro processo reservar
+    as mesmas entretanto, a restrição única faz repetir.
+    """
+    now = now or timezone.now()
+    entity = settings.MULTIBANCO_ENTITY
+    expires_at = now + timedelta(days=settings.MULTIBANCO_REFERENCE_DAYS)
+
+    for attempt in range(MAX_RETRIES):
+        start = (PaymentReference.objects.aggregate(last=Max('sequence'))['last'] or 0) + 1
+        for sequence, payment_reference in enumerate(references, start=start):
+            payment_reference.entity = entity
+            payment_reference.sequence = sequence
+            payment_reference.reference = make_reference(entity, sequence, payment_reference.amount)
+            payment_reference.expires_at = expires_at
+        try:
+            with transaction.atomic():
+                created = PaymentReference.objects.bulk_create(references, batch_size=CHUNK_SIZE)
+        except IntegrityError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            continue
+        metrics.inc('bar_multibanco_references_total', len(created))
+        return created
+
+
+# ----------------------------------------------------------------------
+# Extrato
+# ----------------------------------------------------------------------
+
+def _parse_date(text):
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        return timezone.make_aware(parsed)
+    raise ValueError(text)
+
+
+def parse_statement(lines):
+    """
+    Linhas do extrato em CSV: data;entidade;referência;montante (também aceita ',' como
+    separador; com ';' o montante pode ter vírgula decimal). Linhas vazias e um cabeçalho
+    na primeira linha são ignorados. Devolve (linhas lidas, problemas).
+    """
+    parsed, problems = [], []
+    for line_number, raw in enumerate(lines, start=1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        delimiter = ';' if ';' in raw else ','
+        fields = [field.strip() for field in next(csv.reader([raw], delimiter=delimiter))]
+        if line_number == 1 and len(fields) == 4 and not fields[1].isdigit():
+            continue
+        if len(fields) != 4:
+            problems.append(Problem(line_number, 'invalid', raw))
+            continue
+
+        date_text, entity, reference, amount_text = fields
+        reference = reference.replace(' ', '')
+        try:
+            paid_at = _parse_date(date_text)
+            amount = Decimal(amount_text.replace(',', '.') if delimiter == ';' else amount_text)
+        except (ValueError, InvalidOperation):
+            problems.append(Problem(line_number, 'invalid', raw))
+            continue
+        if len(entity) != 5 or not entity.isdigit() or len(reference) != SEQUENCE_DIGITS + 2 or not reference.isdigit():
+            problems.append(Problem(line_number, 'invalid', raw))
+            continue
+        parsed.append(StatementLine(line_number, paid_at, entity, reference, amount))
+    return parsed, problems
+
+
+# ----------------------------------------------------------------------
+# Liquidação
+# ----------------------------------------------------------------------
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _outstanding_index():
+    """{(entidade, referência): linha} de todas as referências por pagar (uma query)"""
+    rows = PaymentReference.objects.filter(status='pending').values_list(
+        'pk', 'entity', 'reference', 'amount', 'expires_at', 'purpose', 'user_id', 'order_id', 'order__order_number',
+        named=True,
+    )
+    return {(row.entity, row.reference): row for row in rows}
+
+
+def match(lines):
+    """
+    Associa cada pagamento do extrato à sua referência por pagar e dentro da validade;
+    devolve ([(referência, linha)], problemas)
+    """
+    index = _outstanding_index()
+    matched, problems, seen = [], [], set()
+    for line in lines:
+        key = (line.entity, line.reference)
+        if key in seen:
+            problems.append(Problem(line.line_number, 'duplicate', line.reference))
+            continue
+        row = index.get(key)
+        if row is None:
+            reason = 'unknown' if is_valid(line.entity, line.reference, line.amount) else 'check_digits'
+            problems.append(Problem(line.line_number, reason, line.reference))
+            continue
+        if row.amount != line.amount:
+            problems.append(Problem(line.line_number, 'amount', f'{line.reference}: {line.amount} (esperado {row.amount})'))
+            continue
+        # Pago depois da validade: não é liquidado automaticamente (fica para tratar à mão)
+        if line.paid_at > row.expires_at:
+            expires_at = timezone.localtime(row.expires_at)
+            problems.append(Problem(line.line_number, 'expired', f'{line.reference}: válida até {expires_at:%d/%m/%Y %H:%M}'))
+            continue
+        seen.add(key)
+        matched.append((row, line))
+    return matched, problems
+
+
+def _credit_balances(deltas):
+    """Soma `deltas` ({utilizador: valor}) aos saldos, um UPDATE por bloco"""
+    now = timezone.now()
+    for chunk in _chunks(list(deltas.items()), CHUNK_SIZE):
+        User.objects.filter(pk__in=[user_id for user_id, _ in chunk]).update(
+            balance=F('balance') + Case(
+                *[When(pk=user_id, then=Value(delta)) for user_id, delta in chunk],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            updated_at=now,
+        )
+
+
+@transaction.atomic
+def apply(matched):
+    """Marca as referências como pagas e cria as transações e os créditos de saldo, em bulk"""
+    paid_at = {row.pk: line.paid_at for row, line in matched}
+
+    # UPDATE condicional: se outra importação já liquidou alguma referência, a contagem
+    # não bate e tudo é revertido
+    for chunk in _chunks(list(paid_at), CHUNK_SIZE):
+        if PaymentReference.objects.filter(pk__in=chunk, status='pending').update(status='paid') != len(chunk):
+            raise SettlementConflict()
+    PaymentReference.objects.bulk_update(
+        [PaymentReference(pk=pk, paid_at=value) for pk, value in paid_at.items()],
+        ['paid_at'], batch_size=CHUNK_SIZE,
+    )
+
+    # Estado dos pedidos relido (e bloqueado) dentro da transação: um pedido cancelado depois
+    # de match() não pode receber o pagamento; e um cancelamento concorrente espera pelo commit
+    # e vê a referência paga, reembolsando-a
+    order_ids = [row.order_id for row, _ in matched if row.purpose == 'order' and row.order_id is not None]
+    payable_orders = set()
+    now = timezone.now()
+    for chunk in _chunks(order_ids, CHUNK_SIZE):
+        payable_orders.update(
+            Order.objects.select_for_update().filter(pk__in=chunk).exclude(status='cancelled').values_list('pk', flat=True)
+        )
+        # A página do pedido mostra a referência paga: a ETag (updated_at) tem de mudar
+        Order.objects.filter(pk__in=chunk).update(updated_at=now)
+
+    transactions = []
+    deltas = defaultdict(Decimal)
+    for row, line in matched:
+        label = f'{row.reference[:3]} {row.reference[3:6]} {row.reference[6:]}'
+        transactions.append(Transaction(
+            user_id=row.user_id, transaction_type='topup', amount=row.amount,
+            description=f'Multibanco ref. {label}',
+        ))
+        # Pedido apagado ou cancelado entretanto: o valor fica no saldo
+        if row.purpose == 'order' and row.order_id in payable_orders:
+            transactions.append(Transaction(
+                user_id=row.user_id, transaction_type='payment', amount=row.amount, order_id=row.order_id,
+                description=f'Pagamento pedido {row.order__order_number} (Multibanco)',
+            ))
+        else:
+            deltas[row.user_id] += row.amount
+    Transaction.objects.bulk_create(transactions, batch_size=CHUNK_SIZE)
+    _credit_balances(deltas)
+
+    user_ids = {row.user_id for row, _ in matched}
+    transaction.on_commit(lambda: summaries.invalidate_many(user_ids))
+
+    for purpose in ('order', 'topup'):
+        count = sum(1 for row, _ in matched if row.purpose == purpose)
+        if count:
+            metrics.inc('bar_multibanco_settlements_total', count, purpose=purpose)
+
+
+def settle(lines, dry_run=False):
+    """Associa e (sem `dry_run`) liquida os pagamentos do extrato"""
+    statement, problems = parse_statement(lines)
+    matched, match_problems = match(statement)
+    if matched and not dry_run:
+        apply(matched)
+    problems = sorted(problems + match_problems, key=lambda problem: problem.line_number)
+    return ImportResult(matched, problems)
@@ -0,0 +1,45 @@
+"""
+Paginadores para tabelas grandes
+"""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginador que evita COUNT(*) em tabelas grandes sem filtros.
+
+    Sem filtros usa a estimativa do motor de base de dados (pg_class no PostgreSQL,
+    intervalo da chave primária nos restantes). Abaixo de `exact_threshold` linhas,
+    ou com filtros aplicados, faz a contagem exata.
+    """
+    exact_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is None or queryset.query.where:
+            return super().count
+
+        estimate = self._estimate(queryset)
+        if estimate is None or estimate < self.exact_threshold:
+            return super().count
+        return estimate
+
+    def _estimate(self, queryset):
+        model = queryset.model
+        connection = connections[queryset.db]
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk = connection.ops.quote_name(model._meta.pk.column)
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [model._meta.db_table])
+            else:
+                cursor.execute(f'SELECT MAX({pk}) - MIN({pk}) + 1 FROM {table}')
+            row = cursor.fetchone()
+
+        if not row or row[0] is None or row[0] < 0:
+            return None
+        return int(row[0])
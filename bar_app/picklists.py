@@ -0,0 +1,64 @@
+"""
+Listas de preparação (pick lists) para a cozinha
+Quantidades de cada produto somadas para uma janela de entrega (data + intervalo de horas)
+e um conjunto de estados, numa única query agrupada sobre OrderItem
+"""
+from collections import namedtuple
+from datetime import time
+
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from .models import Order, OrderItem
+
+
+PickRow = namedtuple('PickRow', ['product_id', 'name', 'category', 'quantity', 'orders'])
+Window = namedtuple('Window', ['day', 'start', 'end', 'statuses'])
+
+# Pedidos ainda por preparar
+DEFAULT_STATUSES = ('pending', 'confirmed', 'preparing')
+STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+
+def parse_window(params):
+    """Janela a partir dos parâmetros GET (date, start, end, status repetido); por omissão o dia de hoje"""
+    day = parse_date(params.get('date') or '') or timezone.localdate()
+    start = parse_time(params.get('start') or '') or time.min
+    end = parse_time(params.get('end') or '') or time.max
+    if start > end:
+        start, end = end, start
+    statuses = tuple(status for status in params.getlist('status') if status in STATUS_LABELS) or DEFAULT_STATUSES
+    return Window(day, start, end, statuses)
+
+
+def pick_list(window):
+    """Produtos a preparar na janela: unidades e nº de pedidos por produto"""
+    rows = (
+        OrderItem.objects.filter(
+            order__scheduled_date=window.day,
+            order__scheduled_time__gte=window.start,
+            order__scheduled_time__lte=window.end,
+            order__status__in=window.statuses,
+        )
+        .values('product_id', 'product__name', 'product__category__name')
+        .annotate(quantity=Sum('quantity'), orders=Count('order_id', distinct=True))
+        .order_by('product__category__name', 'product__name')
+    )
+    return [
+        PickRow(row['product_id'], row['product__name'], row['product__category__name'],
+                row['quantity'], row['orders'])
+        for row in rows
+    ]
+
+
+def window_state(window):
+    """
+    Versão dos pedidos do dia da janela: muda quando um pedido é criado, apagado ou muda de estado
+    (o save() atualiza updated_at), por isso serve de ETag para as atualizações incrementais
+    """
+    orders = Order.objects.filter(scheduled_date=window.day).aggregate(
+        last_modified=Max('updated_at'),
+        total=Count('id'),
+    )
+    return (orders['last_modified'], orders['total'], *window)
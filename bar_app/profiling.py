@@ -0,0 +1,136 @@
+"""
+Profiling por amostragem de pedidos HTTP
+Um thread auxiliar regista a pilha do thread do pedido a intervalos fixos; as pilhas
+são guardadas em formato "collapsed" (a;b;c N), pronto para flamegraph.pl ou speedscope.
+Os perfis ficam num diretório em disco limitado a PROFILING_MAX_FILES ficheiros (buffer circular).
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# Nomes de ficheiro gerados por save_profile (evita acesso a outros ficheiros)
+PROFILE_NAME_RE = re.compile(r'^\d+-\d+-[\w.-]+$')
+
+
+def profiles_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename):
+    """Caminho do ficheiro relativo ao sys.path mais específico (p.ex. django/db/models/query.py)"""
+    for prefix in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+class StackSampler:
+    """Amostra a pilha de um thread a cada `interval` segundos, num thread auxiliar"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._target = None
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{_short_path(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            # A base da pilha primeiro, como espera o formato collapsed
+            self.stacks[';'.join(reversed(stack))] += 1
+
+
+def save_profile(meta, stacks):
+    """Grava um perfil e apaga os mais antigos acima de PROFILING_MAX_FILES"""
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^\w.-]', '.', meta['url_name'] or 'sem-nome')
+    name = f'{time.time_ns()}-{os.getpid()}-{slug}'
+    with open(directory / f'{name}.json', 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'stacks': stacks}, f)
+
+    files = sorted(directory.glob('*.json'))
+    for old in files[:max(0, len(files) - settings.PROFILING_MAX_FILES)]:
+        old.unlink(missing_ok=True)
+    return name
+
+
+def list_profiles():
+    """Metadados de todos os perfis guardados, do mais recente para o mais antigo"""
+    profiles = []
+    for path in sorted(profiles_dir().glob('*.json'), reverse=True):
+        try:
+            with open(path, encoding='utf-8') as f:
+                meta = json.load(f)['meta']
+        except (OSError, ValueError, KeyError):
+            # Ficheiro apagado ou ainda a ser escrito por outro processo
+            continue
+        meta['name'] = path.stem
+        profiles.append(meta)
+    return profiles
+
+
+def load_stacks(name):
+    if not PROFILE_NAME_RE.match(name):
+        raise FileNotFoundError(name)
+    with open(profiles_dir() / f'{name}.json', encoding='utf-8') as f:
+        return json.load(f)['stacks']
+
+
+def merged_stacks(url_name):
+    """Soma das pilhas de todos os perfis de uma URL"""
+    total = Counter()
+    for meta in list_profiles():
+        if meta['url_name'] == url_name:
+            try:
+                total.update(load_stacks(meta['name']))
+            except (OSError, ValueError):
+                continue
+    return total
+
+
+def collapsed(stacks):
+    """Texto no formato collapsed: uma pilha por linha seguida do nº de amostras"""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def profile_meta(request, response, duration, samples):
+    match = getattr(request, 'resolver_match', None)
+    return {
+        'url_name': match.view_name if match else '',
+        'path': request.path,
+        'method': request.method,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 1),
+        'samples': samples,
+        'user': request.user.get_username() if getattr(request, 'user', None) and request.user.is_authenticated else '',
+        'taken_at': timezone.now().isoformat(),
+    }
@@ -0,0 +1,54 @@
+"""
+Recibos de pedidos
+O recibo é gerado uma única vez, quando o pedido chega a um estado final, e guardado
+em MEDIA_ROOT/receipts/; a partir daí é servido tal como está, com cache imutável.
+"""
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Order
+
+
+# Estados a partir dos quais o pedido já não muda
+FINAL_STATUSES = ('delivered', 'cancelled')
+
+
+def is_final(order):
+    return order.status in FINAL_STATUSES
+
+
+def render_receipt(order):
+    """HTML do recibo (o pedido deve vir de Order.objects.for_detail() para evitar queries por item)"""
+    return render_to_string('bar_app/receipt.html', {'order': order, 'generated_at': timezone.now()})
+
+
+def generate_receipt(order):
+    """
+    Gera e guarda o recibo de um pedido final, se ainda não existir.
+    O nome do ficheiro inclui um hash do conteúdo, por isso um URL nunca muda de conteúdo.
+    Devolve True se o recibo foi gerado agora.
+    """
+    if order.receipt or not is_final(order):
+        return False
+
+    content = render_receipt(order).encode('utf-8')
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    order.receipt.save(f'recibo-{order.order_number}-{digest}.html', ContentFile(content), save=False)
+    # Só grava o campo do recibo (e só se outro processo não o gerou entretanto)
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, receipt='').update(receipt=order.receipt.name)
+    if not updated:
+        order.receipt.storage.delete(order.receipt.name)
+        order.refresh_from_db(fields=['receipt'])
+        return False
+    return True
+
+
+def generate_receipts(order_ids):
+    """Gera os recibos em falta de uma lista de pedidos; devolve quantos foram gerados"""
+    orders = Order.objects.for_detail().filter(pk__in=order_ids, receipt='', status__in=FINAL_STATUSES)
+    return sum(generate_receipt(order) for order in orders)
@@ -0,0 +1,192 @@
+"""
+Reconciliação de saldos e stock
+Recalcula User.balance a partir das transações e Product.stock a partir dos movimentos,
+em blocos por chave primária (keyset) com agregações agrupadas
+
+As correções somam a diferença encontrada ao valor atual (UPDATE ... SET stock = stock + d),
+em vez de gravarem o valor calculado: uma venda ou carregamento que faça commit entre a
+leitura e a correção não é apagado.
+"""
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import summaries
+from .models import (
+    ArchivedStockMovement, ArchivedTransaction, Job, OrderItem, Product, StockMovement,
+    StockSnapshot, Transaction, User
+)
+from .stock import signed_quantity
+
+
+CHUNK_SIZE = 5000
+CENT = Decimal('0.01')
+
+Discrepancy = namedtuple('Discrepancy', ['pk', 'label', 'actual', 'expected'])
+
+
+class MissingBaseline(Exception):
+    """Sem nenhum snapshot de stock, o stock anterior ao registo de movimentos é desconhecido"""
+
+
+def signed_amount():
+    """Expressão com o efeito de cada transação no saldo (o mesmo que Transaction.balance_delta)"""
+    return Case(
+        When(transaction_type='payment', then=-F('amount')),
+        When(transaction_type__in=['topup', 'refund'], then=F('amount')),
+        default=Value(0),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def _keyset_chunks(queryset, fields, chunk_size):
+    """Percorre `queryset` por id crescente em blocos de `chunk_size` linhas"""
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def _apply_corrections(model, field, discrepancies, output_field, **extra):
+    """Soma a cada linha a diferença (esperado - atual) da sua divergência, num UPDATE"""
+    model.objects.filter(pk__in=[d.pk for d in discrepancies]).update(
+        **{field: F(field) + Case(
+            *[When(pk=d.pk, then=Value(d.expected - d.actual)) for d in discrepancies],
+            output_field=output_field,
+        )},
+        **extra,
+    )
+
+
+def _ledger_totals(model, first_pk, last_pk):
+    """Soma das transações por utilizador num intervalo de ids de utilizador"""
+    return dict(
+        model.objects
+        .filter(user_id__gte=first_pk, user_id__lte=last_pk)
+        .values('user_id')
+        .annotate(total=Sum(signed_amount()))
+        .order_by()
+        .values_list('user_id', 'total')
+    )
+
+
+def reconcile_balances(repair=False, chunk_size=CHUNK_SIZE):
+    """
+    Compara o saldo de cada utilizador com o razão (transações ativas + arquivadas).
+    Com `repair`, cada bloco é lido com os utilizadores bloqueados (select_for_update), para
+    o saldo e o razão serem lidos no mesmo estado, e corrigido com um UPDATE na mesma transação.
+    Devolve (nº de utilizadores verificados, lista de Discrepancy).
+    """
+    checked = 0
+    discrepancies = []
+    users = User.objects.select_for_update() if repair else User.objects.all()
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(users.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'username', 'balance')[:chunk_size])
+            if not rows:
+                break
+            first_pk, last_pk = rows[0][0], rows[-1][0]
+            live = _ledger_totals(Transaction, first_pk, last_pk)
+            archived = _ledger_totals(ArchivedTransaction, first_pk, last_pk)
+
+            chunk_discrepancies = []
+            for pk, username, balance in rows:
+                # Em SQLite as somas de decimais chegam com ruído de vírgula flutuante
+                expected = Decimal((live.get(pk) or 0) + (archived.get(pk) or 0)).quantize(CENT)
+                if balance != expected:
+                    chunk_discrepancies.append(Discrepancy(pk, username, balance, expected))
+
+            if repair and chunk_discrepancies:
+                _apply_corrections(
+                    User, 'balance', chunk_discrepancies, DecimalField(max_digits=10, decimal_places=2),
+                    updated_at=timezone.now(),
+                )
+                # O UPDATE não dispara sinais: os resumos em cache têm de ser descartados aqui
+                transaction.on_commit(partial(summaries.invalidate_many, [d.pk for d in chunk_discrepancies]))
+
+        checked += len(rows)
+        discrepancies.extend(chunk_discrepancies)
+    return checked, discrepancies
+
+
+def _movement_delta(model):
+    """Subquery: soma dos movimentos de um produto posteriores ao seu último snapshot"""
+    return Coalesce(
+        Subquery(
+            model.objects
+            .filter(product=OuterRef('pk'), created_at__gt=OuterRef('snapshot_at'))
+            .values('product')
+            .annotate(delta=Sum(signed_quantity()))
+            .values('delta')[:1]
+        ),
+        Value(0),
+    )
+
+
+def _products_with_unrecorded_movements():
+    """
+    Produtos de pedidos cujos movimentos de saída ainda não foram gravados pelo worker
+    (tarefa record_order_stock_movements pendente, em execução ou falhada, de antes de os
+    movimentos passarem a ser gravados no checkout): o stock já foi descontado mas o
+    movimento ainda não existe.
+    """
+    payloads = Job.objects.filter(
+        task='record_order_stock_movements', status__in=['pending', 'running', 'failed'],
+    ).values_list('payload', flat=True)
+    order_ids = [payload['order_id'] for payload in payloads if 'order_id' in payload]
+    return OrderItem.objects.filter(order_id__in=order_ids).values('product_id')
+
+
+def reconcile_stock(repair=False, chunk_size=CHUNK_SIZE):
+    """
+    Compara o stock de cada produto com o último snapshot + movimentos seguintes
+    (ou com a soma de todos os movimentos, se o produto nunca teve snapshot).
+    Produtos com movimentos de pedidos ainda por gravar ficam de fora (voltam a ser
+    verificados quando o worker os gravar; uma tarefa falhada tem de ser repetida).
+    Com `repair`, soma a diferença ao stock divergente com um UPDATE por bloco (stock e
+    movimentos vêm da mesma query, por isso a diferença é consistente). Só repara depois de
+    existir um snapshot: antes disso o stock anterior ao registo de movimentos é desconhecido
+    e "corrigir" para a soma dos movimentos estaria errado (levanta MissingBaseline).
+    Devolve (nº de produtos verificados, lista de Discrepancy).
+    """
+    if repair and not StockSnapshot.objects.exists():
+        raise MissingBaseline()
+
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    latest_snapshot = StockSnapshot.objects.filter(product=OuterRef('pk')).order_by('-taken_at')
+
+    products = Product.objects.exclude(pk__in=_products_with_unrecorded_movements()).annotate(
+        snapshot_stock=Coalesce(Subquery(latest_snapshot.values('stock')[:1]), Value(0)),
+        snapshot_at=Coalesce(Subquery(latest_snapshot.values('taken_at')[:1]), Value(epoch)),
+    ).annotate(
+        live_delta=_movement_delta(StockMovement),
+        archived_delta=_movement_delta(ArchivedStockMovement),
+    )
+
+    checked = 0
+    discrepancies = []
+    fields = ['name', 'stock', 'snapshot_stock', 'live_delta', 'archived_delta']
+    for rows in _keyset_chunks(products, fields, chunk_size):
+        chunk_discrepancies = [
+            Discrepancy(pk, name, stock, snapshot_stock + live_delta + archived_delta)
+            for pk, name, stock, snapshot_stock, live_delta, archived_delta in rows
+            if stock != snapshot_stock + live_delta + archived_delta
+        ]
+
+        if repair and chunk_discrepancies:
+            # updated_at também, para as ETags do catálogo mudarem
+            _apply_corrections(Product, 'stock', chunk_discrepancies, models.IntegerField(), updated_at=timezone.now())
+
+        checked += len(rows)
+        discrepancies.extend(chunk_discrepancies)
+    return checked, discrepancies
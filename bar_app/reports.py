@@ -0,0 +1,148 @@
+"""
+Relatórios de vendas por intervalo de datas
+Agregações SQL agrupadas sobre OrderItem/Order, com cache por intervalo
+
+Os valores em cache têm todos a mesma geração (bar_app.caching): cancelar um pedido
+(services.cancel_order) invalida de uma vez todos os relatórios, incluindo os de períodos fechados.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from . import caching, metrics
+from .history import current_school_year_start
+from .models import ArchivedOrderItem, OrderItem, User
+
+
+ReportRow = namedtuple('ReportRow', ['key', 'label', 'units', 'revenue', 'orders'])
+
+WEEKDAY_LABELS = {
+    1: 'Segunda', 2: 'Terça', 3: 'Quarta', 4: 'Quinta',
+    5: 'Sexta', 6: 'Sábado', 7: 'Domingo',
+}
+
+USER_TYPE_LABELS = dict(User.USER_TYPE_CHOICES)
+
+# Dimensão -> (expressão de agrupamento, expressão do rótulo ou função de formatação)
+DIMENSIONS = {
+    'product': (F('product_id'), F('product__name')),
+    'category': (F('product__category_id'), F('product__category__name')),
+    'hour': (ExtractHour('order__created_at'), lambda key: f'{key:02d}h'),
+    'weekday': (ExtractIsoWeekDay('order__created_at'), WEEKDAY_LABELS.get),
+    'user_type': (F('order__user__user_type'), USER_TYPE_LABELS.get),
+}
+
+DIMENSION_LABELS = {
+    'product': 'Produto',
+    'category': 'Categoria',
+    'hour': 'Hora do dia',
+    'weekday': 'Dia da semana',
+    'user_type': 'Tipo de utilizador',
+}
+
+# Períodos ainda abertos (que incluem hoje) só ficam em cache por pouco tempo
+OPEN_PERIOD_TIMEOUT = 60
+
+GENERATION_KEY = caching.key('reports', 'sales')
+
+
+def sales_items(start, end, model=OrderItem):
+    """
+    Itens vendidos (pedidos não cancelados) criados entre start e end, inclusive.
+    `model` pode ser ArchivedOrderItem para ler anos letivos arquivados (os caminhos são os mesmos).
+    """
+    # Limites em datetime (e não __date) para a base de dados poder usar o índice de created_at
+    return model.objects.filter(
+        order__created_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+        order__created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    ).exclude(order__status='cancelled')
+
+
+def _sources(start):
+    """Tabelas a consultar: o arquivo só entra se o intervalo começar antes do ano letivo corrente"""
+    if start < current_school_year_start():
+        return (OrderItem, ArchivedOrderItem)
+    return (OrderItem,)
+
+
+def _aggregate(start, end, dimension):
+    key_expr, label = DIMENSIONS[dimension]
+    annotations = {'key': key_expr}
+    if not callable(label):
+        annotations['label'] = label
+
+    # Pedidos ativos e arquivados são disjuntos, por isso os totais de cada tabela somam-se
+    merged = {}
+    for model in _sources(start):
+        rows = (
+            sales_items(start, end, model)
+            .annotate(**annotations)
+            .values(*annotations)
+            .annotate(units=Sum('quantity'), revenue=Sum('subtotal'), orders=Count('order', distinct=True))
+            .order_by()
+        )
+        for row in rows:
+            current = merged.get(row['key'])
+            if current is None:
+                merged[row['key']] = ReportRow(
+                    key=row['key'],
+                    label=label(row['key']) if callable(label) else (row['label'] or 'Sem categoria'),
+                    units=row['units'],
+                    revenue=row['revenue'],
+                    orders=row['orders'],
+                )
+            else:
+                merged[row['key']] = current._replace(
+                    units=current.units + row['units'],
+                    revenue=current.revenue + row['revenue'],
+                    orders=current.orders + row['orders'],
+                )
+
+    return tuple(sorted(merged.values(), key=lambda row: row.revenue, reverse=True))
+
+
+def sales_report(start, end, dimension):
+    """
+    Receita, unidades e nº de pedidos agrupados por `dimension` entre start e end.
+
+    Os períodos fechados (end anterior a hoje) só mudam quando um pedido é cancelado, o
+    que invalida a cache (invalidate), por isso ficam em cache sem expiração; os períodos
+    abertos expiram ao fim de OPEN_PERIOD_TIMEOUT segundos.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f'Dimensão desconhecida: {dimension}')
+
+    cache_key = f'reports:sales:{dimension}:{start.isoformat()}:{end.isoformat()}'
+    generation = caching.generation(GENERATION_KEY)
+    rows = cache.get(cache_key, version=generation)
+    metrics.cache_lookup('reports', rows is not None)
+    if rows is None:
+        rows = _aggregate(start, end, dimension)
+        closed = end < timezone.localdate()
+        cache.set(cache_key, rows, None if closed else OPEN_PERIOD_TIMEOUT, version=generation)
+    return rows
+
+
+def invalidate():
+    """Descarta todos os relatórios em cache (chamar depois do commit)"""
+    caching.invalidate(GENERATION_KEY)
+
+
+def default_range(days=30):
+    """Últimos `days` dias, terminando hoje"""
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def report_as_chart(rows):
+    """Formato para gráficos: rótulos e séries paralelas"""
+    return {
+        'labels': [row.label for row in rows],
+        'units': [row.units for row in rows],
+        'revenue': [str(row.revenue) for row in rows],
+        'orders': [row.orders for row in rows],
+    }
@@ -0,0 +1,163 @@
+"""
+Geração determinística de dados sintéticos (usada pelo comando seed_bar)
+
+Este módulo não importa Django: as funções correm em processos trabalhadores e
+devolvem apenas tuplos simples, que o processo principal insere com bulk_create.
+"""
+import random
+from datetime import datetime, time, timedelta
+
+
+FIRST_NAMES = [
+    'Ana', 'Beatriz', 'Carlos', 'Diana', 'Eduardo', 'Filipa', 'Gonçalo', 'Helena',
+    'Inês', 'João', 'Laura', 'Miguel', 'Nuno', 'Oriana', 'Pedro', 'Rita',
+    'Sofia', 'Tiago', 'Vasco', 'Leonor', 'Martim', 'Matilde', 'Rodrigo', 'Carolina',
+]
+LAST_NAMES = [
+    'Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rodrigues', 'Martins',
+    'Jesus', 'Sousa', 'Fernandes', 'Gonçalves', 'Gomes', 'Lopes', 'Marques', 'Alves',
+]
+CATEGORIES = {
+    'Sandes': (150, 300),
+    'Bebidas Quentes': (60, 150),
+    'Bebidas Frias': (80, 180),
+    'Sumos Naturais': (150, 250),
+    'Pastelaria': (80, 200),
+    'Fruta': (40, 80),
+    'Iogurtes': (60, 120),
+    'Refeições': (300, 450),
+    'Saladas': (250, 400),
+    'Snacks': (50, 150),
+}
+DEPARTMENTS = ['Matemática', 'Português', 'Ciências', 'História', 'Inglês', 'Educação Física', 'Artes']
+POSITIONS = ['Bar', 'Secretaria', 'Auxiliar', 'Cozinha', 'Reprografia']
+
+# Tipos de utilizador e respetivo peso na população da escola
+USER_TYPE_WEIGHTS = (('aluno', 85), ('professor', 10), ('staff', 5))
+
+# Picos de procura ao longo do dia: (início, fim, minuto de pico, desvio padrão, peso)
+# Intervalo da manhã, almoço (o maior pico) e intervalo da tarde, mais ruído ao longo do dia
+TIME_PEAKS = (
+    (time(10, 0), time(10, 45), 10 * 60 + 20, 10, 20),
+    (time(12, 0), time(14, 0), 12 * 60 + 45, 25, 60),
+    (time(15, 30), time(16, 30), 16 * 60, 15, 15),
+    (time(8, 0), time(17, 30), None, None, 5),
+)
+
+
+def chunk_random(seed, name, index):
+    """Gerador aleatório determinístico para o bloco `index` de uma tabela"""
+    return random.Random(f'{seed}:{name}:{index}')
+
+
+def generate_users(seed, start, count):
+    """
+    Utilizadores [start, start + count[ como tuplos
+    (índice, username, first_name, last_name, user_type, número, extra1, extra2)
+    """
+    rng = chunk_random(seed, 'users', start)
+    types, weights = zip(*USER_TYPE_WEIGHTS)
+    rows = []
+    for i in range(start, start + count):
+        user_type = rng.choices(types, weights)[0]
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        if user_type == 'aluno':
+            extra = (str(rng.randint(5, 12)), rng.choice('ABCDEFG'))
+            number = f'A{seed}{i:07d}'
+        elif user_type == 'professor':
+            extra = (rng.choice(DEPARTMENTS), '')
+            number = f'P{seed}{i:07d}'
+        else:
+            extra = (rng.choice(POSITIONS), '')
+            number = f'F{seed}{i:07d}'
+        rows.append((i, f'seed{seed}-{i}', first_name, last_name, user_type, number, *extra))
+    return rows
+
+
+def generate_products(seed, count):
+    """Produtos como tuplos (nome, categoria, preço em cêntimos, stock mínimo)"""
+    rng = chunk_random(seed, 'products', 0)
+    categories = list(CATEGORIES)
+    rows = []
+    for i in range(count):
+        category = categories[i % len(categories)]
+        low, high = CATEGORIES[category]
+        rows.append((f'{category} {i // len(categories) + 1}', category, rng.randint(low, high) // 5 * 5, rng.choice([5, 10, 20])))
+    return rows
+
+
+def _random_minute(rng):
+    peaks = [peak[4] for peak in TIME_PEAKS]
+    start, end, mode, spread, _ = rng.choices(TIME_PEAKS, peaks)[0]
+    low, high = start.hour * 60 + start.minute, end.hour * 60 + end.minute
+    if mode is None:
+        return rng.randint(low, high)
+    return int(min(max(rng.gauss(mode, spread), low), high))
+
+
+def _school_days(first_day, days):
+    return [
+        first_day + timedelta(days=offset)
+        for offset in range(days)
+        if (first_day + timedelta(days=offset)).weekday() < 5
+    ]
+
+
+# Contexto partilhado pelos processos trabalhadores (definido uma vez por processo em init_worker)
+_context = None
+
+
+def init_worker(context):
+    global _context
+    _context = context
+
+
+def order_number(seed, order_id):
+    return f'S{seed}-{order_id}'
+
+
+def generate_orders(index, context=None):
+    """
+    Bloco `index` de pedidos. O contexto tem seed, first_order_id, total, chunk_size,
+    first_day, days, users [(id, is_priority)] e products [(id, preço em cêntimos)].
+
+    Devolve (orders, items, transactions, movements) como listas de tuplos, com
+    valores em cêntimos e datas sem fuso horário.
+    """
+    context = context or _context
+    rng = chunk_random(context['seed'], 'orders', index)
+    users, products = context['users'], context['products']
+    school_days = _school_days(context['first_day'], context['days'])
+    offset = index * context['chunk_size']
+    first_id = context['first_order_id'] + offset
+    count = min(context['chunk_size'], context['total'] - offset)
+
+    orders, items, transactions, movements = [], [], [], []
+    for order_id in range(first_id, first_id + count):
+        number = order_number(context['seed'], order_id)
+        user_id, is_priority = rng.choice(users)
+        day = rng.choice(school_days)
+        minute = _random_minute(rng)
+        scheduled = datetime.combine(day, time(minute // 60, minute % 60))
+        created_at = scheduled - timedelta(minutes=rng.randint(5, 180))
+        cancelled_at = created_at + timedelta(minutes=rng.randint(1, 5))
+        payment_method = 'card' if rng.random() < 0.9 else 'atm'
+        status = 'cancelled' if rng.random() < 0.03 else 'delivered'
+
+        total = 0
+        size = rng.choices((1, 2, 3, 4), (50, 30, 15, 5))[0]
+        for product_id, price in rng.sample(products, k=min(len(products), size)):
+            quantity = rng.choices((1, 2, 3), (80, 15, 5))[0]
+            total += price * quantity
+            items.append((order_id, product_id, quantity, price, price * quantity))
+            movements.append((product_id, 'out', quantity, f'Pedido {number}', order_id, user_id, created_at))
+            if status == 'cancelled':
+                movements.append((product_id, 'in', quantity, f'Cancelamento pedido {number}', order_id, user_id, cancelled_at))
+
+        orders.append((order_id, number, user_id, status, payment_method, total, scheduled, is_priority, created_at))
+        if payment_method == 'card':
+            transactions.append((user_id, 'payment', total, f'Pagamento pedido {number}', order_id, created_at))
+            if status == 'cancelled':
+                transactions.append((user_id, 'refund', total, f'Reembolso pedido {number}', order_id, cancelled_at))
+
+    return orders, items, transactions, movements
@@ -0,0 +1,445 @@
+"""
+Camada de serviços partilhada pelas views HTML e pela API JSON (bar_app.api)
+
+O carrinho é um dicionário {id do produto (str): quantidade}. As funções recebem e devolvem
+esse dicionário sem saber onde fica guardado (sessão nas views HTML, sessão ou token na API).
+Erros de negócio são levantados como ServiceError com a mensagem a mostrar ao utilizador.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import alerts, identity, idempotency, jobs, metrics, multibanco, reports, spending
+from .models import Order, OrderItem, PaymentReference, Product, StockMovement, Transaction, User
+
+
+MAX_RETRIES = 3
+
+LIMIT_MESSAGE = 'Este pedido ultrapassa o limite diário de gastos da conta.'
+
+
+class ServiceError(Exception):
+    """Operação recusada; `reason` identifica o motivo (também usado nas métricas e na API)"""
+
+    def __init__(self, message, reason='invalid'):
+        super().__init__(message)
+        self.message = message
+        self.reason = reason
+
+
+# ----------------------------------------------------------------------
+# Carrinho
+# ----------------------------------------------------------------------
+
+def cart_lines(cart):
+    """Linhas do carrinho (produto, quantidade, preço unitário, subtotal) e total, numa única query"""
+    products = Product.objects.in_bulk([int(product_id) for product_id in cart])
+
+    items = []
+    total = Decimal('0.00')
+    for product_id, quantity in cart.items():
+        product = products.get(int(product_id))
+        if product is None:
+            continue
+        subtotal = product.price * quantity
+        total += subtotal
+        items.append({
+            'product': product,
+            'quantity': quantity,
+            'unit_price': product.price,
+            'subtotal': subtotal,
+        })
+    return items, total
+
+
+def add_to_cart(cart, product):
+    """Mais uma unidade de `product` no carrinho"""
+    if not product.is_in_stock():
+        raise ServiceError('Produto sem stock.', 'stock')
+
+    cart = dict(cart)
+    key = str(product.pk)
+    quantity = cart.get(key, 0) + 1
+    if product.stock < quantity:
+        raise ServiceError(f'Stock insuficiente para adicionar mais {product.name}. Stock atual: {product.stock}.', 'stock')
+    cart[key] = quantity
+    return cart
+
+
+def update_cart(cart, changes, replace=False):
+    """
+    Aplica várias alterações de uma vez: {id do produto: quantidade}, 0 remove o produto.
+    Com `replace` o carrinho passa a ter só os produtos indicados.
+    Tudo ou nada: se uma alteração for inválida o carrinho fica como estava.
+    """
+    quantities = {}
+    for product_id, quantity in changes.items():
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            raise ServiceError('Quantidade inválida.')
+        if quantity < 0:
+            raise ServiceError('Quantidade inválida.')
+        quantities[product_id] = quantity
+
+    # Só os produtos que ficam no carrinho precisam de ser lidos (uma query)
+    products = Product.objects.in_bulk([pk for pk, quantity in quantities.items() if quantity])
+    for product_id, quantity in quantities.items():
+        if not quantity:
+            continue
+        product = products.get(product_id)
+        if product is None:
+            raise ServiceError(f'O produto com ID {product_id} não existe.', 'product')
+        if product.stock < quantity:
+            raise ServiceError(f'Stock insuficiente para {product.name}. Stock atual: {product.stock}.', 'stock')
+
+    cart = {} if replace else dict(cart)
+    for product_id, quantity in quantities.items():
+        if quantity:
+            cart[str(product_id)] = quantity
+        else:
+            cart.pop(str(product_id), None)
+    return cart
+
+
+# ----------------------------------------------------------------------
+# Checkout
+# ----------------------------------------------------------------------
+
+def _record_stock_out(order, items, low_stock):
+    """
+    Movimentos de saída de stock dos itens do pedido, na mesma transação que desconta o stock.
+    Os alertas dos produtos que a venda levou ao stock mínimo ficam para o worker.
+    """
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=item.product_id,
+            movement_type='out',
+            quantity=item.quantity,
+            reason=f'Pedido {order.order_number}',
+            order=order,
+            created_by_id=order.user_id,
+        )
+        for item in items
+    ])
+    if low_stock:
+        jobs.enqueue(
+            'record_stock_alerts',
+            {'product_ids': low_stock, 'source': 'checkout'},
+            idempotency_key=f'order-alerts:{order.pk}',
+        )
+
+
+def _create_order(user, cart, order):
+    """Cria o pedido, os itens, o pagamento e os movimentos de stock (dentro de transaction.atomic)"""
+    order.save()
+
+    total_amount = Decimal('0.00')
+    items = []
+    # Produtos que esta venda leva ao stock mínimo (calculado sem queries extra)
+    low_stock = []
+
+    # Carregar todos os produtos do carrinho numa única query
+    products = Product.objects.in_bulk([int(product_id) for product_id in cart])
+
+    for product_id, quantity in cart.items():
+        product = products.get(int(product_id))
+        if product is None:
+            raise ServiceError(f'O produto com ID {product_id} não existe.', 'product')
+
+        quantity = int(quantity)
+        if product.stock < quantity:
+            raise ServiceError(f'Stock insuficiente para {product.name}. Stock atual: {product.stock}.', 'stock')
+
+        subtotal_value = product.price * quantity
+        total_amount += subtotal_value
+
+        items.append(OrderItem.objects.create(
+            order=order,
+            product=product,
+            quantity=quantity,
+            unit_price=product.price,
+            subtotal=subtotal_value,
+        ))
+
+        if alerts.crossed_below(product.stock, product.stock - quantity, product.min_stock):
+            low_stock.append(product.pk)
+        product.stock -= quantity
+        product.save()
+
+    order.total_amount = total_amount
+    order.save()
+
+    if order.payment_method == 'card' and user.balance < order.total_amount:
+        raise ServiceError('Saldo insuficiente. Por favor, carregue o seu saldo.', 'balance')
+
+    # Contadores de gastos e limite diário: um UPDATE condicional, sem somar transações
+    spent = order.total_amount if order.payment_method == 'card' else Decimal('0.00')
+    if not spending.record_order(user.pk, spent):
+        raise ServiceError(LIMIT_MESSAGE, 'limit')
+
+    if order.payment_method == 'card':
+        # Débito do saldo (aplicado por Transaction.save)
+        Transaction.objects.create(
+            user=user,
+            transaction_type='payment',
+            amount=order.total_amount,
+            order=order,
+            description=f'Pagamento pedido {order.order_number}'
+        )
+    elif order.payment_method == 'atm':
+        # Referência para pagar no multibanco (liquidada pelo comando import_multibanco)
+        multibanco.issue([PaymentReference(user=user, order=order, purpose='order', amount=order.total_amount)])
+
+    _record_stock_out(order, items, low_stock)
+
+
+def replayed_order(user_id, idempotency_key):
+    """Pedido já criado por uma submissão anterior com a mesma chave de idempotência, ou None"""
+    if not idempotency_key:
+        return None
+    order_id = idempotency.find_order(user_id, idempotency_key)
+    if order_id is None:
+        return None
+    return Order.objects.filter(pk=order_id).first()
+
+
+def _save_new_order(user, order, create, idempotency_key, error_message):
+    """
+    Corre create(order) (que grava o pedido e o resto da venda) numa transação, repetindo com
+    outro nº de pedido em caso de colisão. Usado pelo checkout (HTML e API) e pela venda ao balcão.
+    Devolve (pedido, criado) como place_order.
+    """
+    for attempt in range(MAX_RETRIES):
+        # Cada tentativa numa transação própria: uma colisão só reverte esta tentativa
+        if attempt > 0:
+            order.pk = None
+            order.order_number = None
+        try:
+            with transaction.atomic():
+                create(order)
+        except ServiceError as e:
+            metrics.inc('bar_checkout_failures_total', reason=e.reason)
+            raise
+        except IntegrityError as e:
+            # Outra submissão com a mesma chave criou o pedido entretanto
+            if idempotency_key and 'idempotency_key' in str(e):
+                existing = replayed_order(user.pk, idempotency_key)
+                if existing is not None:
+                    return existing, False
+
+            collision = 'order_number' in str(e)
+            if collision:
+                metrics.inc('bar_checkout_failures_total', reason='order_number')
+            if collision and attempt < MAX_RETRIES - 1:
+                continue
+            metrics.inc('bar_checkout_failures_total', reason='error')
+            raise ServiceError(error_message, 'error')
+
+        metrics.inc('bar_orders_created_total', status=order.status, payment_method=order.payment_method)
+        if idempotency_key:
+            idempotency.remember_order(user.pk, idempotency_key, order.pk)
+        return order, True
+
+
+def place_order(user, cart, order, idempotency_key=None):
+    """
+    Cria o pedido `order` (ainda não gravado: data, hora, pagamento, notas) com o conteúdo do carrinho.
+    Devolve (pedido, criado); criado é False quando outra submissão com a mesma chave de
+    idempotência já o tinha criado. O carrinho não é alterado: esvaziá-lo cabe a quem chama.
+    """
+    if not cart:
+        raise ServiceError('O seu carrinho está vazio.', 'empty_cart')
+
+    order.user = user
+    order.idempotency_key = idempotency_key
+    return _save_new_order(
+        user, order, lambda order: _create_order(user, cart, order), idempotency_key,
+        'Erro grave e irrecuperável ao finalizar o pedido. Tente novamente mais tarde.',
+    )
+
+
+# ----------------------------------------------------------------------
+# Estado dos pedidos
+# ----------------------------------------------------------------------
+
+def transition_order(order, new_status):
+    """
+    Muda o estado de `order` com um único UPDATE condicional (sem locks):
+    WHERE id = ? AND version = ? AND status = ?, com o estado e a versão lidos por quem chama
+    (o formulário envia a versão que o utilizador viu). Se outra pessoa alterou o pedido
+    entretanto, nenhuma linha muda e é levantado ServiceError com reason 'conflict'.
+    Em caso de sucesso atualiza `order` em memória.
+    """
+    if not order.can_transition_to(new_status):
+        raise ServiceError(
+            f'Não é possível passar o pedido {order.order_number} de {order.get_status_display()} para {dict(Order.STATUS_CHOICES).get(new_status, new_status)}.',
+            'transition',
+        )
+
+    now = timezone.now()
+    updated = Order.objects.filter(pk=order.pk, version=order.version, status=order.status).update(
+        status=new_status, version=F('version') + 1, updated_at=now,
+    )
+    if not updated:
+        metrics.inc('bar_order_status_conflicts_total')
+        current = Order.objects.filter(pk=order.pk).values_list('status', flat=True).first()
+        current_label = dict(Order.STATUS_CHOICES).get(current, 'removido')
+        raise ServiceError(
+            f'O pedido {order.order_number} foi alterado por outra pessoa entretanto (estado atual: {current_label}). '
+            'Reveja o pedido e tente novamente.',
+            'conflict',
+        )
+
+    if new_status == 'cancelled':
+        metrics.inc('bar_orders_cancelled_total', previous_status=order.status, payment_method=order.payment_method)
+    order.status, order.version, order.updated_at = new_status, order.version + 1, now
+    return order
+
+
+@transaction.atomic
+def cancel_order(order, cancelled_by):
+    """
+    Cancela `order` (pelo cliente ou por um funcionário) com os efeitos do cancelamento:
+    devolve o stock, reembolsa o que já foi pago e desconta o reembolso dos gastos.
+    """
+    transition_order(order, 'cancelled')
+
+    # Devolver stock
+    for item in order.items.select_related('product'):
+        StockMovement.objects.create(
+            product=item.product,
+            movement_type='in',
+            quantity=item.quantity,
+            reason=f'Cancelamento pedido {order.order_number}',
+            created_by=cancelled_by
+        )
+
+        old_stock = item.product.stock
+        item.product.stock += item.quantity
+        item.product.save()
+        alerts.track_change(item.product, old_stock, 'cancel')
+
+    # Reembolsar se já foi pago (o saldo é creditado por Transaction.save). Uma referência
+    # Multibanco ainda por pagar que seja paga depois é creditada no saldo pela importação
+    paid_by_atm = order.payment_method == 'atm' and PaymentReference.objects.filter(order=order, status='paid').exists()
+    if order.payment_method == 'card' or paid_by_atm:
+        Transaction.objects.create(
+            user=order.user,
+            transaction_type='refund',
+            amount=order.total_amount,
+            order=order,
+            description=f'Reembolso pedido {order.order_number}'
+        )
+    if order.payment_method == 'card':
+        spending.record_refund(order.user_id, order.total_amount, timezone.localdate(order.created_at))
+
+    jobs.enqueue('generate_receipt', {'order_id': order.pk}, idempotency_key=f'receipt:{order.pk}')
+    # Um pedido cancelado sai dos relatórios de vendas, mesmo dos períodos já fechados
+    transaction.on_commit(reports.invalidate)
+    return order
+
+
+# ----------------------------------------------------------------------
+# Venda ao balcão (POS)
+# ----------------------------------------------------------------------
+
+def find_customer(identifier):
+    """
+    Cliente pelo nº de aluno, nº de funcionário (professores e funcionários) ou username.
+    O identificador é resolvido pelo índice em memória; só o utilizador (saldo atual) é lido.
+    """
+    found = identity.resolve(identifier)
+    if found is None:
+        return None
+    return User.objects.filter(pk=found.user_id, is_active=True).first()
+
+
+def _create_sale(customer, quantities, order):
+    """Pedido entregue, itens, débito, stock e movimentos de uma venda ao balcão (dentro de transaction.atomic)"""
+    products = Product.objects.in_bulk(list(quantities))
+
+    total_amount = Decimal('0.00')
+    items = []
+    low_stock = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None or not product.is_available:
+            raise ServiceError(f'O produto com ID {product_id} não existe.', 'product')
+
+        # Decremento condicional: sem locks nem leituras extra, falha se o stock não chegar
+        # (updated_at também, para as ETags do catálogo mudarem)
+        if not Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+            stock=F('stock') - quantity, updated_at=timezone.now(),
+        ):
+            raise ServiceError(f'Stock insuficiente para {product.name}.', 'stock')
+        if alerts.crossed_below(product.stock, product.stock - quantity, product.min_stock):
+            low_stock.append(product_id)
+
+        subtotal = product.price * quantity
+        total_amount += subtotal
+        items.append(OrderItem(product=product, quantity=quantity, unit_price=product.price, subtotal=subtotal))
+
+    # Débito condicional: o saldo é verificado na própria linha, não no objeto em memória,
+    # que pode estar desatualizado se o cliente pagou outra coisa entretanto
+    debited = User.objects.filter(pk=customer.pk, balance__gte=total_amount).update(
+        balance=F('balance') - total_amount, updated_at=timezone.now(),
+    )
+    if not debited:
+        balance = User.objects.filter(pk=customer.pk).values_list('balance', flat=True).first()
+        raise ServiceError(f'Saldo insuficiente ({balance} €).', 'balance')
+    if not spending.record_order(customer.pk, total_amount):
+        raise ServiceError(LIMIT_MESSAGE, 'limit')
+
+    order.total_amount = total_amount
+    order.save()
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+
+    # O saldo já foi debitado acima: bulk_create não passa por Transaction.save (que voltaria
+    # a debitá-lo); o resumo em cache é invalidado pelo sinal do Order
+    Transaction.objects.bulk_create([Transaction(
+        user=customer,
+        transaction_type='payment',
+        amount=total_amount,
+        order=order,
+        description=f'Pagamento pedido {order.order_number}'
+    )])
+    customer.balance -= total_amount
+
+    _record_stock_out(order, items, low_stock)
+    jobs.enqueue('generate_receipt', {'order_id': order.pk}, idempotency_key=f'receipt:{order.pk}')
+
+
+def pos_sale(customer, product_ids, idempotency_key=None):
+    """
+    Venda ao balcão: cria um pedido já entregue, pago com o saldo, numa única transação.
+    `product_ids` é a lista de produtos vendidos (um id repetido conta várias unidades).
+    Devolve (pedido, criado) como place_order.
+    """
+    try:
+        quantities = Counter(int(product_id) for product_id in product_ids)
+    except (TypeError, ValueError):
+        raise ServiceError('Produto inválido.')
+    if not quantities:
+        raise ServiceError('Nenhum produto indicado.', 'empty_cart')
+
+    now = timezone.localtime()
+    order = Order(
+        user=customer,
+        status='delivered',
+        payment_method='card',
+        scheduled_date=now.date(),
+        scheduled_time=now.time().replace(microsecond=0),
+        notes='Venda ao balcão',
+        idempotency_key=idempotency_key,
+    )
+
+    return _save_new_order(
+        customer, order, lambda order: _create_sale(customer, quantities, order), idempotency_key,
+        'Erro ao registar a venda. Tente novamente.',
+    )
@@ -0,0 +1,61 @@
+"""
+Sinais da aplicação (ligados em BarAppConfig.ready)
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import identity, summaries
+from .models import Order, SpendingCounter, Staff, Student, Teacher, Transaction, User
+
+
+# Campos de User que entram no índice de identificação
+IDENTITY_USER_FIELDS = {'username', 'first_name', 'last_name', 'user_type', 'photo', 'is_active'}
+
+
+# Campos de User que entram no resumo da navbar e do perfil
+SUMMARY_USER_FIELDS = {'balance'}
+
+
+def _refresh_identity(user_id):
+    # Só depois do commit: uma transação revertida não pode deixar o índice desatualizado
+    transaction.on_commit(lambda: identity.refresh_user(user_id))
+
+
+def _invalidate_summary(user_id):
+    # Também só depois do commit: um pedido concorrente podia voltar a guardar o resumo antigo
+    transaction.on_commit(lambda: summaries.invalidate(user_id))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SUMMARY_USER_FIELDS.intersection(update_fields):
+        _invalidate_summary(instance.pk)
+    # Os logins gravam só last_login: não mexem no índice
+    if update_fields is not None and not IDENTITY_USER_FIELDS.intersection(update_fields):
+        return
+    _refresh_identity(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    _refresh_identity(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Staff)
+def profile_changed(sender, instance, **kwargs):
+    _refresh_identity(instance.user_id)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=SpendingCounter)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Order)
+def summary_changed(sender, instance, **kwargs):
+    _invalidate_summary(instance.user_id)
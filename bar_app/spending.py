@@ -0,0 +1,76 @@
+"""
+Contadores de gastos por utilizador (SpendingCounter) e limite diário
+
+Cada pedido faz um único UPDATE condicional ao contador, no mesmo commit do pagamento:
+o WHERE verifica o limite diário e o SET acumula os gastos. A mudança de dia/mês é
+preguiçosa: um CASE no próprio UPDATE recomeça o acumulado quando o dia guardado já passou,
+por isso não há nenhuma tarefa à meia-noite. Um UPDATE que não altera linhas significa
+limite ultrapassado (ou contador ainda por criar, criado aqui na primeira compra).
+
+Nota: o SQL padrão (SQLite, PostgreSQL) avalia o SET com os valores antigos da linha;
+em MySQL seria da esquerda para a direita, daí os acumulados virem antes de day/month.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SpendingCounter
+
+
+AMOUNT = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Value(Decimal('0.00'), output_field=AMOUNT)
+
+
+def _accumulated(field, period_field, period):
+    """Valor de `field` se o contador ainda estiver em `period`, senão 0"""
+    return Case(When(**{period_field: period}, then=F(field)), default=ZERO, output_field=AMOUNT)
+
+
+def record_order(user_id, amount, today=None):
+    """
+    Conta um pedido e `amount` gasto do saldo (0 se não for pago com o saldo).
+    Devolve False, sem alterar nada, se o gasto ultrapassar o limite diário.
+    Deve correr na transação que grava o pagamento.
+    """
+    today = today or timezone.localdate()
+    month = today.replace(day=1)
+    amount = Value(Decimal(amount), output_field=AMOUNT)
+    spent_today = _accumulated('daily_spent', 'day', today)
+
+    counters = SpendingCounter.objects.filter(user_id=user_id)
+    if amount.value:
+        counters = counters.filter(Q(daily_limit__isnull=True) | Q(daily_limit__gte=spent_today + amount))
+    updated = counters.update(
+        daily_spent=spent_today + amount,
+        day=today,
+        monthly_spent=_accumulated('monthly_spent', 'month', month) + amount,
+        month=month,
+        lifetime_spent=F('lifetime_spent') + amount,
+        order_count=F('order_count') + 1,
+    )
+    if updated:
+        return True
+
+    _, created = SpendingCounter.objects.get_or_create(user_id=user_id)
+    if created:
+        return record_order(user_id, amount.value, today)
+    return False
+
+
+def record_refund(user_id, amount, paid_on):
+    """Desconta um reembolso dos gastos (do dia e do mês só se o pagamento foi em `paid_on`)"""
+    amount = Value(Decimal(amount), output_field=AMOUNT)
+    SpendingCounter.objects.filter(user_id=user_id).update(
+        daily_spent=Case(
+            When(day=paid_on, then=Greatest(F('daily_spent') - amount, ZERO)),
+            default=F('daily_spent'), output_field=AMOUNT,
+        ),
+        monthly_spent=Case(
+            When(month=paid_on.replace(day=1), then=Greatest(F('monthly_spent') - amount, ZERO)),
+            default=F('monthly_spent'), output_field=AMOUNT,
+        ),
+        lifetime_spent=F('lifetime_spent') - amount,
+    )
+
@@ -0,0 +1,99 @@
+"""
+Histórico de stock: snapshots periódicos, compactação de movimentos e reconstrução
+O stock numa data qualquer é reconstruído como snapshot + soma dos movimentos (delta)
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedStockMovement, Product, StockMovement, StockSnapshot
+
+
+# Dias de movimentos que ficam na tabela principal
+KEEP_DAYS = 28
+# Linhas movidas para o arquivo em cada transação
+COMPACT_BATCH_SIZE = 2000
+
+ARCHIVED_FIELDS = ['id', 'product_id', 'movement_type', 'quantity', 'reason', 'order_id', 'created_by_id', 'created_at']
+
+
+def signed_quantity():
+    """Expressão com o efeito de cada movimento no stock: entradas somam, saídas subtraem"""
+    return Case(
+        When(movement_type='out', then=-F('quantity')),
+        default=F('quantity'),
+        output_field=IntegerField(),
+    )
+
+
+def _delta(product_id, after=None, until=None):
+    """Soma dos movimentos (principais e arquivados) no intervalo ]after, until]"""
+    total = 0
+    for model in (StockMovement, ArchivedStockMovement):
+        movements = model.objects.filter(product_id=product_id)
+        if after is not None:
+            movements = movements.filter(created_at__gt=after)
+        if until is not None:
+            movements = movements.filter(created_at__lte=until)
+        total += movements.aggregate(delta=Coalesce(Sum(signed_quantity()), Value(0)))['delta']
+    return total
+
+
+def stock_at(product, when):
+    """
+    Stock de `product` no instante `when`.
+
+    Usa o último snapshot anterior mais os movimentos seguintes; sem snapshot anterior,
+    parte do snapshot seguinte (ou do stock atual) e desconta os movimentos entretanto.
+    """
+    previous = product.snapshots.filter(taken_at__lte=when).order_by('-taken_at').first()
+    if previous is not None:
+        return previous.stock + _delta(product.pk, after=previous.taken_at, until=when)
+
+    following = product.snapshots.filter(taken_at__gt=when).order_by('taken_at').first()
+    if following is not None:
+        return following.stock - _delta(product.pk, after=when, until=following.taken_at)
+
+    return product.stock - _delta(product.pk, after=when)
+
+
+def take_snapshots():
+    """Regista o stock atual de todos os produtos num único insert em lote"""
+    with transaction.atomic():
+        now = timezone.now()
+        snapshots = [
+            StockSnapshot(product_id=product_id, stock=stock, taken_at=now)
+            for product_id, stock in Product.objects.values_list('id', 'stock')
+        ]
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return now, len(snapshots)
+
+
+def compact_movements(keep_days=KEEP_DAYS, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Move para ArchivedStockMovement os movimentos anteriores a `keep_days` dias.
+    Cada lote é copiado e apagado na mesma transação; se for interrompido,
+    basta voltar a correr (as cópias já feitas são ignoradas).
+    """
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockMovement.objects
+                .filter(created_at__lt=cutoff)
+                .order_by('id')
+                .values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            ArchivedStockMovement.objects.bulk_create(
+                [ArchivedStockMovement(**row) for row in rows],
+                ignore_conflicts=True,
+            )
+            StockMovement.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+    return moved
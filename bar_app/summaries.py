@@ -0,0 +1,71 @@
+"""
+Resumo por utilizador mostrado na navbar e no perfil: saldo, nº de pedidos, gastos e limite diário
+
+Lido numa única query (utilizador + SpendingCounter, sem agregados) e guardado na cache
+(bar_app.caching) numa chave por dia, para que os gastos do dia nunca passem a meia-noite.
+Os sinais em bar_app.signals invalidam-no quando uma Transaction, um Order, o contador ou o
+próprio utilizador são gravados; operações em bulk (que não disparam sinais) têm de chamar
+invalidate_many explicitamente.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.utils import timezone
+
+from . import caching
+from .models import User
+
+
+Summary = namedtuple('Summary', [
+    'balance', 'order_count', 'total_spent', 'month_spent', 'today_spent', 'daily_limit', 'remaining_today',
+])
+
+TIMEOUT = 3600
+ZERO = Decimal('0.00')
+
+
+def _key(user_id):
+    return caching.key('user_summary', user_id, timezone.localdate().isoformat())
+
+
+def compute(user_id):
+    """Resumo lido da base de dados (uma query)"""
+    row = User.objects.filter(pk=user_id).values(
+        'balance', 'spending__order_count', 'spending__lifetime_spent', 'spending__daily_limit',
+        'spending__day', 'spending__daily_spent', 'spending__month', 'spending__monthly_spent',
+    ).first()
+    if row is None:
+        return None
+    today = timezone.localdate()
+    # Sem contador ainda (nenhuma compra) os valores vêm a None
+    today_spent = row['spending__daily_spent'] if row['spending__day'] == today else ZERO
+    month_spent = row['spending__monthly_spent'] if row['spending__month'] == today.replace(day=1) else ZERO
+    daily_limit = row['spending__daily_limit']
+    return Summary(
+        balance=row['balance'],
+        order_count=row['spending__order_count'] or 0,
+        total_spent=row['spending__lifetime_spent'] or ZERO,
+        month_spent=month_spent,
+        today_spent=today_spent,
+        daily_limit=daily_limit,
+        remaining_today=None if daily_limit is None else max(ZERO, daily_limit - today_spent),
+    )
+
+
+def get(user_id):
+    """Resumo do utilizador (da cache sempre que possível)"""
+    return caching.get_or_set(_key(user_id), lambda: compute(user_id), TIMEOUT)
+
+
+def version(user_id):
+    """Muda sempre que o resumo é invalidado (sem calcular o resumo)"""
+    return caching.generation(_key(user_id))
+
+
+def invalidate(user_id):
+    caching.invalidate(_key(user_id))
+
+
+def invalidate_many(user_ids):
+    for user_id in set(user_ids):
+        invalidate(user_id)
@@ -0,0 +1,49 @@
+"""
+Tarefas em segundo plano (ver bar_app.jobs)
+"""
+from . import alerts, receipts
+from .jobs import task
+from .models import Order, StockMovement
+
+
+@task('record_stock_alerts')
+def record_stock_alerts(product_ids, source):
+    """Cria os alertas dos produtos que uma venda levou ao stock mínimo (detetados no checkout)"""
+    alerts.record_crossings(product_ids, source)
+
+
+@task('record_order_stock_movements')
+def record_order_stock_movements(order_id, low_stock=()):
+    """
+    Tarefas antigas, de quando os movimentos não eram gravados no checkout: regista os
+    movimentos de saída de stock de um pedido (o stock já foi atualizado no checkout).
+    Os movimentos ficam com a data do pedido, para a reconciliação com os snapshots bater certo.
+    `low_stock` são os produtos que a venda levou ao stock mínimo (detetados no checkout).
+    """
+    if low_stock:
+        alerts.record_crossings(low_stock, 'checkout')
+
+    if StockMovement.objects.filter(order_id=order_id, movement_type='out').exists():
+        return
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+
+    movements = StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=item.product_id,
+            movement_type='out',
+            quantity=item.quantity,
+            reason=f'Pedido {order.order_number}',
+            order=order,
+            created_by_id=order.user_id,
+        )
+        for item in order.items.all()
+    ])
+    StockMovement.objects.filter(pk__in=[movement.pk for movement in movements]).update(created_at=order.created_at)
+
+
+@task('generate_receipt')
+def generate_receipt(order_id):
+    """Gera o recibo de um pedido que chegou a um estado final"""
+    receipts.generate_receipts([order_id])
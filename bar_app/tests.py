@@ -0,0 +1,1070 @@
+"""
+Testes da bar_app
+
+Correm na base de dados de testes e com uma cache em memória própria (TEST_CACHES),
+sem tocar na base de dados nem na cache reais.
+"""
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bar_app import (
+    forecasting, history, identity, idempotency, jobs, metrics, multibanco, receipts, reconciliation, services,
+    spending, stock, summaries, throttling,
+)
+from bar_app.models import (
+    User, Student, Category, Product, Order, OrderItem,
+    Transaction, StockMovement, StockSnapshot, Job, PaymentReference, ArchivedStockMovement,
+    SpendingCounter, ArchivedOrder, ArchivedTransaction, ApiToken
+)
+
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bar-tests'}}
+
+
+# Número de queries de cada view, igual a todas as escalas.
+# (sessão + utilizador contam 2 queries em todas as páginas autenticadas)
+QUERY_BUDGETS = {
+    'home': 4,
+    'menu': 6,
+    'cart': 3,
+    'checkout': 3,
+    'order_list': 5,
+    'order_detail': 5,
+    'profile': 4,
+    'transaction_list': 4,
+    'dashboard': 7,
+    'manage_products': 3,
+    'manage_orders': 5,
+    'manage_stock': 4,
+    'pick_list': 4,
+    'pos': 3,
+    'api_products': 5,
+    'api_cart': 3,
+    'api_orders': 3,
+    'admin_order_changelist': 5,
+    'admin_order_change': 9,
+    'admin_transaction_changelist': 5,
+    'admin_stockmovement_changelist': 5,
+}
+
+# Linhas de cada tabela criadas em cada escala
+SCALES = (10, 100, 1000)
+
+CART_SIZE = 5
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryBudgetTests(TestCase):
+    """Cada view (e changelist do admin) faz sempre o mesmo número de queries, seja qual for o volume de dados"""
+
+    def _build_fixtures(self, scale):
+        """Cria `scale` produtos, pedidos, transações e movimentos de stock"""
+        tag = uuid.uuid4().hex[:8]
+        student = User.objects.create_user(username=f'qb-aluno-{tag}', password='x', user_type='aluno')
+        staff = User.objects.create_superuser(username=f'qb-staff-{tag}', password='x', user_type='staff')
+
+        category = Category.objects.create(name=f'qb-{tag}')
+        products = Product.objects.bulk_create([
+            Product(name=f'Produto {i}', category=category, price=Decimal('1.50'), stock=100)
+            for i in range(scale)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(
+                user=student, order_number=f'QB{tag}{i:06d}', payment_method='card',
+                total_amount=Decimal('3.00'), scheduled_date=date.today(), scheduled_time=time(10, 30),
+            )
+            for i in range(scale)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[(i + j) % scale], quantity=1,
+                      unit_price=Decimal('1.50'), subtotal=Decimal('1.50'))
+            for i, order in enumerate(orders) for j in range(2)
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(user=student, transaction_type='payment', amount=Decimal('3.00'),
+                        order=order, description=f'Pagamento pedido {order.order_number}')
+            for order in orders
+        ])
+        StockMovement.objects.bulk_create([
+            StockMovement(product=products[i % scale], movement_type='out', quantity=1,
+                          reason='Pedido', order=order, created_by=student)
+            for i, order in enumerate(orders)
+        ])
+        return student, staff, products, orders
+
+    def _pages(self, scale):
+        """{nome: (cliente, URL)} com os clientes já autenticados e o carrinho preenchido"""
+        student, staff, products, orders = self._build_fixtures(scale)
+
+        student_client = Client()
+        student_client.force_login(student)
+        session = student_client.session
+        session['cart'] = {str(product.pk): 1 for product in products[:CART_SIZE]}
+        session.save()
+
+        staff_client = Client()
+        staff_client.force_login(staff)
+
+        # Resumos da navbar já em cache: mede-se o caso normal (numa falha o cálculo custa uma query)
+        for user in (student, staff):
+            summaries.invalidate(user.pk)
+            summaries.get(user.pk)
+
+        return {
+            'home': (student_client, reverse('bar_app:home')),
+            'menu': (student_client, reverse('bar_app:menu')),
+            'cart': (student_client, reverse('bar_app:cart')),
+            'checkout': (student_client, reverse('bar_app:checkout')),
+            'order_list': (student_client, reverse('bar_app:order_list')),
+            'order_detail': (student_client, reverse('bar_app:order_detail', args=[orders[0].pk])),
+            'profile': (student_client, reverse('bar_app:profile')),
+            'transaction_list': (student_client, reverse('bar_app:transaction_list')),
+            'dashboard': (staff_client, reverse('bar_app:dashboard')),
+            'manage_products': (staff_client, reverse('bar_app:manage_products')),
+            'manage_orders': (staff_client, reverse('bar_app:manage_orders')),
+            'manage_stock': (staff_client, reverse('bar_app:manage_stock')),
+            'pick_list': (staff_client, reverse('bar_app:pick_list')),
+            'pos': (staff_client, reverse('bar_app:pos')),
+            'api_products': (student_client, reverse('bar_app:api_products')),
+            'api_cart': (student_client, reverse('bar_app:api_cart')),
+            'api_orders': (student_client, reverse('bar_app:api_orders')),
+            'admin_order_changelist': (staff_client, reverse('admin:bar_app_order_changelist')),
+            'admin_order_change': (staff_client, reverse('admin:bar_app_order_change', args=[orders[0].pk])),
+            'admin_transaction_changelist': (staff_client, reverse('admin:bar_app_transaction_changelist')),
+            'admin_stockmovement_changelist': (staff_client, reverse('admin:bar_app_stockmovement_changelist')),
+        }
+
+    def test_query_budgets(self):
+        for scale in SCALES:
+            # Cada escala parte de uma base de dados vazia
+            with transaction.atomic():
+                pages = self._pages(scale)
+                self.assertEqual(set(pages), set(QUERY_BUDGETS))
+                for name, (client, url) in pages.items():
+                    with self.subTest(view=name, scale=scale):
+                        # Cache de ContentType vazia em todas as escalas para contagens comparáveis
+                        ContentType.objects.clear_cache()
+                        with self.assertNumQueries(QUERY_BUDGETS[name]):
+                            response = client.get(url)
+                        self.assertEqual(response.status_code, 200)
+                transaction.set_rollback(True)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IdentityTests(TestCase):
+
+    def _user(self, username):
+        return User.objects.create_user(username=username, password='x', user_type='aluno')
+
+    def _student(self, username, number):
+        user = self._user(username)
+        Student.objects.create(user=user, student_number=number, grade='9', class_name='A')
+        return user
+
+    def test_student_number_beats_username_of_an_earlier_user(self):
+        other = self._user('A10000499')
+        student = self._student('aluno500', 'A10000499')
+        identity.rebuild()
+
+        self.assertEqual(identity.resolve('a10000499').user_id, student.pk)
+        self.assertNotEqual(student.pk, other.pk)
+
+    def test_student_number_beats_username_of_a_later_user(self):
+        student = self._student('aluno500', 'A10000499')
+        self._user('A10000499')
+        identity.rebuild()
+
+        self.assertEqual(identity.resolve('A10000499').user_id, student.pk)
+
+    def test_refresh_applies_priority(self):
+        self._user('A10000499')
+        identity.rebuild()
+        student = self._student('aluno500', 'A10000499')
+        identity.refresh_user(student.pk)
+
+        self.assertEqual(identity.resolve('A10000499').user_id, student.pk)
+
+    def test_refresh_restores_username_hidden_by_a_deactivated_user(self):
+        other = self._user('A10000499')
+        student = self._student('aluno500', 'A10000499')
+        identity.rebuild()
+
+        User.objects.filter(pk=student.pk).update(is_active=False)
+        identity.refresh_user(student.pk)
+
+        self.assertEqual(identity.resolve('A10000499').user_id, other.pk)
+        self.assertIsNone(identity.resolve('aluno500'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StockMovementTests(TestCase):
+    """Os movimentos de saída são gravados com a venda, sem depender do worker"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('50.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=6, min_stock=5)
+
+    def test_checkout_records_out_movements(self):
+        order = Order(payment_method='card', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        order, _ = services.place_order(self.customer, {str(self.product.pk): 2}, order)
+
+        movement = StockMovement.objects.get(order=order)
+        self.assertEqual((movement.product_id, movement.movement_type, movement.quantity), (self.product.pk, 'out', 2))
+        self.assertFalse(Job.objects.filter(task='record_order_stock_movements').exists())
+        alert_job = Job.objects.get(task='record_stock_alerts')
+        self.assertEqual(alert_job.payload, {'product_ids': [self.product.pk], 'source': 'checkout'})
+
+    def test_pos_sale_records_out_movements(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=20)
+        order, _ = services.pos_sale(self.customer, [self.product.pk])
+
+        movement = StockMovement.objects.get(order=order)
+        self.assertEqual((movement.movement_type, movement.quantity), ('out', 1))
+        self.assertFalse(Job.objects.filter(task='record_stock_alerts').exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cliente', password='x')
+        Transaction.objects.create(user=self.user, transaction_type='topup', amount=Decimal('10.00'), description='Carregamento')
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=0)
+        StockMovement.objects.create(product=self.product, movement_type='in', quantity=8, reason='Entrada', created_by=self.user)
+        Product.objects.filter(pk=self.product.pk).update(stock=8)
+
+    def test_balances_report_without_changing(self):
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('7.00'))
+
+        checked, discrepancies = reconciliation.reconcile_balances()
+
+        self.assertEqual(discrepancies, [reconciliation.Discrepancy(self.user.pk, 'cliente', Decimal('7.00'), Decimal('10.00'))])
+        self.assertEqual(User.objects.get(pk=self.user.pk).balance, Decimal('7.00'))
+
+    def test_balances_repair(self):
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('7.00'))
+
+        reconciliation.reconcile_balances(repair=True)
+
+        self.assertEqual(User.objects.get(pk=self.user.pk).balance, Decimal('10.00'))
+        self.assertEqual(reconciliation.reconcile_balances()[1], [])
+
+    def test_corrections_keep_concurrent_changes(self):
+        # Divergência lida com saldo 7; entretanto um carregamento de 2 fez commit
+        discrepancy = reconciliation.Discrepancy(self.user.pk, 'cliente', Decimal('7.00'), Decimal('10.00'))
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('9.00'))
+
+        reconciliation._apply_corrections(User, 'balance', [discrepancy], User._meta.get_field('balance'))
+
+        self.assertEqual(User.objects.get(pk=self.user.pk).balance, Decimal('12.00'))
+
+    def test_stock_repair_requires_a_snapshot(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+
+        with self.assertRaises(reconciliation.MissingBaseline):
+            reconciliation.reconcile_stock(repair=True)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 5)
+
+    def test_stock_repair_from_snapshot(self):
+        StockSnapshot.objects.create(product=self.product, stock=8, taken_at=timezone.now())
+        StockMovement.objects.create(product=self.product, movement_type='out', quantity=3, reason='Venda', created_by=self.user)
+        Product.objects.filter(pk=self.product.pk).update(stock=4)
+
+        checked, discrepancies = reconciliation.reconcile_stock(repair=True)
+
+        self.assertEqual([(d.actual, d.expected) for d in discrepancies], [(4, 5)])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 5)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OrderDetailCacheTests(TestCase):
+
+    def test_multibanco_payment_changes_order_etag(self):
+        customer = User.objects.create_user(username='cliente', password='x')
+        category = Category.objects.create(name='Bebidas')
+        product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+        order = Order(payment_method='atm', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        order, _ = services.place_order(customer, {str(product.pk): 1}, order)
+        reference = PaymentReference.objects.get(order=order)
+
+        client = Client()
+        client.force_login(customer)
+        url = reverse('bar_app:order_detail', args=[order.pk])
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        line = f'{timezone.localtime():%Y-%m-%d %H:%M};{reference.entity};{reference.reference};{reference.amount}'
+        result = multibanco.settle([line])
+
+        self.assertEqual(len(result.settled), 1)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ForecastingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cliente', password='x')
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+
+    def _out(self, quantity, created_at, archived=False):
+        movement = StockMovement.objects.create(product=self.product, movement_type='out', quantity=quantity, reason='Venda', created_by=self.user)
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=created_at)
+        if archived:
+            stock.compact_movements(keep_days=0)
+
+    def test_daily_consumption_uses_local_days_and_archive(self):
+        today = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(today, time.min))
+        self._out(3, midnight - timedelta(days=1) + timedelta(hours=9), archived=True)
+        self._out(2, midnight + timedelta(hours=9))
+        self._out(5, midnight - timedelta(minutes=30))
+
+        self.assertEqual(ArchivedStockMovement.objects.count(), 1)
+
+        consumption = forecasting.daily_consumption(today - timedelta(days=1))
+
+        self.assertEqual(consumption[self.product.pk], {today: 2, today - timedelta(days=1): 8})
+        self.assertEqual(forecasting.daily_consumption(today)[self.product.pk], {today: 2})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IdempotentOrderTests(TestCase):
+    """Checkout (HTML e API) e venda ao balcão partilham o mesmo tratamento das repetições"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('20.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+
+    def _order(self):
+        return Order(payment_method='card', scheduled_date=date.today(), scheduled_time=time(10, 30))
+
+    def test_place_order_replay_returns_the_same_order(self):
+        cart = {str(self.product.pk): 2}
+        first, created = services.place_order(self.customer, cart, self._order(), 'k1')
+        self.assertTrue(created)
+
+        again, created = services.place_order(self.customer, cart, self._order(), 'k1')
+
+        self.assertFalse(created)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 8)
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('17.60'))
+
+    def test_pos_sale_replay_returns_the_same_order(self):
+        first, _ = services.pos_sale(self.customer, [self.product.pk], 'pos:1:k1')
+
+        again, created = services.pos_sale(self.customer, [self.product.pk], 'pos:1:k1')
+
+        self.assertFalse(created)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 9)
+
+    def test_replayed_order_is_per_user(self):
+        order, _ = services.place_order(self.customer, {str(self.product.pk): 1}, self._order(), 'k1')
+        other = User.objects.create_user(username='outro', password='x')
+
+        self.assertEqual(services.replayed_order(self.customer.pk, 'k1'), order)
+        self.assertIsNone(services.replayed_order(other.pk, 'k1'))
+        self.assertIsNone(services.replayed_order(self.customer.pk, None))
+
+    def test_api_checkout_replay(self):
+        client = Client()
+        client.force_login(self.customer)
+        session = client.session
+        session['cart'] = {str(self.product.pk): 1}
+        session.save()
+        body = {'scheduled_date': date.today().isoformat(), 'scheduled_time': '10:30', 'payment_method': 'card'}
+
+        first = client.post(reverse('bar_app:api_checkout'), body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc')
+        again = client.post(reverse('bar_app:api_checkout'), body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual((first.status_code, again.status_code), (201, 200))
+        self.assertEqual(first.json()['id'], again.json()['id'])
+
+    def _checkout_client(self):
+        client = Client()
+        client.force_login(self.customer)
+        session = client.session
+        session['cart'] = {str(self.product.pk): 1}
+        session.save()
+        return client
+
+    def _checkout_form(self, token):
+        return {
+            'scheduled_date': date.today().isoformat(), 'scheduled_time': '10:30', 'payment_method': 'card',
+            'checkout_token': token,
+        }
+
+    def test_html_checkout_token_replay(self):
+        client = self._checkout_client()
+        form = self._checkout_form(idempotency.issue_token(self.customer.pk))
+
+        first = client.post(reverse('bar_app:checkout'), form)
+        # Reenvio depois de o carrinho ter sido esvaziado: leva ao mesmo pedido
+        again = client.post(reverse('bar_app:checkout'), form)
+
+        order = Order.objects.get(user=self.customer)
+        detail_url = reverse('bar_app:order_detail', args=[order.pk])
+        self.assertRedirects(first, detail_url, fetch_redirect_response=False)
+        self.assertRedirects(again, detail_url, fetch_redirect_response=False)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 9)
+
+    def test_html_checkout_refuses_forged_token(self):
+        client = self._checkout_client()
+
+        response = client.post(reverse('bar_app:checkout'), self._checkout_form('inventado'))
+
+        self.assertRedirects(response, reverse('bar_app:checkout'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write(self, process_id, value):
+        rows = [['bar_topups_total', [], value]]
+        (self.directory / f'{process_id}.json').write_text(json.dumps(rows), encoding='utf-8')
+
+    def test_collect_drops_files_of_dead_processes(self):
+        self._write(f'{os.getppid()}-1', 2)
+        # Acima do pid máximo do Linux: nenhum processo o pode ter
+        self._write('99999999-1', 5)
+
+        with override_settings(METRICS_DIR=str(self.directory)):
+            totals = metrics.collect()
+
+        self.assertEqual(totals.get(('bar_topups_total', ())), 2 + metrics.snapshot().get(('bar_topups_total', ()), 0))
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()), [f'{os.getppid()}-1.json'])
+
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_without_token_is_staff_only(self):
+        url = reverse('bar_app:metrics')
+        self.assertEqual(Client().get(url).status_code, 403)
+
+        client = Client()
+        client.force_login(User.objects.create_user(username='aluno', password='x'))
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.force_login(User.objects.create_user(username='func', password='x', user_type='staff'))
+        self.assertEqual(client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='segredo')
+    def test_endpoint_with_token(self):
+        url = reverse('bar_app:metrics')
+        self.assertEqual(Client().get(url).status_code, 403)
+        self.assertEqual(Client().get(url, HTTP_AUTHORIZATION='Bearer outro').status_code, 403)
+
+        metrics.inc('bar_order_status_conflicts_total')
+        response = Client().get(url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE bar_order_status_conflicts_total counter', response.content.decode())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OrderStatusTests(TestCase):
+    """Transições de estado permitidas e conflitos de versão"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('20.00'))
+        self.staff = User.objects.create_user(username='funcionario', password='x', user_type='staff')
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+        order = Order(payment_method='card', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        self.order, _ = services.place_order(self.customer, {str(self.product.pk): 2}, order, None)
+
+    def _post_status(self, status, current_status, version):
+        client = Client()
+        client.force_login(self.staff)
+        return client.post(
+            reverse('bar_app:update_order_status', args=[self.order.pk]),
+            {'status': status, 'current_status': current_status, 'version': version},
+        )
+
+    def test_allowed_transitions(self):
+        self.assertTrue(self.order.can_transition_to('confirmed'))
+        self.assertFalse(self.order.can_transition_to('delivered'))
+        self.assertTrue(self.order.can_be_cancelled())
+
+        self.order.status = 'preparing'
+        self.assertFalse(self.order.can_be_cancelled())
+        self.order.status = 'delivered'
+        self.assertEqual(list(self.order.allowed_transitions()), [])
+
+    def test_transition_bumps_version(self):
+        version = self.order.version
+
+        services.transition_order(self.order, 'confirmed')
+
+        saved = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((saved.status, saved.version), ('confirmed', version + 1))
+        self.assertEqual((self.order.status, self.order.version), ('confirmed', version + 1))
+
+    def test_invalid_transition_is_refused(self):
+        with self.assertRaises(services.ServiceError) as error:
+            services.transition_order(self.order, 'delivered')
+
+        self.assertEqual(error.exception.reason, 'transition')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'pending')
+
+    def test_stale_version_is_a_conflict(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        services.transition_order(self.order, 'confirmed')
+
+        with self.assertRaises(services.ServiceError) as error:
+            services.transition_order(stale, 'cancelled')
+
+        self.assertEqual(error.exception.reason, 'conflict')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'confirmed')
+
+    def test_view_refuses_stale_form(self):
+        seen_version = self.order.version
+        services.transition_order(self.order, 'confirmed')
+
+        self._post_status('cancelled', 'pending', seen_version)
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'confirmed')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 8)
+
+    def test_staff_cancel_restores_stock_and_refunds(self):
+        self._post_status('cancelled', self.order.status, self.order.version)
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'cancelled')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 10)
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('20.00'))
+        self.assertTrue(Transaction.objects.filter(order=self.order, transaction_type='refund').exists())
+        counter = SpendingCounter.objects.get(user=self.customer)
+        self.assertEqual(counter.spent_on(timezone.localdate()), Decimal('0.00'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MultibancoTests(TestCase):
+    """Referências Multibanco: dígitos de controlo, leitura do extrato e liquidação"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('5.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+
+    def _topup_reference(self, amount='10.00'):
+        reference = PaymentReference(user=self.customer, purpose='topup', amount=Decimal(amount))
+        return multibanco.issue([reference])[0]
+
+    def _order_reference(self):
+        order = Order(payment_method='atm', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        order, _ = services.place_order(self.customer, {str(self.product.pk): 2}, order)
+        return order, PaymentReference.objects.get(order=order)
+
+    def _line(self, reference, amount=None, paid_at=None):
+        paid_at = paid_at or timezone.localtime()
+        return f'{paid_at:%Y-%m-%d %H:%M};{reference.entity};{reference.reference};{amount or reference.amount}'
+
+    def _reasons(self, result):
+        return [problem.reason for problem in result.problems]
+
+    def test_reference_is_only_valid_for_its_amount(self):
+        reference = multibanco.make_reference('12345', 42, Decimal('7.50'))
+
+        self.assertEqual(len(reference), 9)
+        self.assertTrue(reference.startswith('0000042'))
+        self.assertTrue(multibanco.is_valid('12345', reference, Decimal('7.50')))
+        self.assertFalse(multibanco.is_valid('12345', reference, Decimal('7.51')))
+        self.assertFalse(multibanco.is_valid('12345', reference[:8] + str((int(reference[8]) + 1) % 10), Decimal('7.50')))
+
+    def test_parse_statement(self):
+        lines, problems = multibanco.parse_statement([
+            'data;entidade;referencia;montante',
+            '',
+            '18/10/2026 09:15;12345;000 004 212;7,50',
+            '2026-10-18,12345,000004212,7.50',
+            'isto não é uma linha',
+        ])
+
+        self.assertEqual([line.line_number for line in lines], [3, 4])
+        self.assertEqual({line.reference for line in lines}, {'000004212'})
+        self.assertEqual({line.amount for line in lines}, {Decimal('7.50')})
+        self.assertEqual([(problem.line_number, problem.reason) for problem in problems], [(5, 'invalid')])
+
+    def test_match_problems(self):
+        reference = self._topup_reference()
+        expired = self._topup_reference('3.00')
+        PaymentReference.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(hours=1))
+        unknown = multibanco.make_reference(reference.entity, reference.sequence + 100, Decimal('1.00'))
+
+        result = multibanco.settle([
+            self._line(reference, amount='9.99'),
+            self._line(reference),
+            self._line(reference),
+            self._line(expired),
+            f'2026-10-18;{reference.entity};{unknown};1.00',
+            f'2026-10-18;{reference.entity};{unknown[:8]}{(int(unknown[8]) + 1) % 10};1.00',
+        ], dry_run=True)
+
+        self.assertEqual(len(result.settled), 1)
+        self.assertEqual(self._reasons(result), ['amount', 'duplicate', 'expired', 'unknown', 'check_digits'])
+        self.assertEqual(PaymentReference.objects.get(pk=reference.pk).status, 'pending')
+
+    def test_topup_credits_balance(self):
+        reference = self._topup_reference()
+
+        multibanco.settle([self._line(reference)])
+
+        self.assertEqual(PaymentReference.objects.get(pk=reference.pk).status, 'paid')
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('15.00'))
+        self.assertEqual(self._reasons(multibanco.settle([self._line(reference)])), ['unknown'])
+
+    def test_order_payment_keeps_balance(self):
+        order, reference = self._order_reference()
+
+        multibanco.settle([self._line(reference)])
+
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('5.00'))
+        self.assertEqual(
+            sorted(Transaction.objects.filter(user=self.customer).values_list('transaction_type', flat=True)),
+            ['payment', 'topup'],
+        )
+        self.assertTrue(Transaction.objects.filter(order=order, transaction_type='payment').exists())
+
+    def test_payment_of_cancelled_order_goes_to_balance(self):
+        order, reference = self._order_reference()
+        services.cancel_order(order, self.customer)
+
+        multibanco.settle([self._line(reference)])
+
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('7.40'))
+        self.assertFalse(Transaction.objects.filter(order=order, transaction_type='payment').exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SpendingTests(TestCase):
+    """Contadores de gastos: limite diário e mudança de dia e de mês"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('50.00'))
+        self.today = date(2026, 10, 19)
+
+    def _counter(self):
+        return SpendingCounter.objects.get(user=self.customer)
+
+    def test_first_order_creates_the_counter(self):
+        self.assertTrue(spending.record_order(self.customer.pk, Decimal('2.50'), self.today))
+
+        counter = self._counter()
+        self.assertEqual(counter.spent_on(self.today), Decimal('2.50'))
+        self.assertEqual(counter.spent_in_month(self.today), Decimal('2.50'))
+        self.assertEqual((counter.lifetime_spent, counter.order_count), (Decimal('2.50'), 1))
+
+    def test_daily_limit(self):
+        SpendingCounter.objects.create(user=self.customer, daily_limit=Decimal('5.00'))
+
+        self.assertTrue(spending.record_order(self.customer.pk, Decimal('3.00'), self.today))
+        self.assertFalse(spending.record_order(self.customer.pk, Decimal('2.50'), self.today))
+        self.assertTrue(spending.record_order(self.customer.pk, Decimal('2.00'), self.today))
+        # Pedidos que não gastam do saldo contam mas não são limitados
+        self.assertTrue(spending.record_order(self.customer.pk, Decimal('0.00'), self.today))
+
+        counter = self._counter()
+        self.assertEqual((counter.spent_on(self.today), counter.order_count), (Decimal('5.00'), 3))
+
+    def test_day_and_month_rollover(self):
+        SpendingCounter.objects.create(user=self.customer, daily_limit=Decimal('5.00'))
+        spending.record_order(self.customer.pk, Decimal('4.00'), date(2026, 9, 30))
+
+        self.assertTrue(spending.record_order(self.customer.pk, Decimal('4.00'), date(2026, 10, 1)))
+        self.assertTrue(spending.record_order(self.customer.pk, Decimal('1.00'), date(2026, 10, 2)))
+
+        counter = self._counter()
+        self.assertEqual(counter.spent_on(date(2026, 10, 1)), Decimal('0.00'))
+        self.assertEqual(counter.spent_on(date(2026, 10, 2)), Decimal('1.00'))
+        self.assertEqual(counter.spent_in_month(date(2026, 10, 2)), Decimal('5.00'))
+        self.assertEqual(counter.lifetime_spent, Decimal('9.00'))
+
+    def test_refund(self):
+        spending.record_order(self.customer.pk, Decimal('4.00'), self.today - timedelta(days=1))
+        spending.record_order(self.customer.pk, Decimal('3.00'), self.today)
+
+        spending.record_refund(self.customer.pk, Decimal('4.00'), self.today - timedelta(days=1))
+
+        counter = self._counter()
+        # Pagamento de ontem: o gasto de hoje não muda, o do mês e o total sim
+        self.assertEqual(counter.spent_on(self.today), Decimal('3.00'))
+        self.assertEqual(counter.spent_in_month(self.today), Decimal('3.00'))
+        self.assertEqual(counter.lifetime_spent, Decimal('3.00'))
+
+    def test_checkout_over_the_limit_is_refused(self):
+        SpendingCounter.objects.create(user=self.customer, daily_limit=Decimal('2.00'))
+        category = Category.objects.create(name='Bebidas')
+        product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+        order = Order(payment_method='card', scheduled_date=date.today(), scheduled_time=time(10, 30))
+
+        with self.assertRaises(services.ServiceError) as error:
+            services.place_order(self.customer, {str(product.pk): 2}, order)
+
+        self.assertEqual(error.exception.reason, 'limit')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 10)
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('50.00'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PosSaleTests(TestCase):
+    """Venda ao balcão: stock e saldo verificados na própria linha"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('5.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=3)
+
+    def test_sale_debits_balance_once(self):
+        order, created = services.pos_sale(self.customer, [self.product.pk, self.product.pk])
+
+        self.assertTrue(created)
+        self.assertEqual(order.status, 'delivered')
+        self.assertEqual(order.total_amount, Decimal('2.40'))
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('2.60'))
+        self.assertEqual(self.customer.balance, Decimal('2.60'))
+        self.assertEqual(Transaction.objects.filter(order=order, transaction_type='payment').count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 1)
+
+    def test_insufficient_stock(self):
+        with self.assertRaises(services.ServiceError) as error:
+            services.pos_sale(self.customer, [self.product.pk] * 4)
+
+        self.assertEqual(error.exception.reason, 'stock')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_stale_balance_in_memory_is_not_trusted(self):
+        # O cliente gastou o saldo noutro sítio depois de ser carregado para o balcão
+        User.objects.filter(pk=self.customer.pk).update(balance=Decimal('1.00'))
+
+        with self.assertRaises(services.ServiceError) as error:
+            services.pos_sale(self.customer, [self.product.pk, self.product.pk])
+
+        self.assertEqual(error.exception.reason, 'balance')
+        self.assertEqual(User.objects.get(pk=self.customer.pk).balance, Decimal('1.00'))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 3)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class HistoryTests(TestCase):
+    """Arquivo de anos letivos fechados e histórico de transações por ano"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('20.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+        self.old_year = history.school_year_of(timezone.localdate() - timedelta(days=400))
+        start, _ = history.school_year_bounds(self.old_year)
+
+        old = Order(payment_method='card', scheduled_date=start.date(), scheduled_time=time(10, 30))
+        self.old_order, _ = services.place_order(self.customer, {str(self.product.pk): 1}, old)
+        Order.objects.filter(pk=self.old_order.pk).update(created_at=start + timedelta(days=10))
+        Transaction.objects.filter(order=self.old_order).update(created_at=start + timedelta(days=10))
+
+        current = Order(payment_method='card', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        self.current_order, _ = services.place_order(self.customer, {str(self.product.pk): 2}, current)
+
+    def test_archive_moves_only_the_closed_year(self):
+        self.assertEqual(history.archive_school_year(self.old_year), (1, 1))
+
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.current_order.pk])
+        self.assertFalse(OrderItem.objects.filter(order_id=self.old_order.pk).exists())
+        archived = ArchivedTransaction.objects.get(user=self.customer)
+        self.assertEqual((archived.school_year, archived.order_number), (self.old_year, self.old_order.order_number))
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.old_order.pk, school_year=self.old_year).exists())
+        # Repetir não faz nada; o ano corrente não pode ser arquivado
+        self.assertEqual(history.archive_school_year(self.old_year), (0, 0))
+        with self.assertRaises(ValueError):
+            history.archive_school_year(history.current_school_year())
+
+    def test_transaction_list_by_year(self):
+        history.archive_school_year(self.old_year)
+        client = Client()
+        client.force_login(self.customer)
+
+        current = client.get(reverse('bar_app:transaction_list'))
+        archived = client.get(reverse('bar_app:transaction_list'), {'year': self.old_year})
+        unknown = client.get(reverse('bar_app:transaction_list'), {'year': '1999-2000'})
+
+        self.assertEqual(current.context['archived_years'], [self.old_year])
+        self.assertEqual([t.order_id for t in current.context['transactions']], [self.current_order.pk])
+        self.assertEqual(archived.context['selected_year'], self.old_year)
+        self.assertEqual([t.order_number for t in archived.context['transactions']], [self.old_order.order_number])
+        self.assertIsNone(unknown.context['selected_year'])
+        self.assertEqual(len(unknown.context['transactions']), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class JobQueueTests(TestCase):
+    """Fila de tarefas: idempotência, reserva, retries e tarefas abandonadas"""
+
+    def setUp(self):
+        self.calls = []
+        jobs.load_tasks()
+
+        @jobs.task('tests.record', max_attempts=2)
+        def record(value, fail=False):
+            self.calls.append(value)
+            if fail:
+                raise RuntimeError('falhou')
+
+        self.addCleanup(jobs.TASKS.pop, 'tests.record')
+
+    def test_enqueue_with_idempotency_key_creates_one_job(self):
+        jobs.enqueue('tests.record', {'value': 1}, idempotency_key='k1')
+        jobs.enqueue('tests.record', {'value': 1}, idempotency_key='k1')
+
+        self.assertEqual(Job.objects.filter(task='tests.record').count(), 1)
+        self.assertEqual(Job.objects.get(task='tests.record').max_attempts, 2)
+
+    def test_claim_reserves_each_job_once(self):
+        jobs.enqueue('tests.record', {'value': 1})
+        jobs.enqueue('tests.record', {'value': 2}, delay=timedelta(hours=1))
+
+        claimed = jobs.claim('w1', limit=5)
+
+        self.assertEqual([job.payload for job in claimed], [{'value': 1}])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), ('running', 1))
+        self.assertEqual(jobs.claim('w2', limit=5), [])
+
+    def test_run_success(self):
+        jobs.enqueue('tests.record', {'value': 1})
+        job, = jobs.claim('w1')
+
+        self.assertEqual(jobs.run(job), 'done')
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'done')
+
+    def test_failures_are_retried_then_failed(self):
+        jobs.enqueue('tests.record', {'value': 1, 'fail': True})
+        job, = jobs.claim('w1')
+
+        self.assertEqual(jobs.run(job), 'retry')
+        retry = Job.objects.get(pk=job.pk)
+        self.assertEqual((retry.status, retry.locked_by), ('pending', ''))
+        self.assertIn('falhou', retry.last_error)
+        self.assertGreater(retry.run_at, timezone.now())
+        self.assertEqual(jobs.claim('w1'), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        job, = jobs.claim('w1')
+        self.assertEqual(jobs.run(job), 'failed')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'failed')
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_stale_running_jobs_are_requeued(self):
+        jobs.enqueue('tests.record', {'value': 1})
+        job, = jobs.claim('w1')
+        self.assertEqual(jobs.requeue_stale(), 0)
+
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.LOCK_TIMEOUT - timedelta(minutes=1))
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job, = jobs.claim('w2')
+        self.assertEqual(job.attempts, 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ThrottlingTests(TestCase):
+    """Token bucket por cliente e vagas de checkout"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user(username='cliente', password='x')
+
+    def _request(self, user=None, **headers):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', headers=headers)
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_bucket_allows_a_burst_then_refuses(self):
+        self.assertEqual(throttling.parse_rate('3/min'), (3, 60))
+        for _ in range(3):
+            self.assertEqual(throttling.allow('menu', 'ip:1', '3/min'), (True, 0))
+
+        allowed, wait = throttling.allow('menu', 'ip:1', '3/min')
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 20, delta=1)
+        # Cada cliente e cada view têm o seu bucket
+        self.assertTrue(throttling.allow('menu', 'ip:2', '3/min')[0])
+        self.assertTrue(throttling.allow('cart', 'ip:1', '3/min')[0])
+
+    def test_client_key(self):
+        token, key = ApiToken.create_token(self.customer, 'telemóvel')
+
+        self.assertEqual(throttling.client_key(self._request(self.customer)), f'user:{self.customer.pk}')
+        self.assertEqual(throttling.client_key(self._request(Authorization=f'Bearer {key}')), f'token:{token.pk}')
+        # Tokens inventados caem no bucket do IP
+        self.assertEqual(throttling.client_key(self._request(Authorization='Bearer inventado')), 'ip:10.0.0.1')
+        self.assertEqual(throttling.client_key(self._request()), 'ip:10.0.0.1')
+
+    def test_slots(self):
+        first = throttling.acquire_slot('checkout', 1, 0)
+        self.assertIsNotNone(first)
+        self.assertIsNone(throttling.acquire_slot('checkout', 1, 0))
+
+        throttling.release_slot(first)
+        second = throttling.acquire_slot('checkout', 1, 0)
+
+        self.assertIsNotNone(second)
+        # Uma vaga expirada e reocupada por outro pedido não é libertada pelo antigo dono
+        throttling.release_slot(first)
+        self.assertIsNone(throttling.acquire_slot('checkout', 1, 0))
+
+    @override_settings(THROTTLE_RATES={'bar_app:menu': '2/min'})
+    def test_middleware_rejects_with_retry_after(self):
+        client = Client()
+        client.force_login(self.customer)
+
+        responses = [client.get(reverse('bar_app:menu')) for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertGreaterEqual(int(responses[2]['Retry-After']), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReceiptTests(TestCase):
+    """Recibos gerados uma vez, quando o pedido chega a um estado final"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('20.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(name='Sumo', category=category, price=Decimal('1.20'), stock=10)
+
+    def _pending_order(self):
+        order = Order(payment_method='card', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        return services.place_order(self.customer, {str(self.product.pk): 1}, order)[0]
+
+    def test_generated_once_for_final_orders(self):
+        pending = self._pending_order()
+        sale, _ = services.pos_sale(self.customer, [self.product.pk])
+
+        self.assertTrue(Job.objects.filter(task='generate_receipt', idempotency_key=f'receipt:{sale.pk}').exists())
+        self.assertEqual(receipts.generate_receipts([pending.pk, sale.pk]), 1)
+        self.assertEqual(receipts.generate_receipts([sale.pk]), 0)
+
+        sale.refresh_from_db()
+        self.assertIn(sale.order_number, sale.receipt.name)
+        with sale.receipt.open('rb') as receipt:
+            self.assertIn(sale.order_number.encode(), receipt.read())
+        self.assertFalse(Order.objects.get(pk=pending.pk).receipt)
+
+    def test_receipt_view(self):
+        pending = self._pending_order()
+        sale, _ = services.pos_sale(self.customer, [self.product.pk])
+        client = Client()
+        client.force_login(self.customer)
+
+        response = client.get(reverse('bar_app:order_receipt', args=[sale.pk]))
+        not_final = client.get(reverse('bar_app:order_receipt', args=[pending.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertIn(sale.order_number.encode(), b''.join(response.streaming_content))
+        self.assertTrue(Order.objects.get(pk=sale.pk).receipt)
+        self.assertRedirects(not_final, reverse('bar_app:order_detail', args=[pending.pk]), fetch_redirect_response=False)
+
+    def test_receipt_of_another_user_is_refused(self):
+        sale, _ = services.pos_sale(self.customer, [self.product.pk])
+        other = User.objects.create_user(username='outro', password='x')
+        client = Client()
+        client.force_login(other)
+
+        response = client.get(reverse('bar_app:order_receipt', args=[sale.pk]))
+
+        self.assertRedirects(response, reverse('bar_app:order_list'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.get(pk=sale.pk).receipt)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ApiFieldsTests(TestCase):
+    """`?fields=` na API: só os campos (e as colunas) pedidos"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='cliente', password='x', balance=Decimal('20.00'))
+        category = Category.objects.create(name='Bebidas')
+        self.product = Product.objects.create(
+            name='Sumo', category=category, price=Decimal('1.20'), stock=10, description='Laranja natural',
+        )
+        order = Order(payment_method='atm', scheduled_date=date.today(), scheduled_time=time(10, 30))
+        self.order, _ = services.place_order(self.customer, {str(self.product.pk): 2}, order)
+        _, key = ApiToken.create_token(self.customer, 'quiosque')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {key}')
+
+    def test_products_default_and_projected_fields(self):
+        default = self.client.get(reverse('bar_app:api_products'))
+        with CaptureQueriesContext(connection) as queries:
+            projected = self.client.get(reverse('bar_app:api_products'), {'fields': 'name,category,name'})
+
+        self.assertEqual(list(default.json()['products'][0]), ['id', 'name', 'price', 'stock', 'category_id'])
+        self.assertEqual(projected.json()['products'], [{'name': 'Sumo', 'category': 'Bebidas'}])
+        self.assertFalse(any('"description"' in query['sql'] for query in queries.captured_queries))
+        self.assertNotIn(b' ', default.content.replace(b'"Sumo"', b''))
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('bar_app:api_products'), {'fields': 'name,password'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['reason'], 'fields')
+        self.assertIn('password', response.json()['error'])
+
+    def test_orders_projection(self):
+        reference = PaymentReference.objects.get(order=self.order)
+
+        response = self.client.get(reverse('bar_app:api_orders'), {'fields': 'number,multibanco_reference'})
+
+        self.assertEqual(response.json()['orders'], [
+            {'number': self.order.order_number, 'multibanco_reference': reference.reference},
+        ])
+
+    def test_order_detail_items_only(self):
+        url = reverse('bar_app:api_order_detail', args=[self.order.pk])
+
+        items = self.client.get(url, {'fields': 'items'}).json()
+        detail = self.client.get(url).json()
+
+        self.assertEqual(items, {'items': [{
+            'product_id': self.product.pk, 'name': 'Sumo', 'quantity': 2, 'unit_price': '1.20', 'subtotal': '2.40',
+        }]})
+        self.assertEqual(set(detail), {'id', 'number', 'status', 'total', 'scheduled_date', 'scheduled_time', 'items'})
+
+    def test_order_of_another_user_is_not_found(self):
+        other = User.objects.create_user(username='outro', password='x')
+        _, key = ApiToken.create_token(other, 'quiosque')
+
+        response = Client(HTTP_AUTHORIZATION=f'Bearer {key}').get(
+            reverse('bar_app:api_order_detail', args=[self.order.pk]), {'fields': 'number'},
+        )
+
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,101 @@
+"""
+Limitação de pedidos guardada na cache do Django (usada pelo ThrottleMiddleware)
+
+- Token bucket por cliente (utilizador, token da API ou IP) e por view, com as taxas de
+  THROTTLE_RATES ({nome da URL: 'N/período'}). O bucket enche continuamente: rajadas curtas
+  até N pedidos são aceites, um ciclo de reloads não.
+- Limite global de checkouts em simultâneo (CHECKOUT_MAX_CONCURRENT): cada checkout ocupa
+  uma de N vagas (chaves criadas com cache.add, atómico). Sem vaga, o pedido espera até
+  CHECKOUT_QUEUE_TIMEOUT segundos e depois é recusado. As vagas expiram sozinhas, por isso
+  um processo que morra a meio não as deixa presas.
+
+Com vários processos os limites só são globais se a cache for partilhada (p.ex. Redis).
+O token bucket é ler-e-escrever na cache (sem lock): sob concorrência pode deixar passar
+um ou outro pedido a mais, o que é aceitável para este fim.
+"""
+import random
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .models import ApiToken
+
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600}
+
+# Vagas de checkout expiram ao fim disto (segundos), mesmo que não sejam libertadas
+SLOT_TIMEOUT = 30
+QUEUE_POLL_INTERVAL = 0.05
+
+
+def parse_rate(rate):
+    """'30/min' -> (30, 60)"""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def client_key(request):
+    """
+    Identifica o cliente: utilizador da sessão, token da API válido ou IP.
+    Um token só conta depois de validado: com tokens inventados o cliente cai no bucket do IP.
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        token_id = (
+            ApiToken.objects
+            .filter(key_hash=ApiToken.hash_key(authorization[7:].strip()), is_active=True)
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if token_id is not None:
+            return f'token:{token_id}'
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
+
+
+def allow(scope, client, rate):
+    """
+    Consome um token do bucket de `client` em `scope`.
+    Devolve (aceite, segundos até haver um token).
+    """
+    capacity, period = parse_rate(rate)
+    refill = capacity / period
+    key = f'throttle:{scope}:{client}'
+    now = time.time()
+
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * refill)
+    if tokens < 1:
+        cache.set(key, (tokens, now), period)
+        return False, (1 - tokens) / refill
+    cache.set(key, (tokens - 1, now), period)
+    return True, 0
+
+
+def acquire_slot(scope, limit, timeout):
+    """
+    Ocupa uma das `limit` vagas de `scope`, esperando até `timeout` segundos.
+    Devolve (chave, marcador) para passar a release_slot, ou None.
+    """
+    marker = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while True:
+        for i in range(limit):
+            key = f'throttle:slot:{scope}:{i}'
+            if cache.add(key, marker, SLOT_TIMEOUT):
+                return key, marker
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(QUEUE_POLL_INTERVAL * random.uniform(0.5, 1.5))
+
+
+def release_slot(slot):
+    """
+    Liberta a vaga só se ainda for nossa: depois de SLOT_TIMEOUT a vaga expira e pode já
+    pertencer a outro pedido. (Ler e apagar não é atómico; a janela é de microssegundos.)
+    """
+    key, marker = slot
+    if cache.get(key) == marker:
+        cache.delete(key)
@@ -3,7 +3,7 @@ URLs da aplicação bar
 """
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 app_name = 'bar_app'
 
@@ -31,6 +31,7 @@ urlpatterns = [
     path('orders/', views.order_list, name='order_list'),
     path('order/<int:pk>/', views.order_detail, name='order_detail'),
     path('order/<int:pk>/cancel/', views.cancel_order, name='cancel_order'),
+    path('order/<int:pk>/receipt/', views.order_receipt, name='order_receipt'),
     
     # Perfil e saldo
     path('profile/', views.profile, name='profile'),
@@ -43,4 +44,24 @@ urlpatterns = [
     path('dashboard/orders/', views.manage_orders, name='manage_orders'),
     path('dashboard/orders/<int:pk>/update-status/', views.update_order_status, name='update_order_status'),
     path('dashboard/stock/', views.manage_stock, name='manage_stock'),
+    path('dashboard/pick-list/', views.pick_list, name='pick_list'),
+    path('dashboard/pick-list/data/', views.pick_list_json, name='pick_list_json'),
+    path('dashboard/pos/', views.pos, name='pos'),
+    path('dashboard/reports/', views.sales_report, name='sales_report'),
+    path('dashboard/reports/data/', views.sales_report_json, name='sales_report_json'),
+    path('dashboard/profiles/', views.profile_list, name='profile_list'),
+    path('dashboard/profiles/stacks/', views.profile_stacks, name='profile_stacks'),
+    
+    # API JSON (v1)
+    path('api/v1/products/', api.products, name='api_products'),
+    path('api/v1/cart/', api.cart, name='api_cart'),
+    path('api/v1/checkout/', api.checkout, name='api_checkout'),
+    path('api/v1/orders/', api.orders, name='api_orders'),
+    path('api/v1/orders/<int:pk>/', api.order_detail, name='api_order_detail'),
+    path('api/v1/balance/', api.balance, name='api_balance'),
+    path('api/v1/pos/customers/', api.pos_customers, name='api_pos_customers'),
+    path('api/v1/pos/sales/', api.pos_sale, name='api_pos_sale'),
+    
+    # Métricas (Prometheus)
+    path('metrics', views.metrics_view, name='metrics'),
 ]
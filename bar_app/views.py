@@ -1,23 +1,27 @@
 """
 Views da aplicação bar escolar
 """
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.utils.dateparse import parse_date
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.db.models import Q, Sum, Count, F 
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.contrib.auth import logout as auth_logout, authenticate, login as auth_login
-from decimal import Decimal
+import secrets
 from django.db import transaction
-from django.db.utils import IntegrityError 
-from django.core.exceptions import ObjectDoesNotExist 
 
 from .models import (
-    User, Product, Category, Order, OrderItem,
-    Transaction, StockMovement
+    User, Product, Category, Order,
+    Transaction, StockMovement, PaymentReference
 )
 from .forms import UserRegistrationForm, OrderForm, TopUpForm, ProductForm
+from .paginators import EstimatedCountPaginator
+from .conditional import conditional_page, catalog_state, order_list_state, order_detail_state, pick_list_state
+from . import alerts, history, idempotency, jobs, metrics, multibanco, picklists, profiling, receipts, reports, services
 
 
 def home(request):
@@ -106,12 +110,13 @@ def register(request):
     return render(request, 'bar_app/register.html')
 
 
+@conditional_page(catalog_state)
 def menu(request):
     """Listagem de produtos (menu)"""
     category_id = request.GET.get('category')
     search = request.GET.get('search')
     
-    products = Product.objects.filter(is_available=True)
+    products = Product.objects.for_listing().filter(is_available=True)
     
     if category_id:
         products = products.filter(category_id=category_id)
@@ -132,6 +137,7 @@ def menu(request):
     return render(request, 'bar_app/menu.html', context)
 
 
+@conditional_page(catalog_state)
 def product_detail(request, pk):
     """Detalhe de um produto"""
     product = get_object_or_404(Product, pk=pk)
@@ -150,25 +156,7 @@ def product_detail(request, pk):
 @login_required
 def cart(request):
     """Carrinho de compras"""
-    cart_items = request.session.get('cart', {})
-    
-    items = []
-    total = Decimal('0.00')
-    
-    for product_id, quantity in cart_items.items():
-        try:
-            product = Product.objects.get(pk=product_id)
-            subtotal = product.price * quantity
-            total += subtotal
-            items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal,
-                # Unit price is needed for checkout logic below
-                'unit_price': product.price 
-            })
-        except Product.DoesNotExist:
-            pass 
+    items, total = services.cart_lines(request.session.get('cart', {}))
     
     context = {
         'items': items,
@@ -182,25 +170,13 @@ def add_to_cart(request, product_id):
     """Adicionar produto ao carrinho"""
     product = get_object_or_404(Product, pk=product_id)
     
-    if not product.is_in_stock():
-        messages.error(request, 'Produto sem stock.')
+    try:
+        request.session['cart'] = services.add_to_cart(request.session.get('cart', {}), product)
+    except services.ServiceError as e:
+        messages.error(request, e.message)
         return redirect('bar_app:menu')
     
-    cart = request.session.get('cart', {})
-    product_id_str = str(product_id)
-    
-    if product_id_str in cart:
-        if product.stock < cart[product_id_str] + 1:
-            messages.error(request, f'Stock insuficiente para adicionar mais {product.name}. Stock atual: {product.stock}.')
-            return redirect('bar_app:menu')
-            
-        cart[product_id_str] += 1
-    else:
-        cart[product_id_str] = 1
-    
-    request.session['cart'] = cart
     messages.success(request, f'{product.name} adicionado ao carrinho.')
-    
     return redirect('bar_app:menu')
 
 
@@ -208,11 +184,9 @@ def add_to_cart(request, product_id):
 def remove_from_cart(request, product_id):
     """Remover produto do carrinho"""
     cart = request.session.get('cart', {})
-    product_id_str = str(product_id)
     
-    if product_id_str in cart:
-        del cart[product_id_str]
-        request.session['cart'] = cart
+    if str(product_id) in cart:
+        request.session['cart'] = services.update_cart(cart, {product_id: 0})
         messages.success(request, 'Produto removido do carrinho.')
     
     return redirect('bar_app:cart')
@@ -227,186 +201,64 @@ def update_cart(request, product_id):
         except ValueError:
             messages.error(request, 'Quantidade inválida.')
             return redirect('bar_app:cart')
-            
-        cart = request.session.get('cart', {})
-        product_id_str = str(product_id)
         
-        if quantity > 0:
-            product = get_object_or_404(Product, pk=product_id)
-            if product.stock < quantity:
-                messages.error(request, f'Stock insuficiente para {product.name}. Stock atual: {product.stock}.')
-                return redirect('bar_app:cart')
-            
-            cart[product_id_str] = quantity
-        else:
-            del cart[product_id_str]
-        
-        request.session['cart'] = cart
+        try:
+            request.session['cart'] = services.update_cart(
+                request.session.get('cart', {}), {product_id: max(quantity, 0)},
+            )
+        except services.ServiceError as e:
+            messages.error(request, e.message)
     
     return redirect('bar_app:cart')
 
 
 @login_required
 def checkout(request):
-    """Finalizar pedido com tratamento de retry para IntegrityError"""
+    """Finalizar pedido (a criação, com retry em colisões do nº de pedido, está em services.place_order)"""
     cart = request.session.get('cart', {})
     
+    # Submissão repetida (duplo clique, reenvio): devolver o pedido já criado com este token.
+    # Tem de ser verificado antes do carrinho, que a primeira submissão já esvaziou.
+    token = request.POST.get('checkout_token', '') if request.method == 'POST' else ''
+    idempotency_key = idempotency.token_key(request.user.pk, token) if token else None
+    existing = services.replayed_order(request.user.pk, idempotency_key)
+    if existing is not None:
+        messages.info(request, 'Este pedido já tinha sido registado.')
+        return redirect('bar_app:order_detail', pk=existing.pk)
+    
     if not cart:
         messages.warning(request, 'O seu carrinho está vazio.')
         return redirect('bar_app:menu')
     
-    # ----------------------------------------------------
-    # LÓGICA POST (Criação do Pedido)
-    # ----------------------------------------------------
     if request.method == 'POST':
         form = OrderForm(request.POST)
         
         if form.is_valid():
+            if idempotency.token_key(request.user.pk, token, max_age=idempotency.TOKEN_TTL) is None:
+                messages.error(request, 'O formulário expirou. Confirme novamente o pedido.')
+                return redirect('bar_app:checkout')
             
-            max_retries = 3
-            final_order = None # Variável para guardar o pedido salvo com sucesso
-
-            # Loop para retry em caso de IntegrityError (race condition)
-            for attempt in range(max_retries):
-                
-                # CORREÇÃO: Usamos um bloco atómico para ISOLAR cada tentativa
-                # Se ocorrer um erro (como IntegrityError), apenas este bloco é quebrado/rolado para trás, 
-                # permitindo que o loop continue e comece uma nova transação.
-                try:
-                    with transaction.atomic():
-                        
-                        # Criar uma nova instância de Order em cada tentativa
-                        order = form.save(commit=False)
-                        order.user = request.user
-                        
-                        # Se for uma tentativa de retry (attempt > 0), 
-                        # limpamos o PK e order_number para forçar a criação de um novo valor único.
-                        if attempt > 0:
-                            order.pk = None 
-                            order.order_number = None 
-
-                        # Primeira operação de escrita no DB. 
-                        # Se falhar por 'UNIQUE constraint', a exceção é levantada e o bloco atomic rola para trás.
-                        order.save() 
-                        
-                        total_amount = Decimal('0.00')
-
-                        # ----------------------------------------------------------------
-                        # Lógica de criação de OrderItems, atualização de Stock e Transações
-                        # ----------------------------------------------------------------
-                        for product_id, quantity in cart.items():
-                            try:
-                                product = Product.objects.get(pk=product_id)
-                            except ObjectDoesNotExist:
-                                messages.error(request, f'O produto com ID {product_id} não existe.')
-                                raise # Força o rollback
-                                
-                            quantity = int(quantity)
-
-                            if product.stock < quantity:
-                                messages.error(request, f'Stock insuficiente para {product.name}. Stock atual: {product.stock}.')
-                                raise # Força o rollback
-                            
-                            subtotal_value = product.price * quantity 
-                            total_amount += subtotal_value
-                
-                            OrderItem.objects.create(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                unit_price=product.price,
-                                subtotal=subtotal_value,
-                            )
-                            
-                            StockMovement.objects.create(
-                                product=product,
-                                movement_type='out',
-                                quantity=quantity,
-                                reason=f'Pedido {order.order_number}',
-                                order=order,
-                                created_by=request.user
-                            )
-                            
-                            # Atualizar stock no DB
-                            product.stock -= quantity
-                            product.save()
-
-                        # Finalizar Order principal (guardar o total)
-                        order.total_amount = total_amount
-                        order.save()
-                        
-                        # Processar pagamento
-                        if order.payment_method == 'card':
-                            if request.user.balance < order.total_amount:
-                                messages.error(request, 'Saldo insuficiente. Por favor, carregue o seu saldo.')
-                                raise # Força o rollback
-                            
-                            # Débito do saldo
-                            request.user.balance -= order.total_amount
-                            request.user.save()
-                            
-                            Transaction.objects.create(
-                                user=request.user,
-                                transaction_type='payment',
-                                amount=order.total_amount,
-                                order=order,
-                                description=f'Pagamento pedido {order.order_number}'
-                            )
-                        
-                        # Se chegar aqui, a transação foi commitada com sucesso
-                        final_order = order 
-                        break # Sai do loop de retry
-
-                except IntegrityError as e:
-                    # Captura o erro UNIQUE constraint
-                    if 'UNIQUE constraint failed: bar_app_order.order_number' in str(e) and attempt < max_retries - 1:
-                        # O bloco atómico rolou para trás. Tenta novamente (próxima iteração do loop)
-                        continue 
-                    else:
-                        # Se for outro IntegrityError ou última tentativa, falha.
-                        messages.error(request, 'Erro grave e irrecuperável ao finalizar o pedido. Tente novamente mais tarde.')
-                        return redirect('bar_app:cart') 
-
-                except Exception:
-                    # Captura exceções levantadas dentro do bloco atómico (e.g., stock, saldo insuficiente, produto não encontrado)
-                    # O bloco atómico já fez o rollback (não há TransactionManagementError)
-                    return redirect('bar_app:cart') # Redireciona com as mensagens de erro já setadas
-            
+            try:
+                order, created = services.place_order(request.user, cart, form.save(commit=False), idempotency_key)
+            except services.ServiceError as e:
+                messages.error(request, e.message)
+                return redirect('bar_app:cart')
             
-            if final_order:
-                # Limpar carrinho e redirecionar
-                request.session['cart'] = {}
-                messages.success(request, f'Pedido {final_order.order_number} criado com sucesso!')
-                return redirect('bar_app:order_detail', pk=final_order.pk)
+            if not created:
+                messages.info(request, 'Este pedido já tinha sido registado.')
+                return redirect('bar_app:order_detail', pk=order.pk)
             
-            # Se saiu do loop sem sucesso (todas as retries falharam)
-            messages.error(request, 'Não foi possível finalizar o pedido após várias tentativas. Tente novamente.')
-            return redirect('bar_app:cart')
-
-        else:
-            messages.error(request, 'Erro ao processar o pedido. Verifique os dados.')
-            
-    # ----------------------------------------------------
-    # LÓGICA GET (Renderizar a página de Checkout)
-    # ----------------------------------------------------
+            # Limpar carrinho e redirecionar
+            request.session['cart'] = {}
+            messages.success(request, f'Pedido {order.order_number} criado com sucesso!')
+            return redirect('bar_app:order_detail', pk=order.pk)
+        
+        metrics.inc('bar_checkout_failures_total', reason='invalid_form')
+        messages.error(request, 'Erro ao processar o pedido. Verifique os dados.')
     else:
-        form = OrderForm()
+        form = OrderForm(initial={'checkout_token': idempotency.issue_token(request.user.pk)})
     
-    # Calcular total do carrinho para o contexto
-    items = []
-    total = Decimal('0.00')
-    for product_id, quantity in cart.items():
-        try:
-            product = Product.objects.get(pk=product_id)
-            subtotal = product.price * quantity
-            total += subtotal
-            items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal,
-            })
-        except Product.DoesNotExist:
-            continue
+    items, total = services.cart_lines(cart)
     
     context = {
         'form': form,
@@ -417,9 +269,10 @@ def checkout(request):
 
 
 @login_required
+@conditional_page(order_list_state)
 def order_list(request):
     """Listar pedidos do utilizador"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.with_items().filter(user=request.user).order_by('-created_at')
     
     context = {
         'orders': orders,
@@ -428,9 +281,10 @@ def order_list(request):
 
 
 @login_required
+@conditional_page(order_detail_state)
 def order_detail(request, pk):
     """Detalhe de um pedido"""
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.for_detail(), pk=pk)
     
     # Verificar se o utilizador pode ver este pedido
     if order.user != request.user and not request.user.is_staff:
@@ -439,10 +293,36 @@ def order_detail(request, pk):
     
     context = {
         'order': order,
+        # Só os pedidos por Multibanco têm referência (uma query extra apenas para esses)
+        'payment_reference': PaymentReference.objects.filter(order=order).first() if order.payment_method == 'atm' else None,
     }
     return render(request, 'bar_app/order_detail.html', context)
 
 
+@login_required
+def order_receipt(request, pk):
+    """Recibo de um pedido final (gerado uma vez e servido com cache imutável)"""
+    order = get_object_or_404(Order.objects.only('id', 'user_id', 'status', 'order_number', 'receipt'), pk=pk)
+    
+    if order.user_id != request.user.pk and not request.user.is_staff:
+        messages.error(request, 'Não tem permissão para ver este pedido.')
+        return redirect('bar_app:order_list')
+    
+    if not receipts.is_final(order):
+        messages.warning(request, 'O recibo fica disponível quando o pedido for entregue ou cancelado.')
+        return redirect('bar_app:order_detail', pk=pk)
+    
+    if not order.receipt:
+        # O worker ainda não o gerou: gerar agora
+        order = Order.objects.for_detail().get(pk=pk)
+        receipts.generate_receipt(order)
+    
+    response = FileResponse(order.receipt.open('rb'), content_type='text/html; charset=utf-8')
+    # O recibo nunca muda depois de gerado
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
 @login_required
 @transaction.atomic
 def cancel_order(request, pk):
@@ -450,35 +330,11 @@ def cancel_order(request, pk):
     order = get_object_or_404(Order, pk=pk, user=request.user)
     
     if order.can_be_cancelled():
-        order.status = 'cancelled'
-        order.save()
-        
-        # Devolver stock
-        for item in order.orderitem_set.all():
-            StockMovement.objects.create(
-                product=item.product,
-                movement_type='in',
-                quantity=item.quantity,
-                reason=f'Cancelamento pedido {order.order_number}',
-                created_by=request.user
-            )
-            
-            # Atualizar o stock do produto 
-            item.product.stock += item.quantity
-            item.product.save()
-        
-        # Reembolsar se já foi pago
-        if order.payment_method == 'card':
-            order.user.balance += order.total_amount 
-            order.user.save()
-            
-            Transaction.objects.create(
-                user=request.user,
-                transaction_type='topup',
-                amount=order.total_amount,
-                order=order,
-                description=f'Reembolso pedido {order.order_number}'
-            )
+        try:
+            services.cancel_order(order, request.user)
+        except services.ServiceError as e:
+            messages.error(request, e.message)
+            return redirect('bar_app:order_detail', pk=pk)
         
         messages.success(request, 'Pedido cancelado com sucesso.')
     else:
@@ -509,17 +365,25 @@ def topup(request):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             
-            # Adicionar saldo ao utilizador
-            request.user.balance += amount
-            request.user.save()
+            if form.cleaned_data['method'] == 'atm':
+                # O saldo só é creditado quando o pagamento aparecer no extrato (import_multibanco)
+                reference, = multibanco.issue([PaymentReference(user=request.user, purpose='topup', amount=amount)])
+                messages.info(
+                    request,
+                    f'Pague €{amount} no multibanco: entidade {reference.entity}, referência {reference.formatted_reference}. '
+                    'O saldo é carregado quando o pagamento for confirmado.'
+                )
+                return redirect('bar_app:topup')
             
-            # Criar a transação
+            # Criar a transação (Transaction.save adiciona o valor ao saldo)
             Transaction.objects.create(
                 user=request.user,
                 transaction_type='topup',
                 amount=amount,
                 description='Carregamento de saldo'
             )
+            metrics.inc('bar_topups_total')
+            metrics.inc('bar_topup_amount_euros_total', float(amount))
             
             messages.success(request, f'Saldo carregado com sucesso! Novo saldo: €{request.user.balance}')
             return redirect('bar_app:profile')
@@ -528,17 +392,28 @@ def topup(request):
     
     context = {
         'form': form,
+        'pending_references': PaymentReference.objects.filter(
+            user=request.user, status='pending', expires_at__gt=timezone.now(),
+        )[:5],
     }
     return render(request, 'bar_app/topup.html', context)
 
 
 @login_required
 def transaction_list(request):
-    """Histórico de transações"""
-    transactions = Transaction.objects.filter(user=request.user).order_by('-created_at')
+    """Histórico de transações (ano letivo corrente ou um ano arquivado)"""
+    archived_years = history.archived_years(request.user)
+    selected_year = request.GET.get('year')
+    if selected_year not in archived_years:
+        selected_year = None
+    
+    transactions = history.user_transactions(request.user, selected_year)
     
     context = {
         'transactions': transactions,
+        'archived_years': archived_years,
+        'selected_year': selected_year,
+        'current_year': history.current_school_year(),
     }
     return render(request, 'bar_app/transaction_list.html', context)
 
@@ -557,10 +432,13 @@ def dashboard(request):
     # Estatísticas
     total_orders_today = Order.objects.filter(scheduled_date=today).count()
     pending_orders = Order.objects.filter(status__in=['pending', 'confirmed']).count()
-    low_stock_products = Product.objects.filter(stock__lte=F('min_stock')).count()
+    low_stock_products = Product.objects.needing_restock().count()
     
     # Pedidos recentes
-    recent_orders = Order.objects.all().order_by('-created_at')[:10]
+    recent_orders = Order.objects.for_listing().order_by('-created_at')[:10]
+    
+    # Alertas de stock baixo
+    restock_alerts = alerts.feed()
     
     # Produtos mais vendidos
     top_products = Product.objects.annotate(
@@ -572,6 +450,7 @@ def dashboard(request):
         'pending_orders': pending_orders,
         'low_stock_products': low_stock_products,
         'recent_orders': recent_orders,
+        'restock_alerts': restock_alerts,
         'top_products': top_products,
     }
     return render(request, 'bar_app/dashboard/dashboard.html', context)
@@ -581,7 +460,7 @@ def dashboard(request):
 @user_passes_test(is_staff_user)
 def manage_products(request):
     """Gestão de produtos"""
-    products = Product.objects.all().order_by('name')
+    products = Product.objects.for_listing().order_by('name')
     
     context = {
         'products': products,
@@ -589,20 +468,28 @@ def manage_products(request):
     return render(request, 'bar_app/dashboard/products.html', context)
 
 
+MANAGE_ORDERS_PAGE_SIZE = 50
+
+
 @login_required
 @user_passes_test(is_staff_user)
 def manage_orders(request):
     """Gestão de pedidos"""
     status_filter = request.GET.get('status')
     
-    orders = Order.objects.all().order_by('-created_at')
+    orders = Order.objects.for_listing().order_by('-created_at')
     
     if status_filter:
         orders = orders.filter(status=status_filter)
     
+    # Paginado: com dezenas de milhares de pedidos a página inteira levava segundos a gerar
+    page = EstimatedCountPaginator(orders, MANAGE_ORDERS_PAGE_SIZE).get_page(request.GET.get('page'))
+    
     context = {
-        'orders': orders,
+        'orders': page.object_list,
+        'page_obj': page,
         'status_filter': status_filter,
+        'status_transitions': Order.TRANSITIONS,
     }
     return render(request, 'bar_app/dashboard/orders.html', context)
 
@@ -610,17 +497,36 @@ def manage_orders(request):
 @login_required
 @user_passes_test(is_staff_user)
 def update_order_status(request, pk):
-    """Atualizar status de um pedido"""
+    """Atualizar o estado de um pedido (só transições permitidas, sem sobrepor alterações de outra pessoa)"""
     order = get_object_or_404(Order, pk=pk)
     
     if request.method == 'POST':
+        # Estado e versão que o funcionário viu ao abrir o formulário
+        seen_status = request.POST.get('current_status')
+        try:
+            seen_version = int(request.POST.get('version', ''))
+        except ValueError:
+            seen_version = None
+        
+        if seen_status is None or seen_version is None:
+            messages.error(request, 'Formulário desatualizado. Recarregue a página e tente novamente.')
+            return redirect('bar_app:manage_orders')
+        
+        order.status, order.version = seen_status, seen_version
         new_status = request.POST.get('status')
-        if new_status in dict(Order.STATUS_CHOICES):
-            order.status = new_status
-            order.save()
-            messages.success(request, f'Pedido {order.order_number} atualizado para {order.get_status_display()}.')
-        else:
-            messages.error(request, 'Status inválido.')
+        try:
+            if new_status == 'cancelled':
+                # Stock, reembolso e recibo como no cancelamento pelo cliente
+                services.cancel_order(order, request.user)
+            else:
+                services.transition_order(order, new_status)
+        except services.ServiceError as e:
+            messages.error(request, e.message)
+            return redirect('bar_app:manage_orders')
+        
+        if new_status != 'cancelled' and receipts.is_final(order):
+            jobs.enqueue('generate_receipt', {'order_id': order.pk}, idempotency_key=f'receipt:{order.pk}')
+        messages.success(request, f'Pedido {order.order_number} atualizado para {order.get_status_display()}.')
     
     return redirect('bar_app:manage_orders')
 
@@ -629,9 +535,9 @@ def update_order_status(request, pk):
 @user_passes_test(is_staff_user)
 def manage_stock(request):
     """Gestão de stock"""
-    low_stock_products = Product.objects.filter(stock__lt=10).order_by('stock')
+    low_stock_products = Product.objects.needing_restock().order_by('stock')
     all_products = Product.objects.all().order_by('name')
-    recent_movements = StockMovement.objects.all().order_by('-created_at')[:20]
+    recent_movements = StockMovement.objects.for_listing().order_by('-created_at')[:20]
     
     context = {
         'products': all_products,
@@ -641,6 +547,159 @@ def manage_stock(request):
     return render(request, 'bar_app/dashboard/stock.html', context)
 
 
+@login_required
+@user_passes_test(is_staff_user)
+@conditional_page(pick_list_state)
+def pick_list(request):
+    """Lista de preparação: quantidades por produto para uma janela de entrega (imprimível)"""
+    window = picklists.parse_window(request.GET)
+    rows = picklists.pick_list(window)
+    
+    context = {
+        'window': window,
+        'rows': rows,
+        'total_units': sum(row.quantity for row in rows),
+        'status_choices': Order.STATUS_CHOICES,
+    }
+    return render(request, 'bar_app/dashboard/pick_list.html', context)
+
+
+@login_required
+@user_passes_test(is_staff_user)
+@conditional_page(pick_list_state)
+def pick_list_json(request):
+    """Lista de preparação em JSON; com If-None-Match responde 304 enquanto nada mudar"""
+    window = picklists.parse_window(request.GET)
+    rows = picklists.pick_list(window)
+    return JsonResponse({
+        'date': window.day,
+        'start': window.start,
+        'end': window.end,
+        'statuses': window.statuses,
+        'total_units': sum(row.quantity for row in rows),
+        'items': [row._asdict() for row in rows],
+    })
+
+
+@login_required
+@user_passes_test(is_staff_user)
+def pos(request):
+    """Venda ao balcão: o ecrã envia cada venda para a API (api/v1/pos/sales/) num único pedido"""
+    products = Product.objects.for_listing().filter(is_available=True).order_by('category__name', 'name')
+    
+    context = {
+        'products': products,
+    }
+    return render(request, 'bar_app/dashboard/pos.html', context)
+
+
+def _report_range(request):
+    """Lê o intervalo de datas (start/end) dos parâmetros GET"""
+    default_start, default_end = reports.default_range()
+    start = parse_date(request.GET.get('start') or '') or default_start
+    end = parse_date(request.GET.get('end') or '') or default_end
+    if start > end:
+        start, end = end, start
+    return start, end
+
+
+@login_required
+@user_passes_test(is_staff_user)
+def sales_report(request):
+    """Relatórios de vendas (tabelas HTML)"""
+    start, end = _report_range(request)
+    
+    sections = [
+        {
+            'dimension': dimension,
+            'title': title,
+            'rows': reports.sales_report(start, end, dimension),
+        }
+        for dimension, title in reports.DIMENSION_LABELS.items()
+    ]
+    
+    context = {
+        'start': start,
+        'end': end,
+        'sections': sections,
+    }
+    return render(request, 'bar_app/dashboard/reports.html', context)
+
+
+@login_required
+@user_passes_test(is_staff_user)
+def sales_report_json(request):
+    """Relatórios de vendas em JSON (para gráficos)"""
+    start, end = _report_range(request)
+    dimension = request.GET.get('dimension', 'product')
+    
+    if dimension not in reports.DIMENSIONS:
+        return JsonResponse({'error': f'Dimensão inválida: {dimension}'}, status=400)
+    
+    rows = reports.sales_report(start, end, dimension)
+    return JsonResponse({
+        'start': start,
+        'end': end,
+        'dimension': dimension,
+        **reports.report_as_chart(rows),
+    })
+
+
+@login_required
+@user_passes_test(is_staff_user)
+def profile_list(request):
+    """Perfis de pedidos guardados pelo ProfilingMiddleware"""
+    url_name = request.GET.get('url_name')
+    profiles = profiling.list_profiles()
+    url_names = sorted({profile['url_name'] for profile in profiles})
+    
+    if url_name:
+        profiles = [profile for profile in profiles if profile['url_name'] == url_name]
+    
+    context = {
+        'profiles': profiles,
+        'url_names': url_names,
+        'url_name': url_name,
+    }
+    return render(request, 'bar_app/dashboard/profiles.html', context)
+
+
+@login_required
+@user_passes_test(is_staff_user)
+def profile_stacks(request):
+    """Pilhas em formato collapsed de um perfil (?name=) ou de todos os perfis de uma URL (?url_name=)"""
+    name = request.GET.get('name')
+    if name:
+        try:
+            stacks = profiling.load_stacks(name)
+        except (OSError, ValueError):
+            raise Http404('Perfil não encontrado')
+        filename = name
+    else:
+        url_name = request.GET.get('url_name', '')
+        stacks = profiling.merged_stacks(url_name)
+        filename = url_name.replace(':', '.') or 'sem-nome'
+    
+    response = HttpResponse(profiling.collapsed(stacks), content_type='text/plain; charset=utf-8')
+    if 'download' in request.GET:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.collapsed.txt"'
+    return response
+
+
+def metrics_view(request):
+    """
+    Métricas no formato Prometheus. Com METRICS_TOKEN exige esse token (sem acesso à base de
+    dados nem à sessão); sem token configurado só a equipa autenticada as pode ver.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=403)
+    elif not (request.user.is_authenticated and is_staff_user(request.user)):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def logout_view(request):
     """Logout do utilizador"""
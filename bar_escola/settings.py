@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bar_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,6 +38,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'bar_app.middleware.AdminAccessMiddleware',
+    'bar_app.middleware.ThrottleMiddleware',
+    'bar_app.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'bar_escola.urls'
@@ -52,6 +55,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'bar_app.context_processors.user_summary',
             ],
         },
     },
@@ -67,6 +71,30 @@ DATABASES = {
     }
 }
 
+# Cache (ver bar_app/caching.py), escolhida por CACHE_BACKEND:
+# - locmem: memória de cada processo (desenvolvimento, um só worker)
+# - file: diretório partilhado pelos processos da mesma máquina (incr/add não são atómicos)
+# - redis: qualquer servidor com o protocolo Redis (Redis, Valkey, ou um servidor local de
+#   testes); CACHE_LOCATION é o URL, p.ex. redis://127.0.0.1:6379/1. Requer o pacote redis.
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'bar-escola'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+if CACHE_BACKEND not in _CACHE_BACKENDS:
+    raise ValueError(f'CACHE_BACKEND inválido: {CACHE_BACKEND!r} (opções: {", ".join(_CACHE_BACKENDS)})')
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=_CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'KEY_PREFIX': config('CACHE_KEY_PREFIX', default='bar'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        # Ignorado pelo Redis (tem a sua própria política de memória)
+        'OPTIONS': {} if CACHE_BACKEND == 'redis' else {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)},
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -96,3 +124,47 @@ AUTH_USER_MODEL = 'bar_app.User'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Profiling por amostragem (ver bar_app/profiling.py)
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)  # 0.01 = 1% dos pedidos
+PROFILING_INTERVAL_MS = config('PROFILING_INTERVAL_MS', default=5, cast=int)
+PROFILING_DIR = config('PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILING_MAX_FILES = config('PROFILING_MAX_FILES', default=200, cast=int)
+
+# Métricas Prometheus em /metrics (ver bar_app/metrics.py)
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # se definido, exige "Authorization: Bearer <token>"; senão só a equipa
+METRICS_DIR = config('METRICS_DIR', default='')  # diretório partilhado pelos workers (vazio = só este processo)
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=int)
+
+# Limitação de pedidos (ver bar_app/throttling.py): taxa por cliente e por nome de URL
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_RATES = {
+    'bar_app:add_to_cart': '30/min',
+    'bar_app:update_cart': '30/min',
+    'bar_app:remove_from_cart': '30/min',
+    'bar_app:checkout': '10/min',
+    'bar_app:api_cart': '60/min',
+    'bar_app:api_checkout': '10/min',
+}
+# Checkouts em simultâneo em todo o servidor (0 = sem limite); sem vaga, espera até CHECKOUT_QUEUE_TIMEOUT s
+CHECKOUT_CONCURRENCY_VIEWS = ['bar_app:checkout', 'bar_app:api_checkout', 'bar_app:api_pos_sale']
+CHECKOUT_MAX_CONCURRENT = config('CHECKOUT_MAX_CONCURRENT', default=4, cast=int)
+CHECKOUT_QUEUE_TIMEOUT = config('CHECKOUT_QUEUE_TIMEOUT', default=2.0, cast=float)
+
+# Pagamentos Multibanco (ver bar_app/multibanco.py): entidade atribuída pelo processador de pagamentos
+MULTIBANCO_ENTITY = config('MULTIBANCO_ENTITY', default='12345')
+MULTIBANCO_REFERENCE_DAYS = config('MULTIBANCO_REFERENCE_DAYS', default=3, cast=int)
+
+# Email (em desenvolvimento, um servidor SMTP local: python -m aiosmtpd -n -l localhost:1025)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=1025, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='bar@escola.pt')
+
+# Destinatários extra do resumo de stock baixo (além dos utilizadores staff com email)
+RESTOCK_ALERT_RECIPIENTS = [email for email in config('RESTOCK_ALERT_RECIPIENTS', default='').split(',') if email]
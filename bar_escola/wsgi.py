@@ -9,3 +9,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bar_escola.settings')
 
 application = get_wsgi_application()
+
+# Índice de clientes do balcão carregado já no arranque, e não no primeiro pedido do POS
+from bar_app import identity  # noqa: E402
+
+identity.warm()